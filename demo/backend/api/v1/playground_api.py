@@ -4,6 +4,7 @@ PlayGround API 路由
 """
 
 import uuid
+from contextlib import aclosing
 from typing import TYPE_CHECKING
 
 from fastapi import APIRouter, Depends, Header, Request
@@ -16,9 +17,15 @@ if TYPE_CHECKING:
     from backend.services.playground_service import PlayGroundService
 
 from backend.api.deps import get_playground_service
-from backend.models.markdown_flow import MarkdownFlowInfoRequest, PlaygroundRunRequest
-from backend.models.document import SaveDocumentRequest
+from backend.config.settings import settings
+from backend.models.markdown_flow import (
+    MarkdownFlowInfoRequest,
+    PlaygroundDocumentRunRequest,
+    PlaygroundRunRequest,
+)
+from backend.models.document import RegisterDocumentRequest, SaveDocumentRequest
 from backend.utils.response import res
+from backend.utils.sse import ERROR_TEXT_END_FRAME, encode_error_frame
 
 playground_api_router = APIRouter(prefix="/playground", tags=["Playground Api"])
 
@@ -35,7 +42,8 @@ async def generate_with_llm(
     使用 LLM 生成内容（流式输出，Server-Sent Events）
 
     **请求参数 (PlaygroundRunRequest)：**
-    - **content** (string, 必填): Markdown-Flow 原文内容
+    - **content** (string, 可选): Markdown-Flow 原文内容，与 doc_id 二选一
+    - **doc_id** (string, 可选): 通过 /playground/documents 登记的文档ID，提供时使用登记的原文和提示词
     - **block_index** (integer, 必填): 要处理的块索引（从0开始）
     - **context** (array<ChatMessage>, 可选): 上下文消息列表
     - **variables** (object, 可选): 变量映射字典
@@ -51,7 +59,8 @@ async def generate_with_llm(
 
     **Header 参数：**
     - **Session-Id** (string, 可选): 会话ID
-    - **User-Id** (string, 可选): 用户ID
+    - **User-Id** (string, 可选): 用户ID，未提供时使用默认用户标识（default_user_id），
+      此时 LLM 调用的公平调度与每用户并发上限按会话计算
 
     **响应格式 (Server-Sent Events)：**
     - **Content-Type**: text/event-stream
@@ -96,11 +105,17 @@ async def generate_with_llm(
     - **内容块**: 使用LLM进行流式生成，逐步返回生成的文本片段
     - **交互块**:
       - 无 user_input: 返回渲染后的交互内容（一次性返回）
-      - 有 user_input: 仅提取变量，返回空内容
+      - 有 user_input: 仅提取变量，返回空内容；点击的按钮（含大小写、全角半角不同的输入）
+        在本地匹配并提取变量，只有需要判断的自由文本和无效输入才交给 LLM；
+        开启文本校验（interaction_text_validation_enabled）时，与此前回答相似的自由文本复用已有的校验结论
 
     **特殊处理：**
     - 自动转义换行符以保持SSE格式正确
     - 错误时提供详细错误信息和调试详情
+    - 开启预取（prefetch_enabled）且携带 Session-Id 时，内容块生成完毕后在后台预取后续内容块，
+      同一会话随后的相同请求直接回放预取结果
+    - 同时开启分支预取（branch_prefetch_enabled）时，交互块渲染后为热门按钮选项各预取一个分支，
+      收到该交互块的 user_input 时保留所选选项的分支
     """
 
     # 获取或生成 session_id 和 user_id
@@ -111,7 +126,7 @@ async def generate_with_llm(
     final_session_id = (
         session_id or header_session_id or f"playground-{uuid.uuid4().hex[:8]}"
     )
-    final_user_id = user_id or header_user_id or "playground-user"
+    final_user_id = user_id or header_user_id or settings.default_user_id
     trace_id = get_trace_id()
 
     async def event_generator():
@@ -120,55 +135,165 @@ async def generate_with_llm(
             final_output_language = "Simplified Chinese"
 
             # 简化的API层 - session追踪由服务层装饰器处理
-            for chunk in service.generate_with_llm(
-                content=playground_request.content,
-                block_index=playground_request.block_index,
-                context=playground_request.context,
-                variables=playground_request.variables,
-                user_input=playground_request.user_input,
-                document_prompt=playground_request.document_prompt,
-                interaction_prompt=playground_request.interaction_prompt,
-                interaction_error_prompt=playground_request.interaction_error_prompt,
-                model=playground_request.model,
-                temperature=playground_request.temperature,
-                session_id=final_session_id,
-                user_id=final_user_id,
-                trace_id=trace_id,
-                output_language=final_output_language,
-            ):
-                # 检测客户端是否断开连接
-                if await request.is_disconnected():
-                    break
-
-                if chunk.get("success", True):
-                    # 使用新的 JSON 格式发送 SSE 消息
-                    sse_message = chunk.get("sse_message")
-                    if sse_message:
-                        import json
-
-                        yield f"data: {json.dumps(sse_message, ensure_ascii=False)}\n\n"
-                else:
-                    # 返回详细错误信息
-                    error_msg = chunk.get("error", "未知错误")
-                    details = chunk.get("details", "")
-                    if details:
-                        yield f"data: [ERROR] {error_msg} - 详细信息: {details}\n\n"
+            # 使用异步生成器，LLM 流式读取不会阻塞事件循环
+            # aclosing 保证客户端断开后立即关闭生成链，取消上游 LLM 流式请求
+            async with aclosing(
+                service.agenerate_with_llm(
+                    content=playground_request.content,
+                    block_index=playground_request.block_index,
+                    context=playground_request.context,
+                    variables=playground_request.variables,
+                    user_input=playground_request.user_input,
+                    document_prompt=playground_request.document_prompt,
+                    interaction_prompt=playground_request.interaction_prompt,
+                    interaction_error_prompt=playground_request.interaction_error_prompt,
+                    model=playground_request.model,
+                    temperature=playground_request.temperature,
+                    session_id=final_session_id,
+                    user_id=final_user_id,
+                    trace_id=trace_id,
+                    output_language=final_output_language,
+                    doc_id=playground_request.doc_id,
+                    # 预取结果按会话暂存，只对携带了会话ID的客户端有意义
+                    prefetch_next=bool(session_id or header_session_id),
+                )
+            ) as chunks:
+                async for chunk in chunks:
+                    # 检测客户端是否断开连接
+                    if await request.is_disconnected():
+                        break
+
+                    if chunk.get("success", True):
+                        # 服务层已编码好 SSE 帧，直接写出
+                        sse_frame = chunk.get("sse_frame")
+                        if sse_frame:
+                            yield sse_frame
                     else:
-                        yield f"data: [ERROR] {error_msg}\n\n"
-                    yield "data: {\"type\":\"text_end\",\"data\":{\"mdflow\":\"\"}}\n\n"
-                    break
+                        # 返回详细错误信息
+                        error_msg = chunk.get("error", "未知错误")
+                        details = chunk.get("details", "")
+                        if details:
+                            yield encode_error_frame(f"{error_msg} - 详细信息: {details}")
+                        else:
+                            yield encode_error_frame(error_msg)
+                        yield ERROR_TEXT_END_FRAME
+                        break
         except ValueError as e:
-            yield f"data: [ERROR] {str(e)}\n\n"
-            yield "data: {\"type\":\"text_end\",\"data\":{\"mdflow\":\"\"}}\n\n"
+            yield encode_error_frame(str(e))
+            yield ERROR_TEXT_END_FRAME
         except Exception as e:
-            yield f"data: [ERROR] 生成失败: {str(e)}\n\n"
-            yield "data: {\"type\":\"text_end\",\"data\":{\"mdflow\":\"\"}}\n\n"
+            yield encode_error_frame(f"生成失败: {str(e)}")
+            yield ERROR_TEXT_END_FRAME
 
         # 不再发送 [DONE] 标记，因为 text_end 类型已经表示结束
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
 
+@playground_api_router.post("/run-document", summary="整篇文档并行流式生成")
+async def run_document(
+    run_request: PlaygroundDocumentRunRequest,
+    request: Request,
+    service: "PlayGroundService" = Depends(get_playground_service),
+    session_id: str = Header(None, alias="Session-Id"),
+    user_id: str = Header(None, alias="User-Id"),
+):
+    """
+    按块之间的变量依赖并行生成整篇文档（流式输出，Server-Sent Events）
+
+    **请求参数 (PlaygroundDocumentRunRequest)：**
+    - **content** (string, 可选): Markdown-Flow 原文内容，与 doc_id 二选一
+    - **doc_id** (string, 可选): 通过 /playground/documents 登记的文档ID
+    - **completed_blocks** (array<integer>, 可选): 客户端已展示过的块（已生成的内容块、已渲染的交互块），不再重复处理
+    - **context** (array<ChatMessage>, 可选): 上下文消息列表，所有块共用
+    - **variables** (object, 可选): 变量映射字典
+    - **user_input** (object, 可选): 用户对交互块的回答，格式同 /generate，交给产出对应变量的交互块校验
+    - **document_prompt** / **interaction_prompt** / **interaction_error_prompt** (string, 可选): 提示词
+    - **model** (string, 可选): LLM模型名称
+    - **temperature** (float, 可选): LLM温度参数
+
+    **Header 参数：**
+    - **Session-Id** (string, 可选): 会话ID
+    - **User-Id** (string, 可选): 用户ID，未提供时使用默认用户标识（default_user_id），
+      此时 LLM 调用的公平调度与每用户并发上限按会话计算
+
+    **运行逻辑：**
+    - 交互块产出它的目标变量，块中引用的其余变量为输入；输入已齐备的块同时生成（有并发上限）
+    - 交互块渲染后等待用户回答，依赖其变量的块留到下一次运行
+    - user_input 校验通过后，依赖这些变量的块在本次运行中接着生成
+    - 同时生成的块看不到彼此的输出，只使用请求中的 context
+
+    **SSE消息格式：**
+    各块的消息格式同 /generate，额外带上 block_index，不同块的消息交错到达，
+    每个块以自己的 text_end 结束；单个块出错时发送该块的 error 消息，不影响其他块。
+    ```json
+    {"block_index": 2, "type": "content", "data": {"mdflow": "生成的文本片段"}}
+    {"block_index": 2, "type": "text_end", "data": {"mdflow": ""}}
+    {"block_index": 4, "type": "error", "data": {"mdflow": "生成失败: ..."}}
+    ```
+
+    最后一条消息汇总本次运行：
+    ```json
+    {
+      "type": "run_end",
+      "data": {
+        "generated": [0, 1, 4],
+        "answered": [],
+        "awaiting_input": [2],
+        "waiting": {"3": ["name"]},
+        "failed": [],
+        "variables": {}
+      }
+    }
+    ```
+    - generated: 本次生成完成的非交互块
+    - answered: 用户回答被接受的交互块，variables 为其提取的变量
+    - awaiting_input: 已渲染（或回答未通过校验）、等待用户回答的交互块
+    - waiting: 仍在等待变量的块及其缺失的变量
+    - failed: 出错的块
+    """
+    final_session_id = session_id or f"playground-{uuid.uuid4().hex[:8]}"
+    final_user_id = user_id or settings.default_user_id
+    trace_id = get_trace_id()
+
+    async def event_generator():
+        try:
+            async with aclosing(
+                service.arun_document(
+                    content=run_request.content,
+                    completed_blocks=run_request.completed_blocks,
+                    context=run_request.context,
+                    variables=run_request.variables,
+                    user_input=run_request.user_input,
+                    document_prompt=run_request.document_prompt,
+                    interaction_prompt=run_request.interaction_prompt,
+                    interaction_error_prompt=run_request.interaction_error_prompt,
+                    model=run_request.model,
+                    temperature=run_request.temperature,
+                    session_id=final_session_id,
+                    user_id=final_user_id,
+                    trace_id=trace_id,
+                    # 固定输出语言为中文
+                    output_language="Simplified Chinese",
+                    doc_id=run_request.doc_id,
+                )
+            ) as chunks:
+                async for chunk in chunks:
+                    if await request.is_disconnected():
+                        break
+                    sse_frame = chunk.get("sse_frame")
+                    if sse_frame:
+                        yield sse_frame
+        except ValueError as e:
+            yield encode_error_frame(str(e))
+            yield ERROR_TEXT_END_FRAME
+        except Exception as e:
+            yield encode_error_frame(f"生成失败: {str(e)}")
+            yield ERROR_TEXT_END_FRAME
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
+
+
 @playground_api_router.post(
     "/markdownflow_info",
     response_model=BaseResponse,
@@ -182,7 +307,8 @@ async def markdownflow_info(
     获取 Markdown-Flow 文档的结构统计信息
 
     **请求参数 (MarkdownFlowInfoRequest)：**
-    - **content** (string, 必填): 完整的 Markdown-Flow 文档内容
+    - **content** (string, 可选): 完整的 Markdown-Flow 文档内容，与 doc_id 二选一
+    - **doc_id** (string, 可选): 已登记的文档ID
     - **document_prompt** (string, 可选): 文档级系统提示词
 
     **响应数据 (BaseResponse.data)：**
@@ -227,12 +353,51 @@ async def markdownflow_info(
             content=request.content,
             document_prompt=request.document_prompt,
             output_language=final_output_language,
+            doc_id=request.doc_id,
         )
         return res.info(data=result.model_dump())
     except Exception as e:
         return res.error(message=f"获取文档信息失败: {str(e)}")
 
 
+@playground_api_router.post(
+    "/documents",
+    response_model=BaseResponse,
+    summary="登记文档",
+)
+async def register_document(
+    request: RegisterDocumentRequest,
+    service: "PlayGroundService" = Depends(get_playground_service),
+) -> BaseResponse:
+    """
+    登记 Markdown-Flow 文档，之后的生成与信息接口只需携带 doc_id
+
+    **请求参数 (RegisterDocumentRequest)：**
+    - **content** (string, 必填): Markdown-Flow 原文内容
+    - **document_prompt** (string, 可选): 文档级系统提示词
+    - **interaction_prompt** (string, 可选): 交互块渲染提示词
+    - **interaction_error_prompt** (string, 可选): 交互错误提示词
+
+    **响应数据 (BaseResponse.data)：**
+    - **doc_id** (string): 文档ID，由原文和提示词的内容哈希得到，相同内容重复登记返回相同ID
+    - **block_count** (integer): 文档块总数
+
+    **说明：**
+    - 文档解析结果常驻服务端内存，超出容量时按最近最少使用淘汰
+    - 使用已淘汰的 doc_id 会返回错误，客户端需重新登记
+    """
+    try:
+        result = service.register_document(
+            content=request.content,
+            document_prompt=request.document_prompt,
+            interaction_prompt=request.interaction_prompt,
+            interaction_error_prompt=request.interaction_error_prompt,
+        )
+        return res.info(data=result.model_dump())
+    except Exception as e:
+        return res.error(message=f"登记文档失败: {str(e)}")
+
+
 @playground_api_router.post(
     "/generate-complete", response_model=BaseResponse, summary="完整LLM生成"
 )
@@ -247,7 +412,8 @@ async def generate_complete(
     使用 LLM 生成内容（非流式，一次性返回完整结果）
 
     **请求参数 (PlaygroundRunRequest)：**
-    - **content** (string, 必填): Markdown-Flow 原文内容
+    - **content** (string, 可选): Markdown-Flow 原文内容，与 doc_id 二选一
+    - **doc_id** (string, 可选): 通过 /playground/documents 登记的文档ID，提供时使用登记的原文和提示词
     - **block_index** (integer, 必填): 要处理的块索引（从0开始）
     - **context** (array<ChatMessage>, 可选): 上下文消息列表
     - **variables** (object, 可选): 变量映射字典
@@ -263,7 +429,8 @@ async def generate_complete(
 
     **Header 参数：**
     - **Session-Id** (string, 可选): 会话ID
-    - **User-Id** (string, 可选): 用户ID
+    - **User-Id** (string, 可选): 用户ID，未提供时使用默认用户标识（default_user_id），
+      此时 LLM 调用的公平调度与每用户并发上限按会话计算
     - **Output-Language** (string, 可选): 输出语言 locale code（例如 'zh', 'en'）
 
     **响应数据 (BaseResponse.data)：**
@@ -278,6 +445,7 @@ async def generate_complete(
       - index (integer): 块索引
       - variables (array<string>): 变量列表
     - **variables_replaced** (object): 实际替换的变量键值对
+    - **cache_status** (string | null): LLM 响应缓存状态（hit / miss / bypass），未调用 LLM 时为 null
 
     **响应示例：**
     ```json
@@ -324,14 +492,14 @@ async def generate_complete(
     final_session_id = (
         session_id or header_session_id or f"playground-{uuid.uuid4().hex[:8]}"
     )
-    final_user_id = user_id or header_user_id or "playground-user"
+    final_user_id = user_id or header_user_id or settings.default_user_id
     trace_id = get_trace_id()
 
     try:
         # 固定输出语言为中文
         final_output_language = "Simplified Chinese"
 
-        result = service.generate_with_llm_complete(
+        result = await service.agenerate_with_llm_complete(
             content=playground_request.content,
             block_index=playground_request.block_index,
             context=playground_request.context,
@@ -346,6 +514,7 @@ async def generate_complete(
             user_id=final_user_id,
             trace_id=trace_id,
             output_language=final_output_language,
+            doc_id=playground_request.doc_id,
         )
         return res.info(data=result.model_dump())
     except ValueError as e:
@@ -380,6 +549,203 @@ async def get_history(
         return res.error(message=f"获取历史记录失败: {str(e)}")
 
 
+@playground_api_router.get(
+    "/stats",
+    response_model=BaseResponse,
+    summary="获取运行时统计",
+)
+async def get_runtime_stats(
+    service: "PlayGroundService" = Depends(get_playground_service),
+) -> BaseResponse:
+    """
+    获取服务运行时统计信息（进程内）
+
+    **响应数据 (BaseResponse.data)：**
+    - **llm_streams** (object): LLM 流式请求统计
+      - completed_streams (integer): 完整结束的流式请求数
+      - cancelled_streams (integer): 因客户端断开而取消的流式请求数
+      - tokens_streamed_before_cancel (integer): 取消前已输出的 token 数（估算）
+      - estimated_tokens_saved (integer): 按历史平均输出长度估算节省的 token 数
+      - avg_completion_tokens (float | null): 平均输出 token 数
+    - **llm_connection_pool** (object): LLM 上游连接池统计
+      - max_connections (integer): 每个连接池的最大连接数
+      - pools (integer): 连接池个数（每个事件循环一个）
+      - in_flight / peak_in_flight (integer): 当前与峰值占用连接的请求数
+      - utilization (number): 当前占用比例
+      - connections_opened / connections_reused (integer): 新建与复用连接次数
+      - avg_wait_ms / max_wait_ms (number): 等待连接的平均与最大时长（毫秒，含建连）
+    - **llm_endpoints** (array<object>): 各上游端点的路由状态
+      - name / base_url / models: 端点配置
+      - healthy (boolean): 是否在服务中（未被摘除）
+      - ewma_ttft_ms / ewma_complete_latency_ms (number | null): 流式首字与非流式响应的平均延迟
+      - ewma_error_rate (number): 平均错误率
+      - in_flight / requests / failures / ejections (integer): 在途请求、总请求、失败与摘除次数
+    - **llm_circuit_breakers** (object): 熔断器与模型降级统计
+      - enabled (boolean): 是否启用熔断
+      - fallback_models (object): 模型降级链配置
+      - fast_failures (integer): 因熔断被快速拒绝的调用次数
+      - fallbacks / exhausted (integer): 改用备用模型的次数与降级链全部失败的次数
+      - breakers (array<object>): 各（端点, 模型）熔断器的 state（closed / open / half_open）、
+        consecutive_failures、opens 与 rejected
+    - **llm_rate_limits** (object): 上游限流准入统计
+      - enabled (boolean): 是否启用
+      - max_wait_seconds (number): 排队等待上限
+      - models (object): 按模型的 rpm / tpm（配置或响应头学习的限额）、queue_depth / max_queue_depth（排队数）、
+        admitted / delayed / rejected（放行、延迟放行与拒绝次数）、rate_limited（收到 429 次数）、
+        paused_ms（剩余暂停时长）、avg_wait_ms / max_wait_ms（延迟放行的平均与最大等待）
+    - **llm_scheduler** (object): 按用户公平调度统计
+      - enabled (boolean): 是否启用
+      - max_concurrent / per_user_max_concurrent (integer): 全局与单用户槽位上限
+      - in_flight (integer): 占用中的槽位数
+      - queued_interactive / queued_batch / queued_speculative / peak_queued (integer): 排队中的流式、非流式、推测性（预取）调用数与排队峰值
+      - granted_interactive / granted_batch / granted_speculative (integer): 已放行的流式、非流式与推测性调用数
+      - speculative_in_flight / speculative_max_concurrent (integer): 推测性调用占用的槽位数及其上限
+      - queue_timeouts (integer): 排队超时次数
+      - avg_queue_wait_ms / max_queue_wait_ms (number): 排队放行的平均与最大等待
+      - active_users (object): 当前有调用在途或排队的用户及其 in_flight / queued，匿名调用以 "session:<Session-Id>" 为键
+    - **llm_model_capabilities** (object): 模型能力登记统计
+      - ttl_seconds (number): 学习结论的有效期
+      - models (object): 各模型已知的 tools / stream_usage / json_mode 支持情况（配置或学习）
+      - learned_unsupported (object): 按能力统计学习到"不支持"的次数
+      - doomed_attempts_avoided (object): 按能力统计因已知不支持而省掉的失败请求数
+    - **llm_token_usage** (object): token 用量统计（详细查询见 GET /usage）
+      - calls / stream_calls / estimated_calls (integer): 调用数、其中流式调用数与用量为本地估算的调用数
+      - prompt_tokens / completion_tokens / total_tokens (integer): 累计 token 数
+      - shared_calls / shared_prompt_tokens / shared_completion_tokens (integer): 加入合并请求或回放预取的调用数与估算 token 数（不计入上面的 token 数）
+      - tracked_keys (object): 各维度当前保留的条目数
+      - evictions (integer): 因条目数上限被淘汰的条目数
+      - models (object): 按模型的累计用量
+    - **llm_context_budget** (object): 上下文预算裁剪统计
+      - enabled (boolean): 是否启用
+      - default_budget_tokens / model_budgets: 默认与按模型的输入 token 预算
+      - requests / trimmed_requests (integer): 检查的调用数与被裁剪的调用数
+      - messages_dropped / tokens_saved (integer): 丢弃的历史消息数与节省的 token 数（估算）
+      - avg_tokens_saved_per_request / avg_tokens_saved_per_trimmed_request (number): 每次调用与每次裁剪平均节省的 token 数
+      - max_tokens_saved (integer): 单次调用最多节省的 token 数
+      - saved_ratio (number): 节省的 token 占裁剪前输入 token 的比例
+      - over_budget_after_trim (integer): 只剩必须保留的消息仍超出预算的调用数
+    - **llm_hedging** (object): 首字延迟对冲统计
+      - enabled (boolean): 是否启用
+      - delay_ms (number): 当前对冲延迟（近期首字延迟分位数）
+      - requests / hedges / hedge_wins / budget_denied (integer): 流式请求、对冲、对冲胜出与预算不足次数
+      - hedge_ratio (number): 对冲请求占比
+    - **llm_stream_stalls** (object): 输出中途停顿与续写统计
+      - stalls / recoveries / failures (integer): 判定停顿、续写成功与续写失败次数
+      - avg_recovery_ms / max_recovery_ms (number): 从判定停顿到续写输出首个文本的平均与最大时长
+      - trimmed_overlap_chars (integer): 续写开头去除的重复字符数
+    - **markdownflow_cache** (object): 文档解析缓存统计
+      - entries / bytes (integer): 当前缓存的文档数与字节数
+      - hits / misses / evictions (integer): 命中、未命中与淘汰次数
+      - hit_rate (float): 命中率
+    - **document_registry** (object): 服务端文档登记表统计
+      - documents / bytes (integer): 当前登记的文档数与字节数
+      - registrations / lookups / lookup_misses / evictions (integer): 登记、查找、未命中与淘汰次数
+    - **llm_response_cache** (object): LLM 非流式响应缓存统计
+      - enabled (boolean): 是否启用
+      - hits / misses / bypasses / evictions / expirations (integer): 命中、未命中、不可缓存、淘汰与过期次数
+    - **stream_coalescing** (object): 相同在途流式请求合并与背压统计
+      - in_flight (integer): 当前在途的上游流式调用数
+      - flights_started (integer): 实际发起的上游流式调用数
+      - subscribers_joined (integer): 加入已有调用、未触发上游请求的订阅数
+      - max_subscribers (integer): 单次上游调用的最大订阅者数
+      - subscribers_dropped (integer): 其他订阅者仍在接收时，因读取过慢脱离共享调用的订阅者数
+      - replay_overflows (integer): 产出超过高水位、之后不再接受新订阅者的调用数
+      - high_water (integer): 每个订阅者未读增量的上限（片段数）
+      - waits / blocked_seconds / max_blocked_ms: 上游读取因订阅者读不动而挂起的次数、总时长与最长一次
+    - **stream_channel_backpressure** (object): 同步流式交接队列的背压统计（high_water / waits / blocked_seconds / max_blocked_ms）
+    - **sse_coalescing** (object): SSE 增量合并统计
+      - deltas_in / frames_out (integer): 上游增量数与实际输出的帧数
+      - deltas_per_frame (number): 平均每帧合并的增量数
+      - flush_reasons (object): 按首个增量、字节上限、延迟、块结束统计的刷新次数
+    - **document_runs** (object): 整篇文档并行运行统计
+      - max_concurrency (integer): 单次运行同时生成的块数上限
+      - runs / blocks_run / blocks_failed (integer): 运行次数、生成的块数与出错的块数
+      - blocks_left_waiting (integer): 运行结束时仍在等待变量的块数
+      - inputs_accepted / inputs_rejected (integer): 交互块回答通过与未通过校验的次数
+      - peak_parallel_blocks (integer): 同时生成的块数峰值
+      - avg_run_ms (number): 单次运行的平均耗时
+      - parallel_speedup (number): 各块耗时之和与运行耗时之比
+    - **prefetch** (object): 下一内容块预取统计
+      - enabled (boolean): 是否启用
+      - sessions / entries / bytes (integer): 暂存预取结果的会话数、结果数与字节数
+      - prefetches_started (integer): 发起的预取数
+      - hits / hits_in_flight / misses (integer): 命中（其中加入在途预取的次数）与会话中有预取但请求不匹配的次数
+      - hit_rate / used_ratio (number): 命中率与被使用的预取占比
+      - expired / evicted / failed (integer): 过期、因容量淘汰与失败的预取数
+      - served_completion_tokens (integer): 从预取结果回放的输出 token 数（估算）
+      - wasted_prompt_tokens / wasted_completion_tokens (integer): 未被使用的预取消耗的输入与输出 token 数（估算）
+    - **branch_prefetch** (object): 交互块选项分支预取统计（分支的命中与浪费计入 prefetch）
+      - enabled (boolean): 是否启用
+      - top_k / token_budget (integer): 每个交互块最多预取的分支数与 token 预算
+      - interactions_prefetched / branches_started (integer): 预取过分支的交互块渲染次数与发起的分支数
+      - branches_over_budget (integer): 因超出 token 预算未发起的分支数
+      - branches_no_slot (integer): 因调度器没有剩余的推测性调用槽位未发起的分支数
+      - promotions / unmatched_choices (integer): 用户选择命中已预取分支与未命中的次数
+      - promotion_rate (number): 命中比例
+      - branches_dropped (integer): 用户选择后丢弃的其余分支数
+    - **interaction_fast_path** (object): 交互块输入本地快速校验统计
+      - enabled (boolean): 是否启用
+      - validations / resolved_locally / fallbacks (integer): 校验次数、本地完成与交给 MarkdownFlow 的次数
+      - normalized_matches (integer): 忽略大小写、全角半角和空白差异后才匹配上的输入数
+      - llm_calls_avoided (integer): 本会由 MarkdownFlow 调用 LLM（错误渲染或文本校验）的输入数
+      - local_hit_ratio (number): 本地完成的比例
+      - avg_local_us (number): 本地校验的平均耗时（微秒）
+    - **validation_cache** (object): 自由文本校验结论缓存统计
+      - enabled (boolean): 是否启用
+      - similarity_threshold (number): 复用结论所需的相似度
+      - max_entries_per_block / blocks / entries (integer): 每块结论上限、缓存的交互块数与结论数
+      - lookups / exact_hits / approximate_hits (integer): 查找次数、归一化后完全相同与相似命中的次数
+      - hit_rate (number): 命中率
+      - llm_calls_avoided (integer): 复用结论省去的 LLM 校验次数
+      - stored / evicted (integer): 记录与因容量淘汰的结论数
+      - invalidations (integer): 因提示词、模型或输出语言变化清空的交互块数
+    """
+    try:
+        return res.info(data=service.get_runtime_stats())
+    except Exception as e:
+        return res.error(message=f"获取运行时统计失败: {str(e)}")
+
+
+@playground_api_router.get(
+    "/usage",
+    response_model=BaseResponse,
+    summary="查询 token 用量",
+)
+async def query_token_usage(
+    dimension: str = "model",
+    key: str = None,
+    limit: int = 20,
+    service: "PlayGroundService" = Depends(get_playground_service),
+) -> BaseResponse:
+    """
+    按维度查询 LLM token 用量（进程内累计）
+
+    **请求参数：**
+    - **dimension** (string, 可选): 统计维度，model / user / session / document / block，默认 model
+    - **key** (string, 可选): 指定统计对象（如某个 User-Id），为空时按总 token 数从高到低返回
+    - **limit** (integer, 可选): 返回条目数，默认 20 条
+
+    document 维度的标识为 doc_id，未登记的文档为 "content:<内容哈希前缀>"；
+    block 维度的标识为 "<文档标识>#<block_index>"。
+
+    **响应数据 (BaseResponse.data)：**
+    - **dimension** (string): 查询的维度
+    - **items** (array<object>): 各统计对象的用量
+      - key (string): 统计对象
+      - calls / stream_calls / estimated_calls (integer): 调用数、流式调用数与用量为本地估算的调用数
+      - prompt_tokens / completion_tokens / total_tokens (integer): 累计 token 数
+      - shared_calls / shared_prompt_tokens / shared_completion_tokens (integer): 共享他人上游调用（合并请求、预取回放）的调用数与估算 token 数，不计入 total_tokens
+    """
+    try:
+        return res.info(
+            data=service.query_token_usage(dimension, key=key, limit=limit)
+        )
+    except ValueError as e:
+        return res.error(message=str(e))
+    except Exception as e:
+        return res.error(message=f"查询 token 用量失败: {str(e)}")
+
+
 @playground_api_router.post(
     "/save",
     response_model=BaseResponse,
@@ -42,6 +42,133 @@ class Settings(BaseSettings):
     llm_model: str = "deepseek-ai/DeepSeek-V3"
     llm_temperature: float = 0.3
 
+    # LLM 多端点路由配置
+    # 每项形如 {"name": "node-a", "base_url": "...", "api_key": "...", "models": ["deepseek-ai/DeepSeek-V3"]}，
+    # api_key 缺省时使用 llm_api_key，models 为空表示服务所有模型；为空列表时只使用 llm_base_url
+    llm_endpoints: list = []
+    llm_router_ewma_alpha: float = 0.2  # 延迟与错误率的指数滑动平均系数
+    llm_router_max_consecutive_failures: int = 3  # 连续失败达到该次数即摘除端点
+    llm_router_error_rate_threshold: float = 0.5  # 错误率达到该值即摘除端点
+    llm_router_ejection_seconds: float = 30.0  # 摘除时长（秒），期满后放行探测请求
+
+    # LLM 熔断与模型降级配置
+    # 熔断器按（端点, 模型）区分；降级链形如 {"deepseek-ai/DeepSeek-V3": ["Qwen/Qwen2.5-7B-Instruct"]}，
+    # 上游故障或熔断时按顺序改用备用模型
+    llm_circuit_breaker_enabled: bool = True
+    llm_circuit_failure_threshold: int = 5  # 连续失败达到该次数即打开熔断器
+    llm_circuit_open_seconds: float = 30.0  # 熔断器打开时长（秒），期满后进入半开状态
+    llm_circuit_half_open_max_calls: int = 1  # 半开状态下同时放行的探测调用数
+    llm_fallback_models: dict = {}
+
+    # 模型能力配置
+    # 形如 {"deepseek-ai/DeepSeek-R1": {"tools": false, "stream_usage": true, "json_mode": false}}，
+    # 未声明的能力从调用结果中学习
+    llm_model_capabilities: dict = {}
+    llm_capability_ttl: float = 3600.0  # 学习到的能力结论有效期（秒），过期后重新探测
+
+    # LLM 上下文预算配置（按本地估算的 token 数裁剪最早的历史轮次）
+    # 裁剪会丢弃历史内容，默认关闭；开启前按所用模型的上下文窗口配置预算
+    llm_context_budget_enabled: bool = False
+    llm_context_budget_tokens: int = 8000  # 默认输入 token 预算（未在 llm_context_budgets 中配置的模型）
+    llm_context_budgets: dict = {}  # 按模型的输入 token 预算，形如 {"deepseek-ai/DeepSeek-V3": 32000}
+    llm_context_min_recent_messages: int = 2  # 无论预算如何都保留的最近历史消息数
+
+    # token 用量统计配置
+    usage_meter_max_keys: int = 10000  # 每个统计维度（用户、会话、文档等）最多保留的条目数
+
+    # LLM 调用按用户公平调度配置
+    llm_scheduler_enabled: bool = True
+    llm_max_concurrent_calls: int = 64  # 同时占用上游的调用数上限
+    llm_per_user_max_concurrent: int = 8  # 单个用户（User-Id）同时占用的调用数上限，匿名调用按 Session-Id 计算
+    default_user_id: str = "playground-user"  # 未携带 User-Id 时使用的用户标识，调度时不视为同一用户
+    llm_scheduler_quantum: int = 1024  # 每轮分给每个排队用户的 token 额度（差额轮询量子）
+    llm_scheduler_interactive_weight: int = 4  # 两类都在排队时，每放行该数量的流式调用至少放行一个非流式调用
+    llm_scheduler_max_wait: float = 30.0  # 排队等待槽位的上限（秒）
+    llm_speculative_max_concurrent: int = 8  # 预取等推测性调用同时占用的槽位上限（只在无其他调用排队时放行）
+
+    # LLM 上游限流准入配置
+    # 按模型配置每分钟请求数与 token 数，形如 {"deepseek-ai/DeepSeek-V3": {"rpm": 1000, "tpm": 100000}}；
+    # 未配置的模型从上游 x-ratelimit-* 响应头学习限额
+    llm_rate_limit_enabled: bool = True
+    llm_rate_limits: dict = {}
+    llm_rate_limit_max_wait: float = 10.0  # 预计排队超过该时长（秒）即拒绝或降级
+    llm_rate_limit_burst_seconds: float = 5.0  # 令牌桶容量折合的时长（秒），限制瞬时突发
+
+    # 首字延迟对冲请求配置（默认关闭）
+    llm_hedge_enabled: bool = False
+    llm_hedge_percentile: float = 0.95  # 对冲延迟取近期首字延迟的分位数
+    llm_hedge_min_delay_ms: int = 500  # 对冲延迟下限（毫秒）
+    llm_hedge_max_delay_ms: int = 10000  # 对冲延迟上限（毫秒），样本不足时使用
+    llm_hedge_budget_ratio: float = 0.05  # 对冲请求占流式请求的比例上限
+    llm_hedge_model: Optional[str] = None  # 对冲请求使用的模型，为空表示与原请求相同
+
+    # 流式输出中途停顿检测与续写配置
+    llm_stall_detection_enabled: bool = True
+    llm_stall_timeout: float = 15.0  # 相邻两个数据块的最长间隔（秒），超过即判定停顿
+    llm_stall_max_retries: int = 2  # 单次请求最多续写次数
+
+    # LLM 上游连接池配置（所有 LLM 调用共用）
+    llm_pool_max_connections: int = 100  # 每个事件循环上的最大连接数
+    llm_pool_max_keepalive_connections: int = 20  # 保持空闲的最大连接数
+    llm_pool_keepalive_expiry: float = 60.0  # 空闲连接保留时间（秒）
+    llm_connect_timeout: float = 5.0  # 建立连接超时（秒）
+    llm_read_timeout: float = 60.0  # 读取超时（秒），流式响应为相邻两次数据的间隔
+    llm_write_timeout: float = 30.0  # 发送请求超时（秒）
+    llm_pool_timeout: float = 10.0  # 等待空闲连接的超时（秒）
+
+    # LLM I/O 事件循环与流式背压配置
+    llm_stream_queue_size: int = 256  # 同步流式交接队列的高水位（片段数）
+    llm_stream_high_water: int = 64  # 共享流式调用的高水位（片段数）：订阅者未读片段达到该数时上游读取挂起，产出超过该数后不再接受新订阅者
+
+    # MarkdownFlow 文档解析缓存配置
+    markdownflow_cache_max_entries: int = 128  # 最多缓存的文档数
+    markdownflow_cache_max_bytes: int = 64 * 1024 * 1024  # 缓存占用的字节上限
+
+    # 服务端文档登记表配置
+    document_registry_max_documents: int = 256  # 最多登记的文档数
+    document_registry_max_bytes: int = 256 * 1024 * 1024  # 登记表占用的字节上限
+
+    # 整篇文档并行运行配置
+    document_run_max_concurrency: int = 4  # 单次运行同时生成的块数上限
+
+    # 下一内容块预测性预取配置（默认关闭，仅对携带 Session-Id 的请求生效）
+    prefetch_enabled: bool = False
+    prefetch_max_blocks: int = 1  # 每次最多向后预取的内容块数
+    prefetch_ttl: float = 120.0  # 预取结果的保留时间（秒）
+    prefetch_max_bytes: int = 16 * 1024 * 1024  # 所有会话预取结果占用的字节上限
+    prefetch_max_entries_per_session: int = 4  # 单个会话最多保留的预取结果数
+    # 交互块渲染后为热门按钮选项预取下一内容块（需同时开启 prefetch_enabled）
+    branch_prefetch_enabled: bool = False
+    branch_prefetch_top_k: int = 3  # 每个交互块最多预取的选项分支数
+    branch_prefetch_token_budget: int = 4000  # 每个交互块各分支预估 token 数（输入 + 平均输出）之和的上限
+
+    # 交互块输入本地快速校验（按钮的精确/归一化匹配不经过 MarkdownFlow 和 LLM）
+    interaction_fast_path_enabled: bool = True
+
+    # 自由文本交互输入的 LLM 校验（默认关闭，MarkdownFlow 原样接受自由文本）
+    interaction_text_validation_enabled: bool = False
+    # 自由文本校验结论缓存，相似的回答复用此前的结论
+    validation_cache_enabled: bool = True
+    validation_cache_similarity: float = 0.85  # 归一化回答的字符二元组相似度阈值
+    validation_cache_max_entries_per_block: int = 256  # 每个交互块最多保留的结论数
+    validation_cache_max_blocks: int = 1024  # 最多缓存结论的交互块数
+
+    # LLM 非流式响应缓存配置（默认关闭）
+    llm_response_cache_enabled: bool = False
+    llm_response_cache_ttl: int = 600  # 缓存有效期（秒）
+    llm_response_cache_max_entries: int = 1024  # 最多缓存的响应数
+    llm_response_cache_max_bytes: int = 32 * 1024 * 1024  # 缓存占用的字节上限
+    llm_response_cache_max_temperature: float = 0.3  # 仅缓存温度不高于该值的调用
+    llm_response_cache_models: list = []  # 允许缓存的模型，为空表示所有模型
+
+    # 相同在途生成请求合并为一次上游流式调用
+    generate_coalescing_enabled: bool = True
+
+    # SSE 增量合并配置（首个增量立即输出，之后按字节上限或最大延迟刷新）
+    sse_coalesce_enabled: bool = True
+    sse_coalesce_max_bytes: int = 256  # 缓冲达到该字节数立即刷新
+    sse_coalesce_max_delay_ms: int = 30  # 缓冲的最长停留时间（毫秒）
+
     # Pydantic V2 配置
     model_config = SettingsConfigDict(
         env_file=".env",
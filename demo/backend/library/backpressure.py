@@ -0,0 +1,37 @@
+"""
+流式背压统计
+
+生产者（上游读取）在缓冲区达到高水位时挂起，等待消费者（SSE 写出）腾出空间，
+每条流占用的内存与客户端读取速度无关。这里记录生产者被阻塞的次数和时长。
+"""
+
+import threading
+from typing import Any, Dict
+
+
+class BackpressureMeter:
+    """记录生产者因缓冲区满而挂起的次数与时长"""
+
+    def __init__(self, high_water: int):
+        self.high_water = high_water
+        self._lock = threading.Lock()
+        self._waits = 0
+        self._blocked_seconds = 0.0
+        self._max_blocked_seconds = 0.0
+
+    def record_wait(self, seconds: float):
+        """记录一次挂起"""
+        with self._lock:
+            self._waits += 1
+            self._blocked_seconds += seconds
+            self._max_blocked_seconds = max(self._max_blocked_seconds, seconds)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取背压统计"""
+        with self._lock:
+            return {
+                "high_water": self.high_water,
+                "waits": self._waits,
+                "blocked_seconds": round(self._blocked_seconds, 3),
+                "max_blocked_ms": round(self._max_blocked_seconds * 1000, 1),
+            }
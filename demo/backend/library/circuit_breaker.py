@@ -0,0 +1,152 @@
+"""
+LLM 调用熔断
+
+每个（端点, 模型）组合有一个熔断器：连续失败达到阈值后打开，打开期间的调用立即被拒绝；
+打开时长期满后进入半开状态，放行少量探测调用，成功则关闭，失败则重新打开。
+上游故障时请求在毫秒级失败，由调用方降级到备用模型，而不是逐个等待超时。
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend.config.settings import settings
+from backend.utils.logger import logger
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开，调用被快速拒绝"""
+
+
+class CircuitBreaker:
+    """单个（端点, 模型）组合的熔断器，由 CircuitBreakerRegistry 加锁访问"""
+
+    def __init__(self):
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.opened_until = 0.0
+        self.half_open_in_flight = 0
+        self.opens = 0
+        self.rejected = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取熔断器统计"""
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "opens": self.opens,
+            "rejected": self.rejected,
+        }
+
+
+class CircuitBreakerRegistry:
+    """按（端点, 模型）管理熔断器"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        failure_threshold: int = 5,
+        open_seconds: float = 30.0,
+        half_open_max_calls: int = 1,
+    ):
+        self.enabled = enabled
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.half_open_max_calls = max(1, half_open_max_calls)
+        self._breakers: Dict[Tuple[str, Optional[str]], CircuitBreaker] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "CircuitBreakerRegistry":
+        """根据全局配置创建熔断器"""
+        return cls(
+            enabled=settings.llm_circuit_breaker_enabled,
+            failure_threshold=settings.llm_circuit_failure_threshold,
+            open_seconds=settings.llm_circuit_open_seconds,
+            half_open_max_calls=settings.llm_circuit_half_open_max_calls,
+        )
+
+    def _breaker(self, endpoint: str, model: Optional[str]) -> CircuitBreaker:
+        """获取熔断器，不存在时创建（调用方持有锁）"""
+        key = (endpoint, model)
+        breaker = self._breakers.get(key)
+        if breaker is None:
+            breaker = self._breakers[key] = CircuitBreaker()
+        return breaker
+
+    def available(self, endpoint: str, model: Optional[str]) -> bool:
+        """是否可以向该端点发起该模型的调用（不占用半开探测名额）"""
+        if not self.enabled:
+            return True
+        with self._lock:
+            breaker = self._breakers.get((endpoint, model))
+            if breaker is None or breaker.state == CLOSED:
+                return True
+            if breaker.state == OPEN:
+                return breaker.opened_until <= time.monotonic()
+            return breaker.half_open_in_flight < self.half_open_max_calls
+
+    def on_call(self, endpoint: str, model: Optional[str]):
+        """记录一次已放行的调用，打开期满时转为半开并占用探测名额"""
+        if not self.enabled:
+            return
+        with self._lock:
+            breaker = self._breaker(endpoint, model)
+            if breaker.state == OPEN:
+                breaker.state = HALF_OPEN
+                breaker.half_open_in_flight = 0
+            if breaker.state == HALF_OPEN:
+                breaker.half_open_in_flight += 1
+
+    def record_rejected(self, endpoint: str, model: Optional[str]):
+        """记录一次被熔断拒绝的调用"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self._breaker(endpoint, model).rejected += 1
+
+    def record(self, endpoint: str, model: Optional[str], success: Optional[bool]):
+        """
+        记录调用结果
+
+        Args:
+            success: True 为成功，False 为上游失败，None 为没有结论（如调用被取消）
+        """
+        if not self.enabled:
+            return
+        with self._lock:
+            breaker = self._breaker(endpoint, model)
+            was_half_open = breaker.state == HALF_OPEN
+            if was_half_open:
+                breaker.half_open_in_flight = max(0, breaker.half_open_in_flight - 1)
+
+            if success is None:
+                return
+            if success:
+                breaker.consecutive_failures = 0
+                if was_half_open:
+                    breaker.state = CLOSED
+                return
+
+            breaker.consecutive_failures += 1
+            if was_half_open or breaker.consecutive_failures >= self.failure_threshold:
+                if breaker.state != OPEN:
+                    breaker.opens += 1
+                    logger.warning(
+                        f"LLM 熔断器打开: 端点 {endpoint}, 模型 {model}, "
+                        f"连续失败 {breaker.consecutive_failures} 次, {self.open_seconds}s 内快速失败"
+                    )
+                breaker.state = OPEN
+                breaker.opened_until = time.monotonic() + self.open_seconds
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """获取所有熔断器统计"""
+        with self._lock:
+            return [
+                {"endpoint": endpoint, "model": model, **breaker.get_stats()}
+                for (endpoint, model), breaker in self._breakers.items()
+            ]
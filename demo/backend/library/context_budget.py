@@ -0,0 +1,148 @@
+"""
+LLM 上下文预算
+
+客户端每次请求都会带上完整的对话历史，长课程的历史越来越长，
+输入 token 和首字延迟随之增长。调用前按本地估算的 token 数检查消息列表，
+超出模型预算时从最早的历史轮次开始丢弃；系统消息（系统提示词、文档提示词、
+严格约束）和当前这条消息始终保留。
+
+裁剪会改变模型看到的历史，默认关闭，需按所用模型的上下文窗口配置预算后开启。
+"""
+
+import threading
+from typing import Any, Dict, List, Optional
+
+from backend.config.settings import settings
+from backend.utils.tokens import estimate_tokens
+
+# 每条消息的格式开销，与 estimate_message_tokens 一致
+_MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def _message_tokens(message: Dict[str, Any]) -> int:
+    """估算单条消息的 token 数"""
+    return estimate_tokens(message.get("content") or "") + _MESSAGE_OVERHEAD_TOKENS
+
+
+class ContextBudgeter:
+    """按模型的 token 预算裁剪对话历史"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        default_budget: int = 8000,
+        model_budgets: Optional[Dict[str, int]] = None,
+        min_recent_messages: int = 2,
+    ):
+        self.enabled = enabled
+        self.default_budget = default_budget
+        self.model_budgets = model_budgets or {}
+        self.min_recent_messages = max(0, min_recent_messages)
+        self._lock = threading.Lock()
+        self._requests = 0
+        self._trimmed_requests = 0
+        self._messages_dropped = 0
+        self._tokens_before = 0
+        self._tokens_saved = 0
+        self._max_tokens_saved = 0
+        self._over_budget = 0
+
+    @classmethod
+    def from_settings(cls) -> "ContextBudgeter":
+        """根据全局配置创建预算器"""
+        return cls(
+            enabled=settings.llm_context_budget_enabled,
+            default_budget=settings.llm_context_budget_tokens,
+            model_budgets=settings.llm_context_budgets,
+            min_recent_messages=settings.llm_context_min_recent_messages,
+        )
+
+    def budget_for(self, model: Optional[str]) -> int:
+        """模型的输入 token 预算"""
+        return self.model_budgets.get(model or "", self.default_budget)
+
+    def trim(
+        self,
+        messages: List[Dict[str, Any]],
+        model: Optional[str],
+        reserved_tokens: int = 0,
+    ) -> List[Dict[str, Any]]:
+        """
+        裁剪消息列表使其不超过模型预算
+
+        Args:
+            messages: 完整消息列表，最后一条为当前消息
+            model: 模型名称
+            reserved_tokens: 调用方还会追加的消息占用的 token 数
+
+        Returns:
+            未超出预算时原样返回，否则返回丢弃了最早历史轮次的新列表
+        """
+        if not self.enabled or len(messages) < 2:
+            return messages
+
+        sizes = [_message_tokens(message) for message in messages]
+        total = sum(sizes) + reserved_tokens
+        budget = self.budget_for(model)
+        with self._lock:
+            self._requests += 1
+            self._tokens_before += total
+        if total <= budget:
+            return messages
+
+        # 可丢弃的历史：当前消息之前的非系统消息，保留最近的若干条
+        history = [
+            index
+            for index, message in enumerate(messages[:-1])
+            if message.get("role") != "system"
+        ]
+        droppable = history[: max(0, len(history) - self.min_recent_messages)]
+
+        dropped = set()
+        for index in droppable:
+            # 回到预算内后，保留的历史从用户消息开始，避免以孤立的助手回复开头
+            if total <= budget and messages[index].get("role") == "user":
+                break
+            dropped.add(index)
+            total -= sizes[index]
+
+        saved = sum(sizes[index] for index in dropped)
+        with self._lock:
+            if total > budget:
+                self._over_budget += 1
+            if dropped:
+                self._trimmed_requests += 1
+                self._messages_dropped += len(dropped)
+                self._tokens_saved += saved
+                self._max_tokens_saved = max(self._max_tokens_saved, saved)
+        if not dropped:
+            return messages
+        return [message for index, message in enumerate(messages) if index not in dropped]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取裁剪统计"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "default_budget_tokens": self.default_budget,
+                "model_budgets": dict(self.model_budgets),
+                "requests": self._requests,
+                "trimmed_requests": self._trimmed_requests,
+                "messages_dropped": self._messages_dropped,
+                "tokens_saved": self._tokens_saved,
+                "avg_tokens_saved_per_request": (
+                    round(self._tokens_saved / self._requests, 1) if self._requests else 0.0
+                ),
+                "avg_tokens_saved_per_trimmed_request": (
+                    round(self._tokens_saved / self._trimmed_requests, 1)
+                    if self._trimmed_requests
+                    else 0.0
+                ),
+                "max_tokens_saved": self._max_tokens_saved,
+                "saved_ratio": (
+                    round(self._tokens_saved / self._tokens_before, 4)
+                    if self._tokens_before
+                    else 0.0
+                ),
+                "over_budget_after_trim": self._over_budget,
+            }
@@ -0,0 +1,156 @@
+"""
+流式增量合并
+
+上游每个增量通常只有 1-3 个字符，逐个写成 SSE 帧会产生大量帧和系统调用。
+合并阶段在上游与 SSE 输出之间缓冲增量，按字节上限、最大延迟或块结束刷新；
+首个增量立即输出，不影响首字延迟。
+"""
+
+import asyncio
+import threading
+import time
+from typing import Any, AsyncGenerator, AsyncIterator, Dict, List, Optional
+
+from backend.config.settings import settings
+
+
+class DeltaCoalescer:
+    """按延迟预算合并流式增量"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        max_bytes: int = 256,
+        max_delay_ms: float = 30,
+    ):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_delay = max_delay_ms / 1000
+        self._lock = threading.Lock()
+        self._streams = 0
+        self._deltas_in = 0
+        self._frames_out = 0
+        self._flush_reasons = {"first": 0, "bytes": 0, "delay": 0, "end": 0}
+
+    @classmethod
+    def from_settings(cls) -> "DeltaCoalescer":
+        """根据全局配置创建合并器"""
+        return cls(
+            enabled=settings.sse_coalesce_enabled,
+            max_bytes=settings.sse_coalesce_max_bytes,
+            max_delay_ms=settings.sse_coalesce_max_delay_ms,
+        )
+
+    async def coalesce(self, source: AsyncIterator[str]) -> AsyncGenerator[str, None]:
+        """
+        合并上游增量
+
+        Args:
+            source: 上游增量迭代器，调用方负责关闭
+
+        Yields:
+            str: 合并后的文本片段
+        """
+        with self._lock:
+            self._streams += 1
+
+        if not self.enabled:
+            async for delta in source:
+                self._record(deltas=1, reason=None)
+                yield delta
+            return
+
+        iterator = source.__aiter__()
+        buffer: List[str] = []
+        buffered_bytes = 0
+        buffered_deltas = 0
+        deadline: Optional[float] = None
+        first = True
+        pending: Optional[asyncio.Future] = None
+
+        try:
+            while True:
+                if pending is None:
+                    pending = asyncio.ensure_future(iterator.__anext__())
+
+                timeout = None
+                if deadline is not None:
+                    timeout = max(deadline - time.monotonic(), 0)
+                done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+                if not done:
+                    # 延迟预算用尽，刷新缓冲区，继续等待同一个上游读取
+                    self._record(deltas=buffered_deltas, reason="delay")
+                    yield "".join(buffer)
+                    buffer, buffered_bytes, buffered_deltas, deadline = [], 0, 0, None
+                    continue
+
+                future, pending = pending, None
+                try:
+                    delta = future.result()
+                except StopAsyncIteration:
+                    break
+                except Exception:
+                    # 上游出错前先输出已缓冲的内容
+                    if buffer:
+                        self._record(deltas=buffered_deltas, reason="end")
+                        yield "".join(buffer)
+                    raise
+
+                if not delta:
+                    continue
+
+                if first:
+                    # 首个增量立即输出
+                    first = False
+                    self._record(deltas=1, reason="first")
+                    yield delta
+                    continue
+
+                buffer.append(delta)
+                buffered_bytes += len(delta.encode("utf-8"))
+                buffered_deltas += 1
+                if deadline is None:
+                    deadline = time.monotonic() + self.max_delay
+
+                if buffered_bytes >= self.max_bytes:
+                    self._record(deltas=buffered_deltas, reason="bytes")
+                    yield "".join(buffer)
+                    buffer, buffered_bytes, buffered_deltas, deadline = [], 0, 0, None
+
+            # 块结束，刷新剩余内容
+            if buffer:
+                self._record(deltas=buffered_deltas, reason="end")
+                yield "".join(buffer)
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
+                await asyncio.wait({pending})
+                if not pending.cancelled():
+                    pending.exception()  # 取走异常，避免未处理异常告警
+
+    def _record(self, deltas: int, reason: Optional[str]):
+        """记录一次输出"""
+        with self._lock:
+            self._deltas_in += deltas
+            self._frames_out += 1
+            if reason is not None:
+                self._flush_reasons[reason] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并统计"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "max_bytes": self.max_bytes,
+                "max_delay_ms": round(self.max_delay * 1000, 3),
+                "streams": self._streams,
+                "deltas_in": self._deltas_in,
+                "frames_out": self._frames_out,
+                "deltas_per_frame": (
+                    round(self._deltas_in / self._frames_out, 2)
+                    if self._frames_out
+                    else 0.0
+                ),
+                "flush_reasons": dict(self._flush_reasons),
+            }
@@ -0,0 +1,271 @@
+"""
+MarkdownFlow 解析结果缓存与服务端文档登记表
+
+同一文档的每个 block_index 请求都会携带完整内容，缓存已解析的 MarkdownFlow 模板，
+每次请求浅拷贝模板后再挂载本次请求的 LLM 提供者，避免重复解析。
+登记过的文档常驻内存，客户端只需携带 doc_id。
+"""
+
+import copy
+import hashlib
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+
+from markdown_flow import MarkdownFlow
+
+
+def compute_document_hash(
+    content: str,
+    document_prompt: Optional[str] = None,
+    interaction_prompt: Optional[str] = None,
+    interaction_error_prompt: Optional[str] = None,
+) -> str:
+    """计算文档内容与提示词的哈希"""
+    digest = hashlib.sha256()
+    for part in (content, document_prompt, interaction_prompt, interaction_error_prompt):
+        # 用长度前缀区分 None 与空字符串，并避免拼接歧义
+        if part is None:
+            digest.update(b"\x00N")
+        else:
+            encoded = part.encode("utf-8")
+            digest.update(f"\x00{len(encoded)}:".encode("ascii"))
+            digest.update(encoded)
+    return digest.hexdigest()
+
+
+def _parse_template(
+    content: str,
+    document_prompt: Optional[str] = None,
+    interaction_prompt: Optional[str] = None,
+    interaction_error_prompt: Optional[str] = None,
+) -> Tuple[MarkdownFlow, int]:
+    """解析文档并返回 MarkdownFlow 模板及其估算占用字节数"""
+    template = MarkdownFlow(
+        content,
+        document_prompt=document_prompt,
+        interaction_prompt=interaction_prompt,
+        interaction_error_prompt=interaction_error_prompt,
+    )
+    blocks = template.get_all_blocks()
+    size_bytes = (
+        len(content.encode("utf-8"))
+        + len(template.get_processed_document().encode("utf-8"))
+        + sum(len(block.content.encode("utf-8")) for block in blocks)
+    )
+    return template, size_bytes
+
+
+@dataclass
+class _CacheEntry:
+    """缓存条目"""
+
+    template: MarkdownFlow
+    size_bytes: int
+
+
+class MarkdownFlowCache:
+    """解析后的 MarkdownFlow 文档 LRU 缓存，同时限制条目数和字节数"""
+
+    def __init__(self, max_entries: int = 128, max_bytes: int = 64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(
+        self,
+        content: str,
+        document_prompt: Optional[str] = None,
+        interaction_prompt: Optional[str] = None,
+        interaction_error_prompt: Optional[str] = None,
+    ) -> MarkdownFlow:
+        """
+        获取文档对应的 MarkdownFlow 实例
+
+        返回的是缓存模板的浅拷贝，未挂载 LLM 提供者，调用方可自由设置本次请求的参数。
+        """
+        key = compute_document_hash(
+            content, document_prompt, interaction_prompt, interaction_error_prompt
+        )
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return copy.copy(entry.template)
+            self._misses += 1
+
+        # 在锁外解析，避免大文档阻塞其他请求
+        template, size_bytes = _parse_template(
+            content, document_prompt, interaction_prompt, interaction_error_prompt
+        )
+        self._put(key, _CacheEntry(template=template, size_bytes=size_bytes))
+        return copy.copy(template)
+
+    def _put(self, key: str, entry: _CacheEntry):
+        """写入缓存并按 LRU 淘汰超出限制的条目"""
+        if entry.size_bytes > self.max_bytes:
+            # 单个文档超过字节上限，不缓存
+            return
+
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous.size_bytes
+            self._entries[key] = entry
+            self._total_bytes += entry.size_bytes
+
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or self._total_bytes > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.size_bytes
+                self._evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "max_entries": self.max_entries,
+                "max_bytes": self.max_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+@dataclass
+class RegisteredDocument:
+    """服务端登记的文档"""
+
+    doc_id: str
+    content: str
+    document_prompt: Optional[str]
+    interaction_prompt: Optional[str]
+    interaction_error_prompt: Optional[str]
+    template: MarkdownFlow
+    size_bytes: int
+
+    @property
+    def block_count(self) -> int:
+        """文档块总数"""
+        return self.template.block_count
+
+    def create_markdown_flow(self) -> MarkdownFlow:
+        """基于常驻模板创建 MarkdownFlow 实例（浅拷贝）"""
+        return copy.copy(self.template)
+
+
+class DocumentRegistry:
+    """
+    服务端文档登记表
+
+    文档以内容哈希作为 doc_id 登记，解析后的块结构常驻内存，客户端后续只需携带 doc_id。
+    登记表按文档数和字节数做 LRU 淘汰。
+    """
+
+    def __init__(self, max_documents: int = 256, max_bytes: int = 256 * 1024 * 1024):
+        self.max_documents = max_documents
+        self.max_bytes = max_bytes
+        self._documents: "OrderedDict[str, RegisteredDocument]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._registrations = 0
+        self._lookups = 0
+        self._lookup_misses = 0
+        self._evictions = 0
+
+    def register(
+        self,
+        content: str,
+        document_prompt: Optional[str] = None,
+        interaction_prompt: Optional[str] = None,
+        interaction_error_prompt: Optional[str] = None,
+    ) -> RegisteredDocument:
+        """登记文档，内容相同的重复登记直接返回已有记录"""
+        doc_id = compute_document_hash(
+            content, document_prompt, interaction_prompt, interaction_error_prompt
+        )
+
+        with self._lock:
+            self._registrations += 1
+            existing = self._documents.get(doc_id)
+            if existing is not None:
+                self._documents.move_to_end(doc_id)
+                return existing
+
+        template, size_bytes = _parse_template(
+            content, document_prompt, interaction_prompt, interaction_error_prompt
+        )
+        if size_bytes > self.max_bytes:
+            raise ValueError("文档过大，无法登记")
+
+        document = RegisteredDocument(
+            doc_id=doc_id,
+            content=content,
+            document_prompt=document_prompt,
+            interaction_prompt=interaction_prompt,
+            interaction_error_prompt=interaction_error_prompt,
+            template=template,
+            size_bytes=size_bytes,
+        )
+
+        with self._lock:
+            existing = self._documents.pop(doc_id, None)
+            if existing is not None:
+                self._total_bytes -= existing.size_bytes
+            self._documents[doc_id] = document
+            self._total_bytes += size_bytes
+
+            while self._documents and (
+                len(self._documents) > self.max_documents
+                or self._total_bytes > self.max_bytes
+            ):
+                _, evicted = self._documents.popitem(last=False)
+                self._total_bytes -= evicted.size_bytes
+                self._evictions += 1
+
+        return document
+
+    def get(self, doc_id: str) -> Optional[RegisteredDocument]:
+        """按 doc_id 查找文档，不存在时返回 None"""
+        with self._lock:
+            self._lookups += 1
+            document = self._documents.get(doc_id)
+            if document is None:
+                self._lookup_misses += 1
+                return None
+            self._documents.move_to_end(doc_id)
+            return document
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取登记表统计"""
+        with self._lock:
+            return {
+                "documents": len(self._documents),
+                "bytes": self._total_bytes,
+                "max_documents": self.max_documents,
+                "max_bytes": self.max_bytes,
+                "registrations": self._registrations,
+                "lookups": self._lookups,
+                "lookup_misses": self._lookup_misses,
+                "evictions": self._evictions,
+            }
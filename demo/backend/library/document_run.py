@@ -0,0 +1,151 @@
+"""
+整篇文档的依赖感知并行运行
+
+逐块运行时每个块都要等前一个块生成完。多数内容块并不依赖后面交互块收集的变量，
+按各块引用的变量建立依赖关系：交互块产出它的目标变量（块变量列表的第一个），
+其余变量都是块的输入。输入已齐备的块可以同时生成，只有依赖尚未回答的交互块的块需要等待。
+"""
+
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, List, Optional, Set
+
+from markdown_flow.enums import BlockType as MFBlockType
+
+from backend.config.settings import settings
+
+
+@dataclass
+class BlockNode:
+    """依赖图中的一个块"""
+
+    index: int
+    is_interaction: bool
+    assigns: Optional[str] = None  # 交互块产出的变量
+    requires: Set[str] = field(default_factory=set)  # 块运行前需要的变量
+
+
+class BlockDependencyGraph:
+    """按变量建立的块依赖图"""
+
+    def __init__(self, nodes: List[BlockNode]):
+        self.nodes = nodes
+        # 变量 -> 产出它的交互块
+        self.producers: Dict[str, List[int]] = {}
+        for node in nodes:
+            if node.assigns is not None:
+                self.producers.setdefault(node.assigns, []).append(node.index)
+
+    @classmethod
+    def from_blocks(
+        cls, blocks: Iterable[Any], shared_variables: Iterable[str] = ()
+    ) -> "BlockDependencyGraph":
+        """
+        根据 MarkdownFlow 的块列表建立依赖图
+
+        Args:
+            blocks: MarkdownFlow.get_all_blocks() 的结果
+            shared_variables: 所有块共用的变量（如文档提示词中引用的变量）
+        """
+        shared = set(shared_variables)
+        nodes = []
+        for block in blocks:
+            variables = list(block.variables or [])
+            is_interaction = block.block_type == MFBlockType.INTERACTION
+            # 与 MarkdownFlow 一致，交互块的目标变量取变量列表的第一个
+            assigns = variables[0] if is_interaction and variables else None
+            requires = {name for name in variables if name != assigns} | shared
+            nodes.append(
+                BlockNode(
+                    index=block.index,
+                    is_interaction=is_interaction,
+                    assigns=assigns,
+                    requires=requires,
+                )
+            )
+        return cls(nodes)
+
+    def missing(self, node: BlockNode, available: Set[str]) -> List[str]:
+        """
+        块尚未满足的输入
+
+        只有由交互块产出、且还没有取值的变量才算缺失；
+        文档中没有任何交互块产出的变量由 MarkdownFlow 按原样处理，不阻塞运行。
+        """
+        return sorted(
+            name
+            for name in node.requires
+            if name not in available and name in self.producers
+        )
+
+
+class DocumentRunStats:
+    """整篇文档运行统计"""
+
+    def __init__(self, max_concurrency: int = 4):
+        self.max_concurrency = max_concurrency
+        self._lock = threading.Lock()
+        self._runs = 0
+        self._blocks_run = 0
+        self._blocks_failed = 0
+        self._blocks_waiting = 0
+        self._inputs_accepted = 0
+        self._inputs_rejected = 0
+        self._run_seconds = 0.0
+        self._block_seconds = 0.0
+        self._peak_parallel = 0
+
+    @classmethod
+    def from_settings(cls) -> "DocumentRunStats":
+        """根据全局配置创建统计"""
+        return cls(max_concurrency=settings.document_run_max_concurrency)
+
+    def record_block(self, seconds: float, success: bool):
+        """记录一个块的运行耗时"""
+        with self._lock:
+            self._blocks_run += 1
+            self._blocks_failed += not success
+            self._block_seconds += seconds
+
+    def record_input(self, accepted: bool):
+        """记录一次交互块输入校验结果"""
+        with self._lock:
+            if accepted:
+                self._inputs_accepted += 1
+            else:
+                self._inputs_rejected += 1
+
+    def record_parallel(self, running: int):
+        """记录同时运行的块数"""
+        with self._lock:
+            self._peak_parallel = max(self._peak_parallel, running)
+
+    def record_run(self, seconds: float, waiting: int):
+        """记录一次运行结束"""
+        with self._lock:
+            self._runs += 1
+            self._run_seconds += seconds
+            self._blocks_waiting += waiting
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取运行统计"""
+        with self._lock:
+            return {
+                "max_concurrency": self.max_concurrency,
+                "runs": self._runs,
+                "blocks_run": self._blocks_run,
+                "blocks_failed": self._blocks_failed,
+                "blocks_left_waiting": self._blocks_waiting,
+                "inputs_accepted": self._inputs_accepted,
+                "inputs_rejected": self._inputs_rejected,
+                "peak_parallel_blocks": self._peak_parallel,
+                "avg_run_ms": (
+                    round(self._run_seconds / self._runs * 1000, 1) if self._runs else 0.0
+                ),
+                # 各块耗时之和与整篇运行耗时之比，即并行带来的加速倍数
+                "parallel_speedup": (
+                    round(self._block_seconds / self._run_seconds, 2)
+                    if self._run_seconds
+                    else 0.0
+                ),
+            }
@@ -0,0 +1,389 @@
+"""
+LLM 调用的按用户公平调度
+
+上游 LLM 调用槽位总数有限。槽位不足时调用按用户排队，用户之间按差额轮询（DRR）分配：
+每轮给每个排队用户一份 token 额度，额度够支付队首调用的预估 token 时放行，
+单个用户大量提交请求只会排长自己的队，不会挤占其他用户。
+每个用户同时占用的槽位另有上限。
+未携带 User-Id 的调用都使用默认用户标识（settings.default_user_id），
+这类调用按会话（Session-Id）区分排队和计算上限，不会共用一个用户的上限。
+
+流式（交互）调用优先于非流式（批量）调用，但两类都在排队时，
+每放行若干个流式调用至少放行一个非流式调用，避免批量调用饿死。
+预取等推测性调用优先级最低：只在没有其他调用排队时放行，同时占用的槽位另有总上限，
+给之后到达的真实请求留出槽位；推测性调用不计入用户的并发上限。
+
+调度器会被不同线程上的事件循环共同使用，状态由线程锁保护，
+放行时通过 call_soon_threadsafe 唤醒等待方所在的事件循环。
+"""
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional
+
+from backend.config.settings import settings
+
+# 既无用户标识也无会话标识的调用归入同一个匿名用户
+_ANONYMOUS_USER = "anonymous"
+
+
+class SchedulerQueueTimeout(Exception):
+    """排队等待 LLM 调用槽位超时"""
+
+
+class SlotTicket:
+    """一次排队或已放行的调用"""
+
+    def __init__(
+        self,
+        user: str,
+        interactive: bool,
+        cost: int,
+        loop: asyncio.AbstractEventLoop,
+        speculative: bool = False,
+    ):
+        self.user = user
+        self.interactive = interactive
+        self.speculative = speculative
+        self.cost = cost
+        self.loop = loop
+        self.future: asyncio.Future = loop.create_future()
+        self.granted = False
+        self.released = False
+        self.enqueued_at = time.monotonic()
+
+
+class _UserQueue:
+    """单个用户在一个优先级下的排队调用"""
+
+    def __init__(self):
+        self.deficit = 0
+        self.tickets: Deque[SlotTicket] = deque()
+
+
+class FairShareScheduler:
+    """按用户公平分配上游 LLM 调用槽位"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        max_concurrent: int = 64,
+        per_user_max_concurrent: int = 8,
+        quantum: int = 1024,
+        interactive_weight: int = 4,
+        max_wait_seconds: float = 30.0,
+        default_user: Optional[str] = None,
+        speculative_max_concurrent: int = 8,
+    ):
+        self.enabled = enabled
+        self.max_concurrent = max(1, max_concurrent)
+        self.per_user_max_concurrent = max(1, per_user_max_concurrent)
+        self.quantum = max(1, quantum)
+        self.interactive_weight = max(1, interactive_weight)
+        self.max_wait_seconds = max_wait_seconds
+        self.default_user = default_user
+        self.speculative_max_concurrent = max(1, speculative_max_concurrent)
+
+        self._lock = threading.Lock()
+        # 两个优先级各有一个用户轮询环：用户 -> 排队调用，环首为当前轮到的用户
+        self._rings: Dict[bool, "OrderedDict[str, _UserQueue]"] = {
+            True: OrderedDict(),
+            False: OrderedDict(),
+        }
+        self._speculative_ring: "OrderedDict[str, _UserQueue]" = OrderedDict()
+        self._in_flight = 0
+        self._user_in_flight: Dict[str, int] = {}
+        self._speculative_in_flight = 0
+        self._speculative_user_in_flight: Dict[str, int] = {}
+        self._interactive_streak = 0
+
+        self._granted = {True: 0, False: 0}
+        self._granted_speculative = 0
+        self._queued_grants = 0
+        self._timeouts = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._peak_queued = 0
+
+    @classmethod
+    def from_settings(cls) -> "FairShareScheduler":
+        """根据全局配置创建调度器"""
+        return cls(
+            enabled=settings.llm_scheduler_enabled,
+            max_concurrent=settings.llm_max_concurrent_calls,
+            per_user_max_concurrent=settings.llm_per_user_max_concurrent,
+            quantum=settings.llm_scheduler_quantum,
+            interactive_weight=settings.llm_scheduler_interactive_weight,
+            max_wait_seconds=settings.llm_scheduler_max_wait,
+            default_user=settings.default_user_id,
+            speculative_max_concurrent=settings.llm_speculative_max_concurrent,
+        )
+
+    def _queue_key(self, user: Optional[str], session: Optional[str]) -> str:
+        """排队与计算上限所用的标识：匿名调用（无用户或默认用户）按会话区分"""
+        if not user or user == self.default_user:
+            return f"session:{session}" if session else _ANONYMOUS_USER
+        return user
+
+    async def acquire(
+        self,
+        user: Optional[str],
+        interactive: bool,
+        cost: int,
+        session: Optional[str] = None,
+        speculative: bool = False,
+    ) -> Optional[SlotTicket]:
+        """
+        等待一个上游调用槽位，用完后必须调用 release
+
+        Args:
+            user: 用户标识
+            interactive: 是否为交互式流式调用
+            cost: 预估 token 数，用于用户间按 token 公平分配
+            session: 会话标识，匿名调用按会话区分
+            speculative: 是否为预取等推测性调用，按最低优先级放行
+
+        Returns:
+            槽位凭据，未启用调度时为 None
+
+        Raises:
+            SchedulerQueueTimeout: 排队超过配置的上限
+        """
+        if not self.enabled:
+            return None
+        ticket = SlotTicket(
+            self._queue_key(user, session),
+            interactive,
+            max(1, cost),
+            asyncio.get_running_loop(),
+            speculative,
+        )
+        with self._lock:
+            ring = self._ring(ticket)
+            queue = ring.get(ticket.user)
+            if queue is None:
+                queue = ring[ticket.user] = _UserQueue()
+            queue.tickets.append(ticket)
+            self._dispatch()
+            if ticket.granted:
+                return ticket
+            self._peak_queued = max(self._peak_queued, self._queued())
+
+        try:
+            await asyncio.wait_for(
+                asyncio.shield(ticket.future), self.max_wait_seconds
+            )
+        except BaseException as e:
+            with self._lock:
+                if ticket.granted:
+                    # 放行与取消同时发生，归还槽位
+                    self._release(ticket)
+                else:
+                    self._remove(ticket)
+                    if isinstance(e, asyncio.TimeoutError):
+                        self._timeouts += 1
+            if isinstance(e, asyncio.TimeoutError):
+                raise SchedulerQueueTimeout(
+                    f"等待 LLM 调用槽位超过 {self.max_wait_seconds}s"
+                ) from None
+            raise
+        return ticket
+
+    def speculative_headroom(self) -> Optional[int]:
+        """推测性调用还能占用的槽位数（已扣除排队中的推测性调用），未启用调度时为 None"""
+        if not self.enabled:
+            return None
+        with self._lock:
+            queued = sum(len(q.tickets) for q in self._speculative_ring.values())
+            return max(0, self.speculative_max_concurrent - self._speculative_in_flight - queued)
+
+    def release(self, ticket: Optional[SlotTicket]):
+        """归还槽位并放行下一个排队调用"""
+        if ticket is None:
+            return
+        with self._lock:
+            self._release(ticket)
+
+    def _release(self, ticket: SlotTicket):
+        """归还槽位（调用方持有锁）"""
+        if ticket.released:
+            return
+        self._return_slot(ticket)
+        self._dispatch()
+
+    def _ring(self, ticket: SlotTicket) -> "OrderedDict[str, _UserQueue]":
+        """调用所在的轮询环（调用方持有锁）"""
+        return self._speculative_ring if ticket.speculative else self._rings[ticket.interactive]
+
+    def _user_counts(self, ticket: SlotTicket) -> Dict[str, int]:
+        """调用计入的用户在途计数（调用方持有锁）"""
+        return self._speculative_user_in_flight if ticket.speculative else self._user_in_flight
+
+    def _return_slot(self, ticket: SlotTicket):
+        """扣减在途计数（调用方持有锁）"""
+        ticket.released = True
+        self._in_flight -= 1
+        if ticket.speculative:
+            self._speculative_in_flight -= 1
+        counts = self._user_counts(ticket)
+        remaining = counts.get(ticket.user, 1) - 1
+        if remaining > 0:
+            counts[ticket.user] = remaining
+        else:
+            counts.pop(ticket.user, None)
+
+    def _remove(self, ticket: SlotTicket):
+        """从队列中移除未放行的调用（调用方持有锁）"""
+        ring = self._ring(ticket)
+        queue = ring.get(ticket.user)
+        if queue is None:
+            return
+        try:
+            queue.tickets.remove(ticket)
+        except ValueError:
+            return
+        if not queue.tickets:
+            del ring[ticket.user]
+
+    def _queued(self) -> int:
+        """当前排队的调用数（调用方持有锁）"""
+        rings = (*self._rings.values(), self._speculative_ring)
+        return sum(len(queue.tickets) for ring in rings for queue in ring.values())
+
+    def _dispatch(self):
+        """在槽位允许的范围内放行排队调用（调用方持有锁）"""
+        while self._in_flight < self.max_concurrent:
+            # 流式调用优先，连续放行达到权重后让非流式调用先行一次
+            if self._interactive_streak >= self.interactive_weight:
+                order = (False, True)
+            else:
+                order = (True, False)
+            ticket = None
+            for interactive in order:
+                ticket = self._next_ticket(self._rings[interactive], self._user_in_flight)
+                if ticket is not None:
+                    break
+            if ticket is None:
+                # 没有其他调用排队时才放行推测性调用
+                if (
+                    self._rings[True]
+                    or self._rings[False]
+                    or self._speculative_in_flight >= self.speculative_max_concurrent
+                ):
+                    return
+                ticket = self._next_ticket(
+                    self._speculative_ring, self._speculative_user_in_flight
+                )
+                if ticket is None:
+                    return
+                self._grant(ticket)
+                continue
+            self._interactive_streak = (
+                self._interactive_streak + 1 if ticket.interactive else 0
+            )
+            self._grant(ticket)
+
+    def _next_ticket(
+        self, ring: "OrderedDict[str, _UserQueue]", user_in_flight: Dict[str, int]
+    ) -> Optional[SlotTicket]:
+        """
+        按差额轮询从环中取出下一个可放行的调用（调用方持有锁）
+
+        轮到的用户先获得一份额度，额度足以支付队首调用时放行并继续占有本轮，
+        不足时轮到下一个用户。已达到并发上限的用户本轮跳过。
+        """
+        capped = 0
+        while ring and capped < len(ring):
+            user, queue = next(iter(ring.items()))
+            if user_in_flight.get(user, 0) >= self.per_user_max_concurrent:
+                ring.move_to_end(user)
+                capped += 1
+                continue
+            capped = 0
+            ticket = queue.tickets[0]
+            if queue.deficit < ticket.cost:
+                queue.deficit += self.quantum
+                if queue.deficit < ticket.cost:
+                    ring.move_to_end(user)
+                    continue
+            queue.deficit -= ticket.cost
+            queue.tickets.popleft()
+            if not queue.tickets:
+                # 队列清空的用户离开轮询环，剩余额度作废
+                del ring[user]
+            elif queue.deficit < queue.tickets[0].cost:
+                ring.move_to_end(user)
+            return ticket
+        return None
+
+    def _grant(self, ticket: SlotTicket):
+        """放行调用并唤醒等待方（调用方持有锁）"""
+        ticket.granted = True
+        self._in_flight += 1
+        counts = self._user_counts(ticket)
+        counts[ticket.user] = counts.get(ticket.user, 0) + 1
+        if ticket.speculative:
+            self._speculative_in_flight += 1
+            self._granted_speculative += 1
+        else:
+            self._granted[ticket.interactive] += 1
+
+        waited = time.monotonic() - ticket.enqueued_at
+        if waited > 0.001:
+            self._queued_grants += 1
+            self._wait_seconds += waited
+            self._max_wait_seconds = max(self._max_wait_seconds, waited)
+
+        try:
+            ticket.loop.call_soon_threadsafe(_resolve, ticket.future)
+        except RuntimeError:
+            # 等待方的事件循环已关闭，槽位直接归还
+            self._return_slot(ticket)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取调度统计"""
+        with self._lock:
+            users: Dict[str, Dict[str, int]] = {}
+            for counts in (self._user_in_flight, self._speculative_user_in_flight):
+                for user, count in counts.items():
+                    users.setdefault(user, {"in_flight": 0, "queued": 0})["in_flight"] += count
+            for ring in (*self._rings.values(), self._speculative_ring):
+                for user, queue in ring.items():
+                    users.setdefault(user, {"in_flight": 0, "queued": 0})["queued"] += len(
+                        queue.tickets
+                    )
+            return {
+                "enabled": self.enabled,
+                "max_concurrent": self.max_concurrent,
+                "per_user_max_concurrent": self.per_user_max_concurrent,
+                "in_flight": self._in_flight,
+                "queued_interactive": sum(
+                    len(q.tickets) for q in self._rings[True].values()
+                ),
+                "queued_batch": sum(len(q.tickets) for q in self._rings[False].values()),
+                "queued_speculative": sum(
+                    len(q.tickets) for q in self._speculative_ring.values()
+                ),
+                "peak_queued": self._peak_queued,
+                "granted_interactive": self._granted[True],
+                "granted_batch": self._granted[False],
+                "granted_speculative": self._granted_speculative,
+                "speculative_in_flight": self._speculative_in_flight,
+                "speculative_max_concurrent": self.speculative_max_concurrent,
+                "queue_timeouts": self._timeouts,
+                "avg_queue_wait_ms": (
+                    round(self._wait_seconds / self._queued_grants * 1000, 1)
+                    if self._queued_grants
+                    else 0.0
+                ),
+                "max_queue_wait_ms": round(self._max_wait_seconds * 1000, 1),
+                "active_users": users,
+            }
+
+
+def _resolve(future: asyncio.Future):
+    """在等待方的事件循环上标记放行"""
+    if not future.done():
+        future.set_result(None)
@@ -0,0 +1,107 @@
+"""
+首字延迟对冲
+
+流式请求在对冲延迟内没有收到首个增量时，向其他端点（或备用模型）再发一次相同请求，
+先产出首个增量者胜出，另一个被取消。对冲延迟取近期首字延迟的分位数，
+额外请求受全局预算约束，占比不超过配置的比例。
+"""
+
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+from backend.config.settings import settings
+
+# 预算最多累积的对冲次数，避免长时间空闲后集中突发
+_MAX_BUDGET_TOKENS = 10.0
+
+
+class HedgePolicy:
+    """对冲延迟估计与预算控制"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        percentile: float = 0.95,
+        min_delay_ms: float = 500,
+        max_delay_ms: float = 10000,
+        budget_ratio: float = 0.05,
+        model: Optional[str] = None,
+        window: int = 200,
+        min_samples: int = 20,
+    ):
+        self.enabled = enabled
+        self.percentile = percentile
+        self.min_delay = min_delay_ms / 1000
+        self.max_delay = max_delay_ms / 1000
+        self.budget_ratio = budget_ratio
+        self.model = model  # 对冲请求使用的模型，None 表示与原请求相同
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self._budget = 1.0
+        self._requests = 0
+        self._hedges = 0
+        self._hedge_wins = 0
+        self._budget_denied = 0
+
+    @classmethod
+    def from_settings(cls) -> "HedgePolicy":
+        """根据全局配置创建对冲策略"""
+        return cls(
+            enabled=settings.llm_hedge_enabled,
+            percentile=settings.llm_hedge_percentile,
+            min_delay_ms=settings.llm_hedge_min_delay_ms,
+            max_delay_ms=settings.llm_hedge_max_delay_ms,
+            budget_ratio=settings.llm_hedge_budget_ratio,
+            model=settings.llm_hedge_model,
+        )
+
+    def delay(self) -> float:
+        """当前对冲延迟（秒）：近期首字延迟的分位数，样本不足时取上限"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return self.max_delay
+            ordered = sorted(self._samples)
+        index = min(int(len(ordered) * self.percentile), len(ordered) - 1)
+        return min(max(ordered[index], self.min_delay), self.max_delay)
+
+    def record_request(self):
+        """记录一次流式请求，按预算比例累积对冲额度"""
+        with self._lock:
+            self._requests += 1
+            self._budget = min(self._budget + self.budget_ratio, _MAX_BUDGET_TOKENS)
+
+    def try_acquire(self) -> bool:
+        """申请一次对冲额度"""
+        with self._lock:
+            if self._budget >= 1.0:
+                self._budget -= 1.0
+                self._hedges += 1
+                return True
+            self._budget_denied += 1
+            return False
+
+    def record_first_chunk(self, seconds: float, hedge_won: bool):
+        """记录用户感知的首字延迟（从原请求发出算起）以及胜出方"""
+        with self._lock:
+            self._samples.append(seconds)
+            if hedge_won:
+                self._hedge_wins += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取对冲统计"""
+        delay = self.delay()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "delay_ms": round(delay * 1000, 1),
+                "samples": len(self._samples),
+                "requests": self._requests,
+                "hedges": self._hedges,
+                "hedge_wins": self._hedge_wins,
+                "budget_denied": self._budget_denied,
+                "hedge_ratio": (
+                    round(self._hedges / self._requests, 4) if self._requests else 0.0
+                ),
+            }
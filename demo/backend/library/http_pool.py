@@ -0,0 +1,161 @@
+"""
+LLM 上游 HTTP 连接池
+
+所有 LLM 调用共用一套可配置的连接池（连接数上限、keep-alive 过期时间），
+突发流量下复用已建立的连接，避免反复 TLS 握手。
+传输层记录在途请求数、等待连接的时长以及新建/复用连接次数。
+"""
+
+import threading
+import time
+from typing import Any, AsyncIterator, Dict
+
+from openai import DefaultAsyncHttpxClient
+
+# 传输层必须与 openai 使用同一个 HTTP 库：新版 openai 基于 httpx2，旧版基于 httpx
+try:
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+
+from backend.config.settings import settings
+
+
+class HTTPPoolMetrics:
+    """连接池使用统计"""
+
+    def __init__(self, max_connections: int):
+        self.max_connections = max_connections
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._peak_in_flight = 0
+        self._requests = 0
+        self._connections_opened = 0
+        self._connections_reused = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+
+    def request_started(self):
+        """记录一次请求开始占用连接"""
+        with self._lock:
+            self._requests += 1
+            self._in_flight += 1
+            self._peak_in_flight = max(self._peak_in_flight, self._in_flight)
+
+    def request_finished(self):
+        """记录一次请求释放连接"""
+        with self._lock:
+            self._in_flight -= 1
+
+    def connection_acquired(self, wait_seconds: float, reused: bool):
+        """记录一次拿到连接，wait_seconds 为从发起请求到拿到连接的时长"""
+        with self._lock:
+            if reused:
+                self._connections_reused += 1
+            else:
+                self._connections_opened += 1
+            self._wait_seconds += wait_seconds
+            self._max_wait_seconds = max(self._max_wait_seconds, wait_seconds)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取连接池统计"""
+        with self._lock:
+            acquired = self._connections_opened + self._connections_reused
+            return {
+                "max_connections": self.max_connections,
+                "in_flight": self._in_flight,
+                "peak_in_flight": self._peak_in_flight,
+                "utilization": (
+                    round(self._in_flight / self.max_connections, 4)
+                    if self.max_connections
+                    else 0.0
+                ),
+                "requests": self._requests,
+                "connections_opened": self._connections_opened,
+                "connections_reused": self._connections_reused,
+                "avg_wait_ms": (
+                    round(self._wait_seconds / acquired * 1000, 2) if acquired else 0.0
+                ),
+                "max_wait_ms": round(self._max_wait_seconds * 1000, 2),
+            }
+
+
+class _MeteredByteStream(httpx.AsyncByteStream):
+    """响应体读取结束（或被关闭）时才释放在途计数，流式响应期间连接仍被占用"""
+
+    def __init__(self, stream: httpx.AsyncByteStream, metrics: HTTPPoolMetrics):
+        self._stream = stream
+        self._metrics = metrics
+        self._closed = False
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        if not self._closed:
+            self._closed = True
+            self._metrics.request_finished()
+        await self._stream.aclose()
+
+
+class _MeteredTransport(httpx.AsyncHTTPTransport):
+    """记录连接获取情况的传输层"""
+
+    def __init__(self, metrics: HTTPPoolMetrics, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._metrics = metrics
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        """发送请求，通过 httpcore 的 trace 事件判断连接是新建还是复用"""
+        started = time.monotonic()
+        acquired = False
+        upstream_trace = request.extensions.get("trace")
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            # 拿到连接后的第一个事件：新建连接以 connect_tcp 开始，复用连接直接发送请求头
+            nonlocal acquired
+            if not acquired and (
+                event_name == "connection.connect_tcp.started"
+                or event_name.endswith(".send_request_headers.started")
+            ):
+                acquired = True
+                self._metrics.connection_acquired(
+                    time.monotonic() - started,
+                    reused=not event_name.startswith("connection."),
+                )
+            if upstream_trace is not None:
+                await upstream_trace(event_name, info)
+
+        request.extensions["trace"] = trace
+        self._metrics.request_started()
+        try:
+            response = await super().handle_async_request(request)
+        except BaseException:
+            self._metrics.request_finished()
+            raise
+        response.stream = _MeteredByteStream(response.stream, self._metrics)
+        return response
+
+
+def create_http_client(metrics: HTTPPoolMetrics) -> httpx.AsyncClient:
+    """按配置创建带统计的 HTTP 客户端"""
+    limits = httpx.Limits(
+        max_connections=settings.llm_pool_max_connections,
+        max_keepalive_connections=settings.llm_pool_max_keepalive_connections,
+        keepalive_expiry=settings.llm_pool_keepalive_expiry,
+    )
+    return DefaultAsyncHttpxClient(
+        transport=_MeteredTransport(metrics, limits=limits),
+        timeout=create_timeout(),
+    )
+
+
+def create_timeout() -> httpx.Timeout:
+    """按配置创建超时设置"""
+    return httpx.Timeout(
+        connect=settings.llm_connect_timeout,
+        read=settings.llm_read_timeout,
+        write=settings.llm_write_timeout,
+        pool=settings.llm_pool_timeout,
+    )
@@ -0,0 +1,149 @@
+"""
+交互块输入的本地快速校验
+
+按钮类交互的输入绝大多数就是点击的某个按钮。MarkdownFlow 的校验每次都要重新解析块内容，
+异步接口还要为此切换到线程；精确匹配失败的输入（如大小写、全角半角不同）在纯按钮交互中
+会走错误渲染，开启文本校验时在按钮+文本交互中会走 LLM 校验，各多一次 LLM 调用。
+这里用缓存的选项解析结果在本地完成精确匹配和归一化匹配并直接提取变量，
+只有确实需要 LLM 判断的自由文本和无效输入才交给 MarkdownFlow。
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from markdown_flow import InteractionType
+from markdown_flow.llm import LLMResult
+
+from backend.config.settings import settings
+from backend.library.interaction_options import parse_interaction_options
+
+# 只能从按钮中选择的交互类型，无效输入由 MarkdownFlow 调用 LLM 渲染错误提示
+_BUTTON_ONLY_TYPES = (InteractionType.BUTTONS_ONLY, InteractionType.BUTTONS_MULTI_SELECT)
+# 按钮之外还允许自定义文本的交互类型
+_BUTTON_TEXT_TYPES = (InteractionType.BUTTONS_WITH_TEXT, InteractionType.BUTTONS_MULTI_WITH_TEXT)
+
+
+class InteractionFastPath:
+    """交互块输入的本地校验"""
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._validations = 0
+        self._local = 0
+        self._normalized = 0
+        self._fallbacks = 0
+        self._llm_calls_avoided = 0
+        self._local_seconds = 0.0
+
+    @classmethod
+    def from_settings(cls) -> "InteractionFastPath":
+        """根据全局配置创建快速校验"""
+        return cls(enabled=settings.interaction_fast_path_enabled)
+
+    def validate(
+        self,
+        block,
+        variables: Optional[Dict[str, str]],
+        user_input: Optional[Dict[str, List[str]]],
+        text_validation: bool = False,
+    ) -> Optional[LLMResult]:
+        """
+        在本地校验交互块的用户输入
+
+        Args:
+            block: 交互块
+            variables: 变量映射，与 MarkdownFlow 一致先替换块内容中的变量
+            user_input: 用户输入
+            text_validation: MarkdownFlow 是否开启了自定义文本的 LLM 校验
+
+        Returns:
+            校验通过时返回与 MarkdownFlow 相同的结果（content 为空，variables 为提取的变量），
+            需要交给 MarkdownFlow 处理时返回 None
+        """
+        if not self.enabled:
+            return None
+        start = time.perf_counter()
+        result, llm_avoided, normalized = self._validate(
+            block, variables, user_input, text_validation
+        )
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self._validations += 1
+            if result is None:
+                self._fallbacks += 1
+            else:
+                self._local += 1
+                self._normalized += normalized
+                self._llm_calls_avoided += llm_avoided
+                self._local_seconds += elapsed
+        return result
+
+    def _validate(
+        self,
+        block,
+        variables: Optional[Dict[str, str]],
+        user_input: Optional[Dict[str, List[str]]],
+        text_validation: bool,
+    ):
+        """返回 (校验结果, 是否省去了一次 LLM 调用, 归一化匹配数)"""
+        # 空输入由 MarkdownFlow 渲染错误提示
+        if not user_input or not any(values for values in user_input.values()):
+            return None, False, 0
+        options = parse_interaction_options(block.content, variables)
+        if options is None:
+            return None, False, 0
+
+        interaction_type = options.interaction_type
+        if interaction_type == InteractionType.NON_ASSIGNMENT_BUTTON:
+            # 展示型按钮不赋值，任意输入都完成交互
+            return LLMResult(content="", variables={}), False, 0
+
+        # 与 MarkdownFlow 一致，目标变量取块变量列表的第一个
+        target_variable = block.variables[0] if block.variables else "user_input"
+        values = user_input.get(target_variable, [])
+        matched, unmatched, normalized = options.match(values)
+
+        if interaction_type in _BUTTON_ONLY_TYPES:
+            if not values or unmatched:
+                return None, False, 0
+            # 归一化才匹配上的输入，MarkdownFlow 会当作无效选项调用 LLM 渲染错误
+            return (
+                LLMResult(content="", variables={target_variable: matched}),
+                normalized > 0,
+                normalized,
+            )
+
+        if interaction_type in _BUTTON_TEXT_TYPES:
+            if unmatched and text_validation:
+                # 自定义文本需要 LLM 判断
+                return None, False, 0
+            return (
+                LLMResult(content="", variables={target_variable: matched + unmatched}),
+                normalized > 0 and text_validation,
+                normalized,
+            )
+
+        # 纯文本输入：未开启文本校验时 MarkdownFlow 也原样接受
+        if values and not text_validation:
+            return LLMResult(content="", variables={target_variable: values}), False, 0
+        return None, False, 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取快速校验统计"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "validations": self._validations,
+                "resolved_locally": self._local,
+                "normalized_matches": self._normalized,
+                "fallbacks": self._fallbacks,
+                "llm_calls_avoided": self._llm_calls_avoided,
+                "local_hit_ratio": (
+                    round(self._local / self._validations, 4) if self._validations else 0.0
+                ),
+                "avg_local_us": (
+                    round(self._local_seconds / self._local * 1e6, 1) if self._local else 0.0
+                ),
+            }
@@ -0,0 +1,119 @@
+"""
+交互块选项解析
+
+交互块的格式在文档生命周期内不变，解析结果按（变量替换后的）块内容缓存，
+同一交互块的渲染、分支预取和输入处理只解析一次。
+"""
+
+import unicodedata
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from markdown_flow import InteractionParser, InteractionType, replace_variables_in_text
+
+# 可以只靠点击按钮完成的交互类型（单选）
+_SINGLE_CLICK_TYPES = (InteractionType.BUTTONS_ONLY, InteractionType.BUTTONS_WITH_TEXT)
+
+
+@dataclass(frozen=True)
+class InteractionOptions:
+    """交互块的结构化选项"""
+
+    interaction_type: InteractionType
+    variable: Optional[str]  # 目标变量，展示型按钮为 None
+    buttons: Tuple[Tuple[str, str], ...]  # (显示文本, 取值)
+    question: Optional[str] = None  # 文本输入的提示
+    # 显示文本/取值 -> 按钮取值，与 MarkdownFlow 一致同名时取第一个按钮
+    exact_index: Dict[str, str] = field(default_factory=dict, compare=False, repr=False)
+    # 归一化文本 -> 按钮取值，归一化后对应多个按钮时为 None
+    normalized_index: Dict[str, Optional[str]] = field(
+        default_factory=dict, compare=False, repr=False
+    )
+
+    @property
+    def values(self) -> List[str]:
+        """各按钮的取值"""
+        return [value for _, value in self.buttons]
+
+    @property
+    def is_single_click(self) -> bool:
+        """是否为可点击按钮单选的赋值交互"""
+        return (
+            self.variable is not None
+            and bool(self.buttons)
+            and self.interaction_type in _SINGLE_CLICK_TYPES
+        )
+
+    def match(self, values: List[str]) -> Tuple[List[str], List[str], int]:
+        """
+        将用户输入匹配到按钮
+
+        先按显示文本或取值精确匹配，再按归一化后的文本匹配。
+
+        Returns:
+            (匹配到的按钮取值, 未匹配的输入, 其中靠归一化才匹配上的个数)
+        """
+        matched, unmatched, normalized = [], [], 0
+        for value in values:
+            button_value = self.exact_index.get(value)
+            if button_value is None:
+                button_value = self.normalized_index.get(normalize_option_text(value))
+                normalized += button_value is not None
+            if button_value is None:
+                unmatched.append(value)
+            else:
+                matched.append(button_value)
+        return matched, unmatched, normalized
+
+
+def normalize_option_text(text: str) -> str:
+    """归一化选项文本：全角转半角、忽略大小写、合并空白"""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+@lru_cache(maxsize=4096)
+def _parse(content: str) -> Optional[InteractionOptions]:
+    """解析变量替换后的交互块内容"""
+    result = InteractionParser().parse(content)
+    if "error" in result or result.get("type") is None:
+        return None
+    buttons = tuple(
+        (button.get("display", ""), button.get("value", ""))
+        for button in result.get("buttons", [])
+    )
+    exact_index: Dict[str, str] = {}
+    normalized_index: Dict[str, Optional[str]] = {}
+    for display, value in buttons:
+        for text in (display, value):
+            exact_index.setdefault(text, value)
+            key = normalize_option_text(text)
+            if not key:
+                continue
+            if normalized_index.get(key, value) != value:
+                normalized_index[key] = None
+            else:
+                normalized_index[key] = value
+    return InteractionOptions(
+        interaction_type=result["type"],
+        variable=result.get("variable"),
+        buttons=buttons,
+        question=result.get("question"),
+        exact_index=exact_index,
+        normalized_index=normalized_index,
+    )
+
+
+def parse_interaction_options(
+    content: str, variables: Optional[Dict[str, str]] = None
+) -> Optional[InteractionOptions]:
+    """
+    解析交互块的选项
+
+    与 MarkdownFlow 一致，先替换块内容中的变量再解析。
+
+    Returns:
+        解析结果，块内容不是合法的交互格式时为 None
+    """
+    # replace_variables_in_text 会改写传入的字典，传副本
+    return _parse(replace_variables_in_text(content, dict(variables or {})))
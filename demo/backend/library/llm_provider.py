@@ -2,17 +2,203 @@
 PlaygroundLLMProvider - 基于现有 LLMClient 的适配器
 """
 
+import asyncio
+import concurrent.futures
 import json
 import logging
-from typing import Any, Dict, Generator, List, Optional
+import threading
+import time
+from collections import deque
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Any, AsyncGenerator, Coroutine, Dict, Generator, List, Optional
 
 from markdown_flow import LLMProvider
 from markdown_flow.llm import LLMResult
 
+from backend.config.settings import settings
+
+from backend.utils.tokens import estimate_message_tokens
+
+from .backpressure import BackpressureMeter
+from .context_budget import ContextBudgeter
 from .llmclient import LLMClient
+from .response_cache import make_cache_key
 
 logger = logging.getLogger(__name__)
 
+# 流式交接通道的结束标记
+_STREAM_END = object()
+
+# Strict system guard
+_STRICT_GUARD = {
+    "role": "system",
+    "content": "严格遵循以上系统提示词与文档提示词，不增删改含义，不改变顺序；全部用简体中文；不要引导下一步或提出附加问题；仅按步骤输出。",
+}
+
+
+class LLMIOLoop:
+    """
+    常驻后台 I/O 事件循环
+
+    同步的 complete/stream 调用都把协程提交到这个循环执行，
+    共享的 AsyncOpenAI 客户端始终由同一个循环驱动，连接得以复用。
+    """
+
+    def __init__(self, name: str = "llm-io-loop"):
+        self._name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """获取事件循环，首次访问时启动后台线程"""
+        if self._loop is None:
+            with self._lock:
+                if self._loop is None:
+                    self._start()
+        return self._loop
+
+    def _start(self):
+        """启动后台线程并等待事件循环就绪"""
+        loop = asyncio.new_event_loop()
+        ready = threading.Event()
+
+        def run_forever():
+            asyncio.set_event_loop(loop)
+            loop.call_soon(ready.set)
+            loop.run_forever()
+
+        thread = threading.Thread(target=run_forever, name=self._name, daemon=True)
+        thread.start()
+        ready.wait()
+        self._thread = thread
+        self._loop = loop
+
+    def in_loop_thread(self) -> bool:
+        """当前线程是否就是 I/O 循环线程"""
+        return self._thread is not None and threading.current_thread() is self._thread
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """提交协程到 I/O 循环，返回线程安全的 Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """提交协程并阻塞等待结果"""
+        if self.in_loop_thread():
+            coro.close()
+            raise RuntimeError("不能在 LLM I/O 循环线程内同步等待协程")
+        return self.submit(coro).result(timeout)
+
+    def stop(self):
+        """停止事件循环并回收后台线程"""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = None
+            self._thread = None
+        if loop is None:
+            return
+        loop.call_soon_threadsafe(loop.stop)
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5)
+        loop.close()
+
+
+class _StreamChannel:
+    """
+    有界的跨线程交接通道
+
+    生产者在 I/O 循环上 await put，缓冲区满时挂起而不阻塞循环；
+    消费者在同步线程中阻塞 get。
+    """
+
+    def __init__(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        maxsize: int,
+        meter: Optional[BackpressureMeter] = None,
+    ):
+        self._loop = loop
+        self._maxsize = max(1, maxsize)
+        self._meter = meter
+        self._items: deque = deque()
+        self._cond = threading.Condition()
+        self._space = asyncio.Event()
+        self._producer_waiting = False
+        self._closed = False
+
+    async def put(self, item: Any) -> bool:
+        """放入一个元素，消费端已关闭时返回 False"""
+        while True:
+            with self._cond:
+                if self._closed:
+                    return False
+                if len(self._items) < self._maxsize:
+                    self._items.append(item)
+                    self._cond.notify()
+                    return True
+                self._space.clear()
+                self._producer_waiting = True
+            started = time.monotonic()
+            await self._space.wait()
+            if self._meter is not None:
+                self._meter.record_wait(time.monotonic() - started)
+
+    def get(self) -> Any:
+        """阻塞取出一个元素"""
+        with self._cond:
+            while not self._items:
+                self._cond.wait()
+            item = self._items.popleft()
+            wake_producer = self._producer_waiting
+            self._producer_waiting = False
+        if wake_producer:
+            self._loop.call_soon_threadsafe(self._space.set)
+        return item
+
+    def close(self):
+        """关闭通道并唤醒可能挂起的生产者"""
+        with self._cond:
+            self._closed = True
+            self._items.clear()
+        try:
+            self._loop.call_soon_threadsafe(self._space.set)
+        except RuntimeError:
+            # 事件循环已关闭
+            pass
+
+
+_llm_io_loop = LLMIOLoop()
+
+# 同步流式交接通道的背压统计
+_stream_channel_meter = BackpressureMeter(settings.llm_stream_queue_size)
+
+
+def get_stream_channel_stats() -> Dict[str, Any]:
+    """获取同步流式交接通道的背压统计"""
+    return _stream_channel_meter.get_stats()
+
+
+# 调用前按模型预算裁剪对话历史，严格约束消息由 _prepare_call 追加，预先扣除其占用
+_context_budgeter = ContextBudgeter.from_settings()
+_STRICT_GUARD_TOKENS = estimate_message_tokens([_STRICT_GUARD])
+
+
+def get_context_budget_stats() -> Dict[str, Any]:
+    """获取上下文预算裁剪统计"""
+    return _context_budgeter.get_stats()
+
+
+def get_llm_io_loop() -> LLMIOLoop:
+    """获取进程内共享的 LLM I/O 循环"""
+    return _llm_io_loop
+
+
+def shutdown_llm_io_loop():
+    """停止共享的 LLM I/O 循环"""
+    _llm_io_loop.stop()
+
 
 class PlaygroundLLMProvider(LLMProvider):
     """
@@ -41,6 +227,9 @@ class PlaygroundLLMProvider(LLMProvider):
         self.default_temperature = temperature  # provider 级别的默认温度
         self.variables = None  # 存储当前请求的 variables
         self.user_input = None  # 存储当前请求的 user_input
+        self.usage_document = None  # token 用量统计中的文档标识
+        self.block_index = None  # token 用量统计中的文档块序号
+        self.last_cache_status = None  # 最近一次非流式调用的响应缓存状态
 
     def set_session_id(self, session_id: Optional[str]):
         """设置当前请求的会话ID"""
@@ -62,15 +251,66 @@ class PlaygroundLLMProvider(LLMProvider):
         """设置当前请求的 user_input"""
         self.user_input = user_input
 
+    def set_usage_scope(self, document: Optional[str], block_index: Optional[int]):
+        """设置 token 用量统计归属的文档和文档块"""
+        self.usage_document = document
+        self.block_index = block_index
+
     def _build_metadata(self) -> Optional[Dict[str, Any]]:
-        """构建 metadata，包含 variables 和 user_input"""
+        """构建 metadata，包含 variables、user_input 和用量统计归属"""
         metadata = {}
         if self.variables:
             metadata["variables"] = self.variables
         if self.user_input:
             metadata["user_input"] = self.user_input
+        if self.usage_document is not None:
+            metadata["document"] = self.usage_document
+            metadata["block_index"] = self.block_index
         return metadata if metadata else None
 
+    def _prepare_call(
+        self,
+        messages: List[Dict[str, str]],
+        model: str | None = None,
+        temperature: float | None = None,
+    ) -> Dict[str, Any]:
+        """
+        构建 LLMClient 调用参数
+
+        最后一条消息作为主要消息，其余作为上下文，并在上下文前加上严格约束的系统消息。
+        超出模型上下文预算时先丢弃最早的历史轮次。
+
+        Raises:
+            ValueError: 当消息列表为空时
+        """
+        if not messages:
+            raise ValueError("消息列表不能为空")
+
+        # 使用实例级别覆盖，优先级：参数 > provider 默认值
+        effective_model = model if model is not None else self.default_model
+        effective_temperature = temperature if temperature is not None else self.default_temperature
+
+        messages = _context_budgeter.trim(
+            messages, effective_model, reserved_tokens=_STRICT_GUARD_TOKENS
+        )
+
+        # 分离上下文和主要消息
+        context = messages[:-1] if len(messages) > 1 else None
+        main_message = messages[-1]["content"]
+
+        context = ([_STRICT_GUARD] + context) if context else [_STRICT_GUARD]
+
+        return {
+            "message": main_message,
+            "model": effective_model,
+            "temperature": effective_temperature,
+            "session_id": self.session_id,
+            "trace_id": self.trace_id,
+            "user_id": self.user_id,
+            "context": context,
+            "metadata": self._build_metadata(),
+        }
+
     def complete(
         self,
         messages: List[Dict[str, str]],
@@ -93,76 +333,17 @@ class PlaygroundLLMProvider(LLMProvider):
         Raises:
             ValueError: 当 LLM 调用失败时
         """
-        if not messages:
-            raise ValueError("消息列表不能为空")
-
-        # 分离上下文和主要消息
-        # 最后一个消息作为主要消息，其他作为上下文
-        context = messages[:-1] if len(messages) > 1 else None
-        main_message = messages[-1]["content"]
-
-        # 使用实例级别覆盖，优先级：参数 > provider 默认值
-        effective_model = model if model is not None else self.default_model
-        effective_temperature = temperature if temperature is not None else self.default_temperature
-
-        # Build metadata
-        metadata = self._build_metadata()
-
-        # Strict system guard
-        strict_guard = {
-            "role": "system",
-            "content": "严格遵循以上系统提示词与文档提示词，不增删改含义，不改变顺序；全部用简体中文；不要引导下一步或提出附加问题；仅按步骤输出。"
-        }
-        context = ([strict_guard] + context) if context else [strict_guard]
-
-        # 同步包装异步调用
-        import asyncio
+        call_args = self._prepare_call(messages, model, temperature)
 
         try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-
-        try:
-            if loop.is_running():
-                # 如果已经在事件循环中，使用线程池
-                import concurrent.futures
-
-                with concurrent.futures.ThreadPoolExecutor() as executor:
-                    future = executor.submit(
-                        lambda: asyncio.run(
-                            self.llm_client.chat_completion(
-                                message=main_message,
-                                model=effective_model,
-                                temperature=effective_temperature,
-                                session_id=self.session_id,
-                                trace_id=self.trace_id,
-                                user_id=self.user_id,
-                                context=context,
-                                tools=tools,
-                                metadata=metadata,
-                            )
-                        )
-                    )
-                    result = future.result()
-            else:
-                result = loop.run_until_complete(
-                    self.llm_client.chat_completion(
-                        message=main_message,
-                        model=effective_model,
-                        temperature=effective_temperature,
-                        session_id=self.session_id,
-                        trace_id=self.trace_id,
-                        user_id=self.user_id,
-                        context=context,
-                        tools=tools,
-                        metadata=metadata,
-                    )
-                )
+            # 提交到常驻 I/O 循环执行，避免每次调用新建线程池和事件循环
+            result = get_llm_io_loop().run(
+                self.llm_client.chat_completion(**call_args, tools=tools)
+            )
 
             if result and result.get("success"):
                 response_content = result["response"]
+                self.last_cache_status = result.get("cache_status")
 
                 # 检查是否有 Function Calling 响应
                 if tools and "tool_calls" in result:
@@ -192,17 +373,14 @@ class PlaygroundLLMProvider(LLMProvider):
                     content=response_content,
                     transformed_to_interaction=False,
                     prompt=self._messages_to_prompt(messages),
+                    metadata={"cache_status": self.last_cache_status},
                 )
             else:
                 error_msg = result.get("error", "未知错误") if result else "LLM调用失败"
                 raise ValueError(f"LLM 调用失败: {error_msg}")
 
         except Exception as e:
-            # 如果是 Function Calling 失败，回退到普通模式
-            if tools and "Function Calling" not in str(e):
-                logger.warning(f"Function Calling 失败，回退到普通模式: {e}")
-                return self.complete(messages)  # 递归调用，不带 tools
-
+            # 模型不支持工具调用时 LLMClient 已改为普通模式并记住该模型，这里不再整体重试
             if isinstance(e, ValueError):
                 raise
             raise ValueError(f"LLM 调用异常: {str(e)}")
@@ -227,123 +405,53 @@ class PlaygroundLLMProvider(LLMProvider):
         Raises:
             ValueError: 当 LLM 调用失败时
         """
-        if not messages:
-            raise ValueError("消息列表不能为空")
-
-        # 分离上下文和主要消息
-        context = messages[:-1] if len(messages) > 1 else None
-        main_message = messages[-1]["content"]
-
-        # 使用实例级别覆盖，优先级：参数 > provider 默认值
-        effective_model = model if model is not None else self.default_model
-        effective_temperature = temperature if temperature is not None else self.default_temperature
-
-        # Build metadata
-        metadata = self._build_metadata()
-
-        # Strict system guard
-        strict_guard = {
-            "role": "system",
-            "content": "严格遵循以上系统提示词与文档提示词，不增删改含义，不改变顺序；全部用简体中文；不要引导下一步或提出附加问题；仅按步骤输出。"
-        }
-        context = ([strict_guard] + context) if context else [strict_guard]
-
-        # 同步包装异步生成器
-        import asyncio
-
-        try:
-            loop = asyncio.get_event_loop()
-        except RuntimeError:
-            loop = asyncio.new_event_loop()
-            asyncio.set_event_loop(loop)
-
-        try:
-            if loop.is_running():
-                # 如果已经在事件循环中，使用线程和队列
-                import queue
-                import threading
-
-                result_queue = queue.Queue()
-                exception_queue = queue.Queue()
-
-                def run_async_stream():
-                    try:
-                        new_loop = asyncio.new_event_loop()
-                        asyncio.set_event_loop(new_loop)
-
-                        async def collect_stream():
-                            async for chunk in self.llm_client.chat_completion_sse(
-                                message=main_message,
-                                model=effective_model,
-                                temperature=effective_temperature,
-                                session_id=self.session_id,
-                                trace_id=self.trace_id,
-                                user_id=self.user_id,
-                                context=context,
-                                metadata=metadata,
-                            ):
-                                if chunk.get("success") and "delta" in chunk:
-                                    result_queue.put(chunk["delta"])
-                                elif not chunk.get("success"):
-                                    error_msg = chunk.get("error", "流式调用失败")
-                                    exception_queue.put(
-                                        ValueError(f"LLM 流式调用失败: {error_msg}")
-                                    )
-                                    result_queue.put(None)
-                                    break
-                            result_queue.put(None)  # 结束标记
-
-                        new_loop.run_until_complete(collect_stream())
-                        new_loop.close()
-                    except Exception as e:
-                        exception_queue.put(e)
-                        result_queue.put(None)
-                        return
-
-                thread = threading.Thread(target=run_async_stream)
-                thread.start()
-
-                while True:
-                    if not exception_queue.empty():
-                        raise exception_queue.get()
-
-                    item = result_queue.get()
-                    if item is None:
-                        break
-                    yield item
-
-                thread.join()
-            else:
-                # 如果没有运行的事件循环
-                async def async_generator():
-                    async for chunk in self.llm_client.chat_completion_sse(
-                        message=main_message,
-                        model=effective_model,
-                        temperature=effective_temperature,
-                        session_id=self.session_id,
-                        trace_id=self.trace_id,
-                        user_id=self.user_id,
-                        context=context,
-                        metadata=metadata,
-                    ):
+        call_args = self._prepare_call(messages, model, temperature)
+
+        io_loop = get_llm_io_loop()
+        channel = _StreamChannel(
+            io_loop.loop, settings.llm_stream_queue_size, meter=_stream_channel_meter
+        )
+
+        async def produce():
+            try:
+                # aclosing 保证提前退出时上游流式响应被立即关闭
+                async with aclosing(
+                    self.llm_client.chat_completion_sse(**call_args)
+                ) as chunks:
+                    async for chunk in chunks:
                         if chunk.get("success") and "delta" in chunk:
-                            yield chunk["delta"]
+                            if not await channel.put(chunk["delta"]):
+                                # 消费端已关闭，停止拉取
+                                return
                         elif not chunk.get("success"):
                             error_msg = chunk.get("error", "流式调用失败")
-                            raise ValueError(f"LLM 流式调用失败: {error_msg}")
+                            await channel.put(
+                                ValueError(f"LLM 流式调用失败: {error_msg}")
+                            )
+                            return
+            except Exception as e:
+                await channel.put(e)
+                return
+            await channel.put(_STREAM_END)  # 结束标记
 
-                gen = async_generator()
-                while True:
-                    try:
-                        item = loop.run_until_complete(gen.__anext__())
-                        yield item
-                    except StopAsyncIteration:
-                        break
+        # 生产者在 I/O 循环上运行，当前线程只做有界队列的 get
+        future = io_loop.submit(produce())
 
-        except Exception as e:
-            if isinstance(e, ValueError):
-                raise
-            raise ValueError(f"LLM 流式调用异常: {str(e)}")
+        try:
+            while True:
+                item = channel.get()
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, Exception):
+                    if isinstance(item, ValueError):
+                        raise item
+                    raise ValueError(f"LLM 流式调用异常: {str(item)}")
+                yield item
+        finally:
+            # 正常结束或消费端提前退出时释放生产者
+            channel.close()
+            if not future.done():
+                future.cancel()
 
     def _messages_to_prompt(self, messages: List[Dict[str, str]]) -> str:
         """将消息列表转换为提示词字符串"""
@@ -358,3 +466,138 @@ class PlaygroundLLMProvider(LLMProvider):
             elif role == "assistant":
                 prompt_parts.append(f"Assistant: {content}")
         return "\n\n".join(prompt_parts)
+
+
+@dataclass
+class DeferredLLMCall:
+    """
+    被推迟的 LLM 调用
+
+    MarkdownFlow 只负责构建消息，真正的网络请求由调用方在事件循环中 await 执行。
+    """
+
+    messages: List[Dict[str, str]]
+    model: Optional[str] = None
+    temperature: Optional[float] = None
+
+
+class AsyncPlaygroundLLMProvider(PlaygroundLLMProvider):
+    """
+    PlaygroundLLMProvider 的异步适配器
+
+    开启 defer_calls 后，complete/stream 不发起请求，而是返回 DeferredLLMCall，
+    由服务层通过 acomplete/astream 直接在当前事件循环上调用 LLMClient，无需线程中转。
+    """
+
+    def __init__(
+        self,
+        llm_client: Optional[LLMClient] = None,
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+    ):
+        super().__init__(llm_client=llm_client, model=model, temperature=temperature)
+        self.defer_calls = False  # 是否推迟 LLM 调用
+
+    def complete(
+        self,
+        messages: List[Dict[str, str]],
+        model: str | None = None,
+        temperature: float | None = None,
+        tools: List[Dict[str, Any]] | None = None,
+    ):
+        """推迟模式下返回 DeferredLLMCall，否则走同步调用"""
+        if self.defer_calls and not tools:
+            return DeferredLLMCall(messages=messages, model=model, temperature=temperature)
+        return super().complete(messages, model=model, temperature=temperature, tools=tools)
+
+    def stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str | None = None,
+        temperature: float | None = None,
+    ) -> Generator[Any, None, None]:
+        """推迟模式下只产出一个 DeferredLLMCall，否则走同步流式调用"""
+        if self.defer_calls:
+            yield DeferredLLMCall(messages=messages, model=model, temperature=temperature)
+            return
+        yield from super().stream(messages, model=model, temperature=temperature)
+
+    def request_key(
+        self,
+        messages: List[Dict[str, str]],
+        model: str | None = None,
+        temperature: float | None = None,
+    ) -> str:
+        """请求的规范化哈希（生效的模型、温度与消息），用于识别相同的在途请求"""
+        effective_model = model if model is not None else self.default_model
+        effective_temperature = temperature if temperature is not None else self.default_temperature
+        return make_cache_key(effective_model, effective_temperature, messages)
+
+    def record_shared_usage(
+        self,
+        messages: List[Dict[str, str]],
+        response_text: str,
+        model: str | None = None,
+    ):
+        """以当前请求的用户、会话和用量归属记录一次共享他人上游调用的用量"""
+        self.llm_client.record_shared_usage(
+            model if model is not None else self.default_model,
+            messages,
+            response_text,
+            self.user_id,
+            self.session_id,
+            self._build_metadata(),
+        )
+
+    async def acomplete(
+        self,
+        messages: List[Dict[str, str]],
+        model: str | None = None,
+        temperature: float | None = None,
+    ) -> str:
+        """
+        异步非流式 LLM 调用
+
+        Returns:
+            str: LLM 响应内容
+
+        Raises:
+            ValueError: 当 LLM 调用失败时
+        """
+        call_args = self._prepare_call(messages, model, temperature)
+        result = await self.llm_client.chat_completion(**call_args)
+        if result and result.get("success"):
+            self.last_cache_status = result.get("cache_status")
+            return result["response"] or ""
+        error_msg = result.get("error", "未知错误") if result else "LLM调用失败"
+        raise ValueError(f"LLM 调用失败: {error_msg}")
+
+    async def astream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str | None = None,
+        temperature: float | None = None,
+        speculative: bool = False,
+    ) -> AsyncGenerator[str, None]:
+        """
+        异步流式 LLM 调用
+
+        Args:
+            speculative: 是否为预取等推测性调用，按最低优先级调度
+
+        Yields:
+            str: LLM 的增量响应内容
+
+        Raises:
+            ValueError: 当 LLM 调用失败时
+        """
+        call_args = self._prepare_call(messages, model, temperature)
+        call_args["speculative"] = speculative
+        # 调用方关闭本生成器时，取消会一路传递到上游流式响应
+        async with aclosing(self.llm_client.chat_completion_sse(**call_args)) as chunks:
+            async for chunk in chunks:
+                if chunk.get("success") and "delta" in chunk:
+                    yield chunk["delta"]
+                elif not chunk.get("success"):
+                    error_msg = chunk.get("error", "流式调用失败")
+                    raise ValueError(f"LLM 流式调用失败: {error_msg}")
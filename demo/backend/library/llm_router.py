@@ -0,0 +1,285 @@
+"""
+LLM 多端点路由
+
+同一模型可由多个 OpenAI 兼容后端提供。每次调用按各端点的 EWMA 延迟、在途请求数
+和错误率选择代价最低的端点；持续失败或错误率过高的端点被暂时摘除，
+摘除期满后放行一次探测请求，成功则重新接入。
+端点上某个模型的熔断器打开时不再向其分配该模型的调用，全部熔断时立即拒绝。
+"""
+
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import openai
+
+from backend.config.settings import settings
+from backend.library.circuit_breaker import CircuitBreakerRegistry, CircuitOpenError
+from backend.utils.logger import logger
+
+# 尚无延迟样本时使用的估计值（秒），新端点会优先被探索
+_DEFAULT_LATENCY = 0.0
+
+
+def _to_ms(seconds: Optional[float]) -> Optional[float]:
+    """秒转毫秒"""
+    return round(seconds * 1000, 1) if seconds is not None else None
+
+
+def is_endpoint_failure(error: BaseException) -> bool:
+    """
+    判断异常是否由上游端点导致
+
+    连接失败、超时、5xx 和 429 计入端点错误；4xx 等请求本身的问题不影响端点健康度。
+    """
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code >= 500 or error.status_code == 429
+    return isinstance(error, openai.APIError)
+
+
+class LLMEndpoint:
+    """一个 OpenAI 兼容的上游端点及其运行状态"""
+
+    def __init__(
+        self,
+        name: str,
+        base_url: str,
+        api_key: Optional[str],
+        models: Optional[List[str]] = None,
+    ):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.models = set(models or [])  # 为空表示服务所有模型
+
+        # 流式调用记录首个增量的延迟，非流式调用记录完整响应的延迟，两者分开统计
+        self.ewma_latency: Dict[bool, Optional[float]] = {True: None, False: None}
+        self.ewma_error_rate = 0.0
+        self.in_flight = 0
+        self.consecutive_failures = 0
+        self.ejected = False  # 已摘除，等待探测成功后重新接入
+        self.ejected_until = 0.0
+        self.probing = False
+        self.requests = 0
+        self.failures = 0
+        self.ejections = 0
+
+    def serves(self, model: Optional[str]) -> bool:
+        """是否提供该模型"""
+        return not self.models or model in self.models
+
+    def cost(self, stream: bool) -> float:
+        """路由代价：延迟越高、在途越多、错误率越高代价越大"""
+        latency = self.ewma_latency[stream]
+        if latency is None:
+            latency = _DEFAULT_LATENCY
+        return (
+            (latency + 0.001)
+            * (self.in_flight + 1)
+            / max(1.0 - self.ewma_error_rate, 0.05)
+        )
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取端点统计"""
+        return {
+            "name": self.name,
+            "base_url": self.base_url,
+            "models": sorted(self.models),
+            "healthy": not self.ejected,
+            "ewma_ttft_ms": _to_ms(self.ewma_latency[True]),
+            "ewma_complete_latency_ms": _to_ms(self.ewma_latency[False]),
+            "ewma_error_rate": round(self.ewma_error_rate, 4),
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "failures": self.failures,
+            "ejections": self.ejections,
+        }
+
+
+class LLMRouter:
+    """按延迟、负载和健康状况在多个端点间分配请求"""
+
+    def __init__(
+        self,
+        endpoints: List[LLMEndpoint],
+        ewma_alpha: float = 0.2,
+        max_consecutive_failures: int = 3,
+        error_rate_threshold: float = 0.5,
+        ejection_seconds: float = 30.0,
+        breakers: Optional[CircuitBreakerRegistry] = None,
+    ):
+        if not endpoints:
+            raise ValueError("至少需要配置一个 LLM 端点")
+        self.endpoints = endpoints
+        self.ewma_alpha = ewma_alpha
+        self.max_consecutive_failures = max_consecutive_failures
+        self.error_rate_threshold = error_rate_threshold
+        self.ejection_seconds = ejection_seconds
+        self.breakers = breakers or CircuitBreakerRegistry(enabled=False)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(
+        cls, base_url: Optional[str] = None, api_key: Optional[str] = None
+    ) -> "LLMRouter":
+        """
+        根据全局配置创建路由
+
+        显式传入 base_url 或未配置 llm_endpoints 时，只使用单个端点。
+        """
+        if base_url or not settings.llm_endpoints:
+            endpoints = [
+                LLMEndpoint(
+                    name="default",
+                    base_url=base_url or settings.llm_base_url,
+                    api_key=api_key or settings.llm_api_key,
+                )
+            ]
+        else:
+            endpoints = [
+                LLMEndpoint(
+                    name=item.get("name") or f"endpoint-{index}",
+                    base_url=item["base_url"],
+                    api_key=item.get("api_key") or settings.llm_api_key,
+                    models=item.get("models"),
+                )
+                for index, item in enumerate(settings.llm_endpoints)
+            ]
+        return cls(
+            endpoints,
+            ewma_alpha=settings.llm_router_ewma_alpha,
+            max_consecutive_failures=settings.llm_router_max_consecutive_failures,
+            error_rate_threshold=settings.llm_router_error_rate_threshold,
+            ejection_seconds=settings.llm_router_ejection_seconds,
+            breakers=CircuitBreakerRegistry.from_settings(),
+        )
+
+    @property
+    def default_endpoint(self) -> LLMEndpoint:
+        """第一个端点"""
+        return self.endpoints[0]
+
+    def check_available(self, model: Optional[str], exclude: Optional[LLMEndpoint] = None):
+        """
+        不计入在途请求地检查是否有可选端点，用于排队前快速失败
+
+        Raises:
+            CircuitOpenError: 所有可选端点上该模型的熔断器均已打开
+        """
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.serves(model)] or self.endpoints
+            if exclude is not None and len(candidates) > 1:
+                candidates = [e for e in candidates if e is not exclude]
+            if not any(self.breakers.available(e.name, model) for e in candidates):
+                for candidate in candidates:
+                    self.breakers.record_rejected(candidate.name, model)
+                raise CircuitOpenError(f"模型 {model} 的所有端点均已熔断")
+
+    def acquire(
+        self,
+        model: Optional[str],
+        stream: bool,
+        exclude: Optional[LLMEndpoint] = None,
+    ) -> LLMEndpoint:
+        """
+        为一次调用选择端点并计入在途请求
+
+        健康端点中选代价最低者；摘除期满的端点放行一次探测请求；
+        全部被摘除时选择最早到期的端点，避免完全不可用。
+        exclude 指定的端点仅在没有其他可选端点时才会被选中。
+
+        Raises:
+            CircuitOpenError: 所有可选端点上该模型的熔断器均已打开
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [e for e in self.endpoints if e.serves(model)] or self.endpoints
+            if exclude is not None and len(candidates) > 1:
+                candidates = [e for e in candidates if e is not exclude]
+            available = [e for e in candidates if self.breakers.available(e.name, model)]
+            if not available:
+                for candidate in candidates:
+                    self.breakers.record_rejected(candidate.name, model)
+                raise CircuitOpenError(f"模型 {model} 的所有端点均已熔断")
+            candidates = available
+            healthy = [e for e in candidates if e.ejected_until <= now and not e.probing]
+
+            endpoint = None
+            for candidate in healthy:
+                if candidate.ejected:
+                    # 摘除期满，放行一次探测请求
+                    candidate.probing = True
+                    endpoint = candidate
+                    break
+            if endpoint is None and healthy:
+                endpoint = min(healthy, key=lambda e: e.cost(stream))
+            if endpoint is None:
+                endpoint = min(candidates, key=lambda e: e.ejected_until)
+
+            self.breakers.on_call(endpoint.name, model)
+            endpoint.in_flight += 1
+            endpoint.requests += 1
+            return endpoint
+
+    def release(
+        self,
+        endpoint: LLMEndpoint,
+        model: Optional[str],
+        stream: bool,
+        latency: Optional[float],
+        success: bool,
+    ):
+        """
+        记录一次调用结果
+
+        Args:
+            endpoint: acquire 返回的端点
+            model: acquire 时的模型
+            stream: 是否为流式调用
+            latency: 流式为首个增量的延迟，非流式为完整响应的延迟（秒），没有样本时为 None
+            success: 上游是否正常响应
+        """
+        # 成功但没有延迟样本的调用（被取消或请求本身有误）不影响熔断状态
+        self.breakers.record(
+            endpoint.name, model, success if latency is not None or not success else None
+        )
+        with self._lock:
+            endpoint.in_flight -= 1
+            was_probe, endpoint.probing = endpoint.probing, False
+            alpha = self.ewma_alpha
+            if latency is not None:
+                previous = endpoint.ewma_latency[stream]
+                endpoint.ewma_latency[stream] = (
+                    latency if previous is None else previous + alpha * (latency - previous)
+                )
+            endpoint.ewma_error_rate += alpha * (
+                (0.0 if success else 1.0) - endpoint.ewma_error_rate
+            )
+
+            if success:
+                endpoint.consecutive_failures = 0
+                if was_probe or endpoint.ejected:
+                    # 探测成功，重新接入
+                    endpoint.ejected = False
+                    endpoint.ewma_error_rate = 0.0
+                    logger.info(f"LLM 端点 {endpoint.name} 探测成功，已重新接入")
+                return
+
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if (
+                endpoint.consecutive_failures >= self.max_consecutive_failures
+                or endpoint.ewma_error_rate >= self.error_rate_threshold
+            ):
+                endpoint.ejected = True
+                endpoint.ejected_until = time.monotonic() + self.ejection_seconds
+                endpoint.ejections += 1
+                logger.warning(
+                    f"LLM 端点 {endpoint.name} 已摘除 {self.ejection_seconds}s, "
+                    f"连续失败 {endpoint.consecutive_failures} 次, 错误率 {endpoint.ewma_error_rate:.2f}"
+                )
+
+    def get_stats(self) -> List[Dict[str, Any]]:
+        """获取所有端点统计"""
+        with self._lock:
+            return [endpoint.get_stats() for endpoint in self.endpoints]
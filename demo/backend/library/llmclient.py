@@ -1,11 +1,52 @@
+import asyncio
 import logging
-from datetime import datetime
-from typing import Any, Dict, List, Optional
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
 
+import openai
 from openai import AsyncOpenAI
 
 from backend.config.settings import settings
+from backend.library.http_pool import (
+    HTTPPoolMetrics,
+    create_http_client,
+    create_timeout,
+)
+from backend.library.circuit_breaker import CircuitOpenError
+from backend.library.fair_scheduler import FairShareScheduler
+from backend.library.hedging import HedgePolicy
+from backend.library.model_capabilities import (
+    STREAM_USAGE,
+    TOOLS,
+    ModelCapabilityRegistry,
+    is_capability_rejection,
+)
+from backend.library.llm_router import LLMEndpoint, LLMRouter, is_endpoint_failure
+from backend.library.rate_limiter import RateLimitQueueTimeout, RateLimitScheduler
+from backend.library.usage_meter import UsageMeter
+from backend.library.stream_watchdog import (
+    ContinuationSplicer,
+    StreamStalledError,
+    StreamWatchdog,
+)
+from backend.library.response_cache import (
+    CACHE_BYPASS,
+    CACHE_HIT,
+    CACHE_MISS,
+    LLMResponseCache,
+    make_cache_key,
+)
 from backend.utils.logger import logger
+from backend.utils.tokens import estimate_message_tokens, estimate_tokens
+
+# 平均输出 token 数的指数滑动平均系数
+_COMPLETION_TOKENS_EWMA_ALPHA = 0.1
+
+# 尚无历史输出长度时，限流预订按该输出 token 数估算
+_DEFAULT_COMPLETION_TOKENS_ESTIMATE = 512
 
 
 def _debug_print_messages(messages: List[Dict], title: str = "LLM Context"):
@@ -69,22 +110,255 @@ def _debug_print_messages(messages: List[Dict], title: str = "LLM Context"):
     print(f"\n{title_color}{'=' * 50}{reset}")
 
 
+@dataclass
+class _StreamAttempt:
+    """一次流式请求尝试"""
+
+    endpoint: LLMEndpoint
+    model: str
+    started: float
+    reserved_tokens: int = 0
+    prompt_tokens: Optional[int] = None  # 本地估算的输入 token 数
+    stream: Any = None
+    iterator: Any = None
+    task: Optional[asyncio.Task] = None
+
+
 class LLMClient:
     """LLM 公共客户端组件 - 使用OpenAI包"""
 
-    def __init__(self, base_url: Optional[str] = None, api_key: Optional[str] = None):
-        self.base_url = base_url or settings.llm_base_url
-        self.api_key = api_key or settings.llm_api_key
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        api_key: Optional[str] = None,
+        response_cache: Optional[LLMResponseCache] = None,
+        router: Optional[LLMRouter] = None,
+    ):
+        # 上游端点路由，未配置多端点时只有一个默认端点
+        self.router = router or LLMRouter.from_settings(base_url, api_key)
+        self.base_url = self.router.default_endpoint.base_url
+        self.api_key = self.router.default_endpoint.api_key
+
+        # 首字延迟对冲策略（默认关闭）
+        self.hedge_policy = HedgePolicy.from_settings()
+
+        # 输出中途停顿检测与续写
+        self.watchdog = StreamWatchdog.from_settings()
+
+        # 各模型支持的能力（工具调用、流式 usage、JSON 模式）
+        self.capabilities = ModelCapabilityRegistry.from_settings()
+
+        # token 用量按模型、用户、会话、文档和文档块累计
+        self.usage_meter = UsageMeter.from_settings()
+
+        # 上游调用槽位按用户公平分配，流式调用优先
+        self.scheduler = FairShareScheduler.from_settings()
+
+        # 按上游 RPM/TPM 限额调度调用
+        self.rate_limiter = RateLimitScheduler.from_settings()
+
+        # 非流式响应缓存（默认按配置决定是否启用）
+        self.response_cache = response_cache or LLMResponseCache.from_settings()
+
+        # OpenAI 客户端按事件循环和端点分别创建：底层连接池不能跨事件循环复用
+        self._clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, AsyncOpenAI]]" = (
+            weakref.WeakKeyDictionary()
+        )
+        self._clients_lock = threading.Lock()
+        self.pool_metrics = HTTPPoolMetrics(settings.llm_pool_max_connections)
+
+        # 流式请求统计（同步与异步调用路径分属不同线程，需要加锁）
+        self._stats_lock = threading.Lock()
+        self._stream_stats: Dict[str, int] = {
+            "completed_streams": 0,
+            "cancelled_streams": 0,
+            "tokens_streamed_before_cancel": 0,
+            "estimated_tokens_saved": 0,
+        }
+        self._avg_completion_tokens: Optional[float] = None
+
+        # 模型降级统计
+        self._fallback_stats: Dict[str, int] = {
+            "fast_failures": 0,
+            "fallbacks": 0,
+            "exhausted": 0,
+        }
+
+    def _create_client(self, endpoint: LLMEndpoint) -> AsyncOpenAI:
+        """创建 OpenAI 客户端，使用按配置调优的连接池"""
+        return AsyncOpenAI(
+            api_key=endpoint.api_key,
+            base_url=endpoint.base_url,
+            timeout=create_timeout(),
+            http_client=create_http_client(self.pool_metrics),
+        )
+
+    def _client_for(self, endpoint: LLMEndpoint) -> AsyncOpenAI:
+        """获取当前运行事件循环上指定端点的 OpenAI 客户端"""
+        loop = asyncio.get_running_loop()
+        with self._clients_lock:
+            clients = self._clients.setdefault(loop, {})
+            client = clients.get(endpoint.name)
+            if client is None:
+                client = self._create_client(endpoint)
+                clients[endpoint.name] = client
+        return client
+
+    @property
+    def client(self) -> AsyncOpenAI:
+        """获取绑定到当前运行事件循环的默认端点 OpenAI 客户端"""
+        return self._client_for(self.router.default_endpoint)
+
+    def _record_stream_completed(self, completion_tokens: int):
+        """记录一次完整结束的流式请求，更新平均输出 token 数"""
+        with self._stats_lock:
+            self._stream_stats["completed_streams"] += 1
+            if self._avg_completion_tokens is None:
+                self._avg_completion_tokens = float(completion_tokens)
+            else:
+                self._avg_completion_tokens += _COMPLETION_TOKENS_EWMA_ALPHA * (
+                    completion_tokens - self._avg_completion_tokens
+                )
+
+    def _record_stream_cancelled(self, streamed_tokens: int):
+        """记录一次因下游断开而取消的流式请求"""
+        with self._stats_lock:
+            self._stream_stats["cancelled_streams"] += 1
+            self._stream_stats["tokens_streamed_before_cancel"] += streamed_tokens
+            # 以历史平均输出长度估算被节省的 token
+            if self._avg_completion_tokens is not None:
+                self._stream_stats["estimated_tokens_saved"] += max(
+                    0, int(self._avg_completion_tokens) - streamed_tokens
+                )
+
+    def get_stream_stats(self) -> Dict[str, Any]:
+        """获取流式请求统计"""
+        with self._stats_lock:
+            stats = dict(self._stream_stats)
+            stats["avg_completion_tokens"] = (
+                round(self._avg_completion_tokens, 1)
+                if self._avg_completion_tokens is not None
+                else None
+            )
+        return stats
+
+    def get_pool_stats(self) -> Dict[str, Any]:
+        """获取连接池统计，每个事件循环各有一个连接池"""
+        stats = self.pool_metrics.get_stats()
+        stats["pools"] = sum(len(clients) for clients in list(self._clients.values()))
+        return stats
+
+    def get_endpoint_stats(self) -> List[Dict[str, Any]]:
+        """获取各上游端点的路由统计"""
+        return self.router.get_stats()
+
+    def get_circuit_stats(self) -> Dict[str, Any]:
+        """获取熔断器与模型降级统计"""
+        with self._stats_lock:
+            stats: Dict[str, Any] = dict(self._fallback_stats)
+        stats["enabled"] = self.router.breakers.enabled
+        stats["fallback_models"] = settings.llm_fallback_models
+        stats["breakers"] = self.router.breakers.get_stats()
+        return stats
+
+    def _record_fallback(self, key: str):
+        """记录一次降级相关事件"""
+        with self._stats_lock:
+            self._fallback_stats[key] += 1
+
+    @staticmethod
+    def _model_chain(model: str) -> List[str]:
+        """请求的模型及其按顺序降级的备用模型"""
+        chain = [model]
+        for fallback in settings.llm_fallback_models.get(model, []):
+            if fallback not in chain:
+                chain.append(fallback)
+        return chain
+
+    def _should_fall_back(self, error: BaseException) -> bool:
+        """上游故障、熔断或限流排队超时时改用下一个备用模型，请求本身有误时不降级"""
+        if isinstance(error, CircuitOpenError):
+            self._record_fallback("fast_failures")
+            return True
+        if isinstance(error, RateLimitQueueTimeout):
+            return True
+        return is_endpoint_failure(error)
+
+    def _estimate_request_tokens(self, messages: List[Dict[str, Any]]) -> int:
+        """估算一次调用消耗的 token 数（输入 + 历史平均输出），用于限流预订"""
+        with self._stats_lock:
+            completion = self._avg_completion_tokens
+        if completion is None:
+            completion = _DEFAULT_COMPLETION_TOKENS_ESTIMATE
+        return estimate_message_tokens(messages) + int(completion)
 
-        # 初始化OpenAI客户端
-        self.client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
+    def _observe_error(self, model: str, error: BaseException):
+        """上游返回 429 时通知限流调度器"""
+        if isinstance(error, openai.APIStatusError) and error.status_code == 429:
+            self.rate_limiter.on_rate_limited(model, error.response.headers)
+
+    def _record_usage(
+        self,
+        model: str,
+        prompt_tokens: Optional[int],
+        completion_tokens: Optional[int],
+        messages: List[Dict[str, Any]],
+        response_text: str,
+        stream: bool,
+        user_id: Optional[str],
+        session_id: Optional[str],
+        metadata: Optional[Dict[str, Any]],
+    ):
+        """记录一次调用的 token 用量，上游未返回 usage 时按本地估算"""
+        estimated = prompt_tokens is None or completion_tokens is None
+        if prompt_tokens is None:
+            prompt_tokens = estimate_message_tokens(messages)
+        if completion_tokens is None:
+            completion_tokens = estimate_tokens(response_text)
+        metadata = metadata or {}
+        self.usage_meter.record(
+            model,
+            prompt_tokens,
+            completion_tokens,
+            stream=stream,
+            estimated=estimated,
+            user=user_id,
+            session=session_id,
+            document=metadata.get("document"),
+            block_index=metadata.get("block_index"),
+        )
+
+    def get_usage_stats(self) -> Dict[str, Any]:
+        """获取 token 用量统计"""
+        return self.usage_meter.get_stats()
+
+    def query_usage(
+        self, dimension: str, key: Optional[str] = None, limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """按维度查询 token 用量"""
+        return self.usage_meter.query(dimension, key=key, limit=limit)
+
+    def get_capability_stats(self) -> Dict[str, Any]:
+        """获取模型能力登记统计"""
+        return self.capabilities.get_stats()
+
+    def get_scheduler_stats(self) -> Dict[str, Any]:
+        """获取按用户公平调度统计"""
+        return self.scheduler.get_stats()
+
+    def get_rate_limit_stats(self) -> Dict[str, Any]:
+        """获取限流准入统计"""
+        return self.rate_limiter.get_stats()
 
     async def aclose(self):
-        """关闭客户端连接"""
-        try:
-            await self.client.close()
-        except Exception as e:
-            logger.warning(f"关闭 LLM 客户端时出错: {e}")
+        """关闭当前事件循环上的客户端连接"""
+        with self._clients_lock:
+            clients = self._clients.pop(asyncio.get_running_loop(), {})
+        for client in clients.values():
+            try:
+                await client.close()
+            except Exception as e:
+                logger.warning(f"关闭 LLM 客户端时出错: {e}")
 
     async def chat_completion(
         self,
@@ -107,7 +381,27 @@ class LLMClient:
 
         _debug_print_messages(messages, "LLM Chat Completion")
 
+        # 确定性调用优先读取响应缓存
+        cache_key = None
+        if self.response_cache.is_cacheable(model, temperature):
+            cache_key = make_cache_key(model, temperature, messages, tools)
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                cached["cache_status"] = CACHE_HIT
+                return cached
+        else:
+            self.response_cache.record_bypass()
+
+        ticket = None
         try:
+            # 等待上游调用槽位（按用户公平排队）
+            ticket = await self.scheduler.acquire(
+                user_id,
+                interactive=False,
+                cost=self._estimate_request_tokens(messages),
+                session=session_id,
+            )
+
             # 使用OpenAI客户端
             completion_args = {
                 "model": model,
@@ -116,12 +410,15 @@ class LLMClient:
                 "temperature": temperature,
             }
 
-            # 添加 Function Calling 支持
-            if tools:
-                completion_args["tools"] = tools
-                completion_args["tool_choice"] = "auto"
-
-            response = await self.client.chat.completions.create(**completion_args)
+            # 添加 Function Calling 支持，已知不支持工具调用的模型直接按普通模式调用
+            if tools and not self.capabilities.should_skip(model, TOOLS):
+                response, used_model = await self._complete_with_tools(
+                    model, completion_args, tools
+                )
+            else:
+                response, used_model = await self._complete_with_fallback(
+                    model, completion_args
+                )
 
             response_content = response.choices[0].message.content
             prompt_tokens = response.usage.prompt_tokens if response.usage else None
@@ -129,6 +426,17 @@ class LLMClient:
                 response.usage.completion_tokens if response.usage else None
             )
             total_tokens = response.usage.total_tokens if response.usage else None
+            self._record_usage(
+                used_model,
+                prompt_tokens,
+                completion_tokens,
+                messages,
+                response_content or "",
+                False,
+                user_id,
+                session_id,
+                metadata,
+            )
 
             logger.info(
                 f"LLM tokens - prompt: {prompt_tokens}, completion: {completion_tokens}, total: {total_tokens}"
@@ -140,8 +448,10 @@ class LLMClient:
             result = {
                 "success": True,
                 "response": response_content,
-                "model": model,
+                "model": used_model,
             }
+            if used_model != model:
+                result["fallback_from"] = model
 
             # 如果有 tool_calls，添加到结果中
             if response.choices[0].message.tool_calls:
@@ -158,11 +468,120 @@ class LLMClient:
                         }
                     )
 
+            if cache_key is not None and used_model == model:
+                self.response_cache.put(cache_key, result)
+                result["cache_status"] = CACHE_MISS
+            else:
+                result["cache_status"] = CACHE_BYPASS
+
             return result
 
         except Exception as e:
             logger.error(f"LLM 请求异常: {str(e)}")
             return {"success": False, "error": f"请求异常: {str(e)}"}
+        finally:
+            self.scheduler.release(ticket)
+
+    async def _complete_with_tools(
+        self,
+        model: str,
+        completion_args: Dict[str, Any],
+        tools: List[Dict[str, Any]],
+    ) -> "Tuple[Any, str]":
+        """
+        带工具定义发起非流式请求
+
+        上游拒绝请求时去掉工具定义重试一次，重试成功说明模型不支持工具调用，
+        记入能力登记表，之后该模型的请求不再携带工具定义。
+        """
+        try:
+            response, used_model = await self._complete_with_fallback(
+                model, {**completion_args, "tools": tools, "tool_choice": "auto"}
+            )
+        except Exception as e:
+            if not is_capability_rejection(e):
+                raise
+            logger.warning(f"模型 {model} 拒绝了工具调用请求，改为普通模式: {e}")
+            response, used_model = await self._complete_with_fallback(
+                model, completion_args
+            )
+            self.capabilities.record(model, TOOLS, False)
+            return response, used_model
+
+        self.capabilities.record(used_model, TOOLS, True)
+        return response, used_model
+
+    async def _complete_with_fallback(
+        self, model: str, completion_args: Dict[str, Any]
+    ) -> "Tuple[Any, str]":
+        """
+        发起非流式请求，上游故障或熔断时按降级链依次改用备用模型
+
+        Returns:
+            响应及实际使用的模型
+
+        Raises:
+            降级链上所有模型都失败时抛出最后一个异常
+        """
+        last_error: Optional[BaseException] = None
+        reserved = self._estimate_request_tokens(completion_args["messages"])
+        for candidate in self._model_chain(model):
+            if last_error is not None:
+                self._record_fallback("fallbacks")
+                logger.warning(f"LLM 降级: {model} -> {candidate}, 原因: {last_error}")
+            try:
+                # 先检查熔断再排队，熔断中的模型立即失败而不是在限流队列里等待
+                self.router.check_available(candidate)
+                await self.rate_limiter.acquire(candidate, reserved)
+            except (CircuitOpenError, RateLimitQueueTimeout) as e:
+                self._should_fall_back(e)
+                last_error = e
+                continue
+            try:
+                endpoint = self.router.acquire(candidate, stream=False)
+            except CircuitOpenError as e:
+                # 排队期间熔断器打开，调用未发出
+                self.rate_limiter.refund(candidate, reserved)
+                self._should_fall_back(e)
+                last_error = e
+                continue
+
+            started = time.monotonic()
+            latency = None
+            endpoint_ok = True
+            settled = False
+            try:
+                raw = await self._client_for(
+                    endpoint
+                ).chat.completions.with_raw_response.create(
+                    **{**completion_args, "model": candidate}
+                )
+                latency = time.monotonic() - started
+                self.rate_limiter.observe_headers(candidate, raw.headers)
+                response = raw.parse()
+                self.rate_limiter.settle(
+                    candidate,
+                    reserved,
+                    response.usage.total_tokens if response.usage else None,
+                )
+                settled = True
+                return response, candidate
+            except Exception as e:
+                self._observe_error(candidate, e)
+                endpoint_ok = not is_endpoint_failure(e)
+                if not self._should_fall_back(e):
+                    raise
+                last_error = e
+            finally:
+                if not settled:
+                    # 失败或被取消的调用没有 usage，按输入估算
+                    self.rate_limiter.settle(
+                        candidate, reserved, estimate_message_tokens(completion_args["messages"])
+                    )
+                self.router.release(endpoint, candidate, False, latency, endpoint_ok)
+
+        self._record_fallback("exhausted")
+        raise last_error
 
     async def chat_completion_sse(
         self,
@@ -174,9 +593,12 @@ class LLMClient:
         user_id: str,
         context: Optional[List[dict]] = None,
         metadata: Optional[Dict[str, Any]] = None,
+        speculative: bool = False,
     ):
         """
         SSE流式聊天请求，支持上下文拼接 - 使用OpenAI包
+
+        speculative 为 True 时（预取等推测性调用）按最低优先级排队等待上游调用槽位
         """
         if not self.api_key:
             yield {"error": "API Key 未配置"}
@@ -188,45 +610,148 @@ class LLMClient:
 
         _debug_print_messages(messages, "LLM Stream Chat")
 
-        try:
-            full_response = ""
-            prompt_tokens = None
-            completion_tokens = None
-            total_tokens = None
-            completion_start_time = None
+        stream = None
+        cancelled = False
+        full_response = ""
+        attempt = None
+        first_chunk_latency = None
+        endpoint_ok = True
+        splicer = None
+        stalled_at = None
+        stall_retries = 0
+        ticket = None
+        prompt_tokens = None
+        completion_tokens = None
+        total_tokens = None
+        settled = False
+        # 当前请求（首次请求或续写）的消息与其输出在 full_response 中的起点
+        attempt_messages = messages
+        attempt_offset = 0
 
+        try:
             # 使用OpenAI客户端创建流式响应
-            # 添加 timeout 防止请求卡死
-            stream = await self.client.chat.completions.create(
-                model=model,
-                messages=messages,
-                max_tokens=4096,
-                temperature=temperature,
-                stream=True,
-                timeout=60.0 # 60s timeout
-            )
+            # 超时由连接池配置统一控制（读取超时防止请求卡死）
+            create_args = {
+                "messages": messages,
+                "max_tokens": 4096,
+                "temperature": temperature,
+                "stream": True,
+            }
+            # 请求上游在流末尾返回 usage，已知不支持的模型不携带该参数
+            if not self.capabilities.should_skip(model, STREAM_USAGE):
+                create_args["stream_options"] = {"include_usage": True}
 
-            async for chunk in stream:
-                if completion_start_time is None:
-                    completion_start_time = datetime.now()
+            # 等待上游调用槽位（按用户公平排队），整个流式输出期间占用
+            ticket = await self.scheduler.acquire(
+                user_id,
+                interactive=True,
+                cost=self._estimate_request_tokens(messages),
+                session=session_id,
+                speculative=speculative,
+            )
+            attempt, chunk = await self._open_stream_with_usage(model, create_args)
+            stream = attempt.stream
+            first_chunk_latency = time.monotonic() - attempt.started
 
+            while chunk is not None:
                 # 检查是否包含 usage 信息
                 if hasattr(chunk, "usage") and chunk.usage:
                     prompt_tokens = chunk.usage.prompt_tokens
                     completion_tokens = chunk.usage.completion_tokens
                     total_tokens = chunk.usage.total_tokens
+                    if self.capabilities.supports(attempt.model, STREAM_USAGE) is None:
+                        self.capabilities.record(attempt.model, STREAM_USAGE, True)
 
                 # 提取增量内容
                 if chunk.choices and len(chunk.choices) > 0:
                     choice = chunk.choices[0]
                     if choice.delta and choice.delta.content:
                         delta = choice.delta.content
-                        full_response += delta
-                        yield {"success": True, "delta": delta}
+                        if splicer is not None:
+                            # 续写开头可能重复已输出的内容
+                            delta = splicer.feed(delta)
+                        if delta:
+                            if stalled_at is not None:
+                                self.watchdog.record_recovered(
+                                    time.monotonic() - stalled_at, splicer.trimmed_chars
+                                )
+                                stalled_at = None
+                            full_response += delta
+                            yield {"success": True, "delta": delta}
 
-                    # 检查是否完成
-                    if choice.finish_reason in ["stop", "length", "content_filter"]:
-                        break
+                    # 输出完成后继续读到流结束：usage 数据块在 finish_reason 之后到达
+
+                try:
+                    chunk = await self.watchdog.next_chunk(attempt.iterator)
+                except asyncio.TimeoutError:
+                    # 输出中途停顿：放弃当前请求，带上已输出内容请求续写
+                    self.watchdog.record_stall()
+                    if stall_retries >= self.watchdog.max_retries:
+                        self.watchdog.record_failed()
+                        endpoint_ok = False
+                        raise StreamStalledError(
+                            f"LLM 输出停顿超过 {self.watchdog.stall_timeout}s，续写重试已用尽"
+                        )
+                    stall_retries += 1
+                    stalled_at = time.monotonic()
+                    logger.warning(
+                        f"LLM 流式输出停顿，发起续写 ({stall_retries}/{self.watchdog.max_retries}), "
+                        f"已输出 {len(full_response)} 字符, trace_id: {trace_id}"
+                    )
+                    stalled, attempt, stream = attempt, None, None
+                    stalled_output = full_response[attempt_offset:]
+                    await self._discard_attempt(
+                        stalled,
+                        endpoint_ok=False,
+                        completion_tokens=estimate_tokens(stalled_output),
+                    )
+                    # 停顿的请求已在上游计费但没有 usage，按其输入和已输出内容估算
+                    self._record_usage(
+                        stalled.model,
+                        None,
+                        None,
+                        attempt_messages,
+                        stalled_output,
+                        True,
+                        user_id,
+                        session_id,
+                        metadata,
+                    )
+                    attempt_messages = self.watchdog.continuation_messages(
+                        messages, full_response
+                    )
+                    attempt_offset = len(full_response)
+                    try:
+                        attempt, chunk = await self._open_stream(
+                            stalled.model, {**create_args, "messages": attempt_messages}
+                        )
+                    except Exception:
+                        self.watchdog.record_failed()
+                        raise
+                    stream = attempt.stream
+                    first_chunk_latency = time.monotonic() - attempt.started
+                    splicer = ContinuationSplicer(full_response)
+
+            if splicer is not None:
+                # 续写结束，输出仍在缓冲中的内容
+                rest = splicer.flush()
+                if rest:
+                    if stalled_at is not None:
+                        self.watchdog.record_recovered(
+                            time.monotonic() - stalled_at, splicer.trimmed_chars
+                        )
+                    full_response += rest
+                    yield {"success": True, "delta": rest}
+
+            self.rate_limiter.settle(
+                attempt.model,
+                attempt.reserved_tokens,
+                total_tokens
+                if total_tokens is not None
+                else estimate_message_tokens(attempt_messages)
+                + estimate_tokens(full_response[attempt_offset:]),
+            )
+            settled = True
 
             # 输出 token 统计信息
             if prompt_tokens is not None or completion_tokens is not None:
@@ -237,9 +762,266 @@ class LLMClient:
                     f"session_id: {session_id}, trace_id: {trace_id}, user_id: {user_id}"
                 )
 
+            self._record_stream_completed(
+                completion_tokens
+                if completion_tokens is not None
+                else estimate_tokens(full_response)
+            )
+            self._record_usage(
+                attempt.model,
+                prompt_tokens,
+                completion_tokens,
+                attempt_messages,
+                full_response[attempt_offset:],
+                True,
+                user_id,
+                session_id,
+                metadata,
+            )
+
+        except (GeneratorExit, asyncio.CancelledError):
+            # 下游已断开：调用方关闭了生成器或任务被取消
+            cancelled = True
+            raise
         except Exception as e:
+            endpoint_ok = endpoint_ok and not is_endpoint_failure(e)
             logger.error(f"LLM 流式请求异常: {str(e)}")
             yield {"success": False, "error": f"请求异常: {str(e)}"}
+        finally:
+            if attempt is not None:
+                if not settled:
+                    # 中途失败或断开的流式请求没有 usage，按已输出内容估算
+                    self.rate_limiter.settle(
+                        attempt.model,
+                        attempt.reserved_tokens,
+                        estimate_message_tokens(attempt_messages)
+                        + estimate_tokens(full_response[attempt_offset:]),
+                    )
+                self.router.release(
+                    attempt.endpoint,
+                    attempt.model,
+                    True,
+                    first_chunk_latency,
+                    endpoint_ok,
+                )
+            if stream is not None:
+                # 立即关闭上游 HTTP 响应，不再继续消耗 token
+                try:
+                    await stream.close()
+                except Exception as e:
+                    logger.warning(f"关闭 LLM 流式响应时出错: {e}")
+            self.scheduler.release(ticket)
+            if attempt is not None and not settled:
+                # 中途失败或提前断开的流式请求没有 usage，按已输出内容估算
+                self._record_usage(
+                    attempt.model,
+                    None,
+                    None,
+                    attempt_messages,
+                    full_response[attempt_offset:],
+                    True,
+                    user_id,
+                    session_id,
+                    metadata,
+                )
+            if cancelled:
+                self._record_stream_cancelled(estimate_tokens(full_response))
+                logger.info(
+                    f"LLM 流式请求已取消, session_id: {session_id}, trace_id: {trace_id}, user_id: {user_id}"
+                )
+
+    def _start_attempt(
+        self,
+        model: str,
+        create_args: Dict[str, Any],
+        reserved_tokens: int,
+        exclude: Optional[LLMEndpoint] = None,
+        endpoint: Optional[LLMEndpoint] = None,
+    ) -> "_StreamAttempt":
+        """选择端点（或使用已选好的端点）并在后台发起一次流式请求，读取到首个数据块为止"""
+        attempt = _StreamAttempt(
+            endpoint=endpoint or self.router.acquire(model, stream=True, exclude=exclude),
+            model=model,
+            started=time.monotonic(),
+            reserved_tokens=reserved_tokens,
+            prompt_tokens=estimate_message_tokens(create_args["messages"]),
+        )
+
+        async def run():
+            attempt.stream = await self._client_for(
+                attempt.endpoint
+            ).chat.completions.create(model=model, **create_args)
+            self.rate_limiter.observe_headers(model, attempt.stream.response.headers)
+            attempt.iterator = attempt.stream.__aiter__()
+            return await anext(attempt.iterator, None)
+
+        attempt.task = asyncio.create_task(run())
+        return attempt
+
+    async def _discard_attempt(
+        self,
+        attempt: "_StreamAttempt",
+        endpoint_ok: bool = True,
+        completion_tokens: int = 0,
+    ):
+        """
+        取消并清理未采用或已停顿的请求，释放其端点
+
+        Args:
+            completion_tokens: 该请求已输出内容的估算 token 数（停顿的请求）
+        """
+        if not attempt.task.done():
+            attempt.task.cancel()
+            await asyncio.wait({attempt.task})
+        if attempt.stream is not None:
+            try:
+                await attempt.stream.close()
+            except Exception as e:
+                logger.warning(f"关闭 LLM 流式响应时出错: {e}")
+        # 未被采用或已停顿的请求没有 usage，按输入和已输出内容估算修正预订
+        self.rate_limiter.settle(
+            attempt.model, attempt.reserved_tokens, attempt.prompt_tokens + completion_tokens
+        )
+        self.router.release(attempt.endpoint, attempt.model, True, None, endpoint_ok)
+
+    async def _open_stream(
+        self, model: str, create_args: Dict[str, Any]
+    ) -> "Tuple[_StreamAttempt, Any]":
+        """
+        发起流式请求并等待首个数据块
+
+        启用对冲时，首个数据块超过对冲延迟仍未到达且预算允许，
+        就向其他端点（或备用模型）再发一次，先到者胜出，另一个被取消。
+
+        Returns:
+            胜出的请求及其首个数据块（空流时为 None）
+
+        Raises:
+            RateLimitQueueTimeout: 限流排队超过上限
+            所有请求都失败时抛出最后一个异常
+        """
+        reserved = self._estimate_request_tokens(create_args["messages"])
+        # 先检查熔断再排队，熔断中的模型立即失败而不是在限流队列里等待
+        self.router.check_available(model)
+        await self.rate_limiter.acquire(model, reserved)
+        try:
+            endpoint = self.router.acquire(model, stream=True)
+        except CircuitOpenError:
+            # 排队期间熔断器打开，调用未发出
+            self.rate_limiter.refund(model, reserved)
+            raise
+        policy = self.hedge_policy
+        policy.record_request()
+        primary = self._start_attempt(model, create_args, reserved, endpoint=endpoint)
+        attempts = [primary]
+        hedge_at = primary.started + policy.delay() if policy.enabled else None
+        winner = None
+        last_error: Optional[BaseException] = None
+
+        try:
+            while attempts:
+                timeout = None
+                if hedge_at is not None:
+                    timeout = max(hedge_at - time.monotonic(), 0)
+                done, _ = await asyncio.wait(
+                    {attempt.task for attempt in attempts},
+                    timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+
+                if not done:
+                    # 首个数据块超过对冲延迟仍未到达
+                    hedge_at = None
+                    hedge_model = policy.model or model
+                    if policy.try_acquire() and self.rate_limiter.try_acquire(
+                        hedge_model, reserved
+                    ):
+                        logger.info(f"LLM 首字超时，发起对冲请求, model: {model}")
+                        try:
+                            attempts.append(
+                                self._start_attempt(
+                                    hedge_model,
+                                    create_args,
+                                    reserved,
+                                    exclude=primary.endpoint,
+                                )
+                            )
+                        except CircuitOpenError as e:
+                            self.rate_limiter.refund(hedge_model, reserved)
+                            logger.info(f"对冲请求被熔断拒绝: {e}")
+                    continue
+
+                for attempt in [a for a in attempts if a.task in done]:
+                    attempts.remove(attempt)
+                    error = attempt.task.exception()
+                    if error is not None:
+                        self._observe_error(attempt.model, error)
+                    if error is None and winner is None:
+                        winner = attempt
+                    else:
+                        last_error = error or last_error
+                        await self._discard_attempt(
+                            attempt, error is None or not is_endpoint_failure(error)
+                        )
+                if winner is not None:
+                    policy.record_first_chunk(
+                        time.monotonic() - primary.started, winner is not primary
+                    )
+                    return winner, winner.task.result()
+
+            raise last_error
+        finally:
+            # 胜出后或调用方取消时，清理其余请求
+            for attempt in attempts:
+                await self._discard_attempt(attempt)
+
+    async def _open_stream_with_usage(
+        self, model: str, create_args: Dict[str, Any]
+    ) -> "Tuple[_StreamAttempt, Any]":
+        """
+        发起流式请求，上游拒绝 stream_options 时去掉该参数重试一次并记住该模型不支持
+        """
+        try:
+            return await self._open_stream_with_fallback(model, create_args)
+        except Exception as e:
+            if "stream_options" not in create_args or not is_capability_rejection(e):
+                raise
+            create_args.pop("stream_options")
+            attempt, chunk = await self._open_stream_with_fallback(model, create_args)
+            logger.warning(f"模型 {model} 不支持流式 usage，已改为本地估算: {e}")
+            self.capabilities.record(model, STREAM_USAGE, False)
+            return attempt, chunk
+
+    async def _open_stream_with_fallback(
+        self, model: str, create_args: Dict[str, Any]
+    ) -> "Tuple[_StreamAttempt, Any]":
+        """
+        发起流式请求并等待首个数据块，上游故障或熔断时按降级链依次改用备用模型
+
+        只在收到首个数据块之前降级，已开始输出的请求不会切换模型。
+        """
+        last_error: Optional[BaseException] = None
+        for candidate in self._model_chain(model):
+            if last_error is not None:
+                self._record_fallback("fallbacks")
+                logger.warning(f"LLM 降级: {model} -> {candidate}, 原因: {last_error}")
+            try:
+                return await self._open_stream(candidate, create_args)
+            except Exception as e:
+                if not self._should_fall_back(e):
+                    raise
+                last_error = e
+
+        self._record_fallback("exhausted")
+        raise last_error
+
+    def get_stall_stats(self) -> Dict[str, Any]:
+        """获取输出停顿与续写统计"""
+        return self.watchdog.get_stats()
+
+    def get_hedge_stats(self) -> Dict[str, Any]:
+        """获取对冲请求统计"""
+        return self.hedge_policy.get_stats()
 
     def get_config_info(self) -> Dict[str, Any]:
         return {
@@ -247,3 +1029,17 @@ class LLMClient:
             "api_key_configured": bool(self.api_key),
             "api_key_length": len(self.api_key) if self.api_key else 0,
         }
+
+
+_shared_llm_client: Optional[LLMClient] = None
+_shared_llm_client_lock = threading.Lock()
+
+
+def get_shared_llm_client() -> LLMClient:
+    """获取进程内共享的 LLM 客户端，所有 LLM 调用方共用同一套连接池"""
+    global _shared_llm_client
+    if _shared_llm_client is None:
+        with _shared_llm_client_lock:
+            if _shared_llm_client is None:
+                _shared_llm_client = LLMClient()
+    return _shared_llm_client
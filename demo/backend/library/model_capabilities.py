@@ -0,0 +1,114 @@
+"""
+模型能力登记表
+
+记录每个模型是否支持工具调用（tools）、流式 usage（stream_usage）和 JSON 模式（json_mode）。
+能力可以在配置中声明，也可以从调用结果中学习：带某项能力的请求被上游拒绝、
+去掉该能力后重试成功，就记为不支持。学习到的结论有有效期，过期后重新探测。
+已知不支持的能力在发起请求前直接去掉，省掉注定失败的一次往返。
+"""
+
+import threading
+import time
+from typing import Any, Dict, Optional, Tuple
+
+import openai
+
+from backend.config.settings import settings
+
+TOOLS = "tools"
+STREAM_USAGE = "stream_usage"
+JSON_MODE = "json_mode"
+
+CAPABILITIES = (TOOLS, STREAM_USAGE, JSON_MODE)
+
+
+def is_capability_rejection(error: BaseException) -> bool:
+    """上游是否因请求参数（可能是不支持的能力）拒绝了请求"""
+    return isinstance(error, openai.APIStatusError) and error.status_code in (
+        400,
+        404,
+        422,
+    )
+
+
+class ModelCapabilityRegistry:
+    """按模型缓存能力支持情况"""
+
+    def __init__(
+        self,
+        configured: Optional[Dict[str, Dict[str, bool]]] = None,
+        ttl: float = 3600.0,
+    ):
+        self.configured = configured or {}
+        self.ttl = ttl
+        # (模型, 能力) -> (是否支持, 过期时间)
+        self._learned: Dict[Tuple[str, str], Tuple[bool, float]] = {}
+        self._lock = threading.Lock()
+        self._skipped: Dict[str, int] = {name: 0 for name in CAPABILITIES}
+        self._rejections: Dict[str, int] = {name: 0 for name in CAPABILITIES}
+
+    @classmethod
+    def from_settings(cls) -> "ModelCapabilityRegistry":
+        """根据全局配置创建登记表"""
+        return cls(
+            configured=settings.llm_model_capabilities,
+            ttl=settings.llm_capability_ttl,
+        )
+
+    def supports(self, model: Optional[str], capability: str) -> Optional[bool]:
+        """
+        模型是否支持某项能力
+
+        Returns:
+            True / False 为配置或已学习的结论，None 表示未知
+        """
+        configured = self.configured.get(model or "", {}).get(capability)
+        if configured is not None:
+            return bool(configured)
+        with self._lock:
+            learned = self._learned.get((model or "", capability))
+            if learned is None:
+                return None
+            supported, expires_at = learned
+            if expires_at <= time.monotonic():
+                del self._learned[(model or "", capability)]
+                return None
+            return supported
+
+    def should_skip(self, model: Optional[str], capability: str) -> bool:
+        """已知不支持时返回 True 并计入一次省掉的失败请求"""
+        if self.supports(model, capability) is not False:
+            return False
+        with self._lock:
+            self._skipped[capability] += 1
+        return True
+
+    def record(self, model: Optional[str], capability: str, supported: bool):
+        """记录调用得出的结论，配置中已声明的能力不会被覆盖"""
+        if self.configured.get(model or "", {}).get(capability) is not None:
+            return
+        with self._lock:
+            self._learned[(model or "", capability)] = (
+                supported,
+                time.monotonic() + self.ttl,
+            )
+            if not supported:
+                self._rejections[capability] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取能力登记统计"""
+        now = time.monotonic()
+        with self._lock:
+            models: Dict[str, Dict[str, bool]] = {
+                model: {k: bool(v) for k, v in caps.items()}
+                for model, caps in self.configured.items()
+            }
+            for (model, capability), (supported, expires_at) in self._learned.items():
+                if expires_at > now:
+                    models.setdefault(model, {})[capability] = supported
+            return {
+                "ttl_seconds": self.ttl,
+                "models": models,
+                "learned_unsupported": dict(self._rejections),
+                "doomed_attempts_avoided": dict(self._skipped),
+            }
@@ -0,0 +1,400 @@
+"""
+下一内容块的预测性预取
+
+学习者阅读第 N 块时服务端处于空闲，请求第 N+1 块时要付出完整的首字延迟。
+开启预取后，第 N 块生成完毕即按预测的上下文提前生成后续内容块，结果按会话暂存：
+真正的请求与预取的请求完全相同（按最终消息计算的请求键一致）时直接回放，
+预取仍在进行时加入其在途输出。暂存结果有有效期和总字节上限，
+过期、淘汰或未被使用的预取计入浪费的 token。
+
+交互块渲染后，还可以为其热门的几个按钮选项各预取一个分支（选择该选项后的下一内容块），
+用户的选择到达时保留对应的分支、丢弃其余分支。
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from backend.config.settings import settings
+from backend.utils.tokens import estimate_tokens
+
+
+class _PrefetchEntry:
+    """一次预取的生成结果"""
+
+    def __init__(self, session: str, key: str, prompt_tokens: int, expires_at: float):
+        self.session = session
+        self.key = key
+        self.prompt_tokens = prompt_tokens
+        self.expires_at = expires_at
+        self.chunks: List[str] = []
+        self.size_bytes = 0
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+
+    def notify(self):
+        """唤醒等待新数据的读取方"""
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self):
+        """等待下一次数据变化"""
+        await self._changed.wait()
+
+
+class PrefetchBuffer:
+    """按会话暂存预取结果"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        ttl_seconds: float = 120.0,
+        max_bytes: int = 16 * 1024 * 1024,
+        max_entries_per_session: int = 4,
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_entries_per_session = max(1, max_entries_per_session)
+        # 会话 -> 请求键 -> 预取结果，外层按最近使用排序
+        self._sessions: "OrderedDict[str, OrderedDict[str, _PrefetchEntry]]" = OrderedDict()
+        self._total_bytes = 0
+
+        self._started = 0
+        self._hits = 0
+        self._hits_in_flight = 0
+        self._misses = 0
+        self._expired = 0
+        self._evicted = 0
+        self._failed = 0
+        self._served_tokens = 0
+        self._wasted_prompt_tokens = 0
+        self._wasted_completion_tokens = 0
+
+    @classmethod
+    def from_settings(cls) -> "PrefetchBuffer":
+        """根据全局配置创建预取缓冲"""
+        return cls(
+            enabled=settings.prefetch_enabled,
+            ttl_seconds=settings.prefetch_ttl,
+            max_bytes=settings.prefetch_max_bytes,
+            max_entries_per_session=settings.prefetch_max_entries_per_session,
+        )
+
+    def prefetch(
+        self,
+        session: str,
+        key: str,
+        source_factory: Callable[[], AsyncIterator[str]],
+        prompt_tokens: int = 0,
+    ) -> Optional[_PrefetchEntry]:
+        """
+        在后台发起一次预取
+
+        Args:
+            session: 会话标识
+            key: 请求键，真正的请求键相同时命中
+            source_factory: 创建上游流式迭代器
+            prompt_tokens: 预取调用的输入 token 数（估算），未被使用时计入浪费
+
+        Returns:
+            预取结果，已有相同请求的预取时返回已有的结果
+        """
+        self._expire()
+        entries = self._sessions.get(session)
+        if entries is None:
+            entries = self._sessions[session] = OrderedDict()
+        else:
+            self._sessions.move_to_end(session)
+            existing = entries.get(key)
+            if existing is not None and existing.error is None:
+                return existing
+
+        entry = _PrefetchEntry(
+            session, key, prompt_tokens, time.monotonic() + self.ttl_seconds
+        )
+        entries[key] = entry
+        self._started += 1
+        while len(entries) > self.max_entries_per_session:
+            _, oldest = next(iter(entries.items()))
+            self._discard(oldest)
+            self._evicted += 1
+        entry.task = asyncio.create_task(self._pump(entry, source_factory))
+        return entry
+
+    async def result(self, entry: _PrefetchEntry) -> Optional[str]:
+        """等待预取完成，返回完整文本；失败、被淘汰或已被取走时返回 None"""
+        while not entry.done:
+            await entry.wait()
+        if entry.error is not None:
+            return None
+        return "".join(entry.chunks)
+
+    def take(self, session: Optional[str], key: str) -> Optional[AsyncGenerator[str, None]]:
+        """
+        取走与请求匹配的预取结果
+
+        会话中有预取但请求键都不匹配时计为一次未命中（预测的上下文或变量与实际不符）。
+
+        Returns:
+            回放预取输出的异步迭代器（预取仍在进行时持续输出新内容），未命中时为 None
+        """
+        if not self.enabled or session is None:
+            return None
+        self._expire()
+        entries = self._sessions.get(session)
+        if not entries:
+            return None
+        entry = entries.get(key)
+        if entry is None or entry.error is not None:
+            self._misses += 1
+            return None
+
+        self._remove(entry)
+        self._hits += 1
+        if not entry.done:
+            self._hits_in_flight += 1
+        return self._replay(entry)
+
+    def drop(self, session: str, key: str) -> bool:
+        """丢弃不再需要的预取（计入浪费），返回是否存在"""
+        entry = self._sessions.get(session, {}).get(key)
+        if entry is None:
+            return False
+        self._discard(entry)
+        return True
+
+    async def _replay(self, entry: _PrefetchEntry) -> AsyncGenerator[str, None]:
+        """按顺序输出预取内容，读完已有内容后等待后续输出"""
+        index = 0
+        try:
+            while True:
+                if index < len(entry.chunks):
+                    chunk = entry.chunks[index]
+                    index += 1
+                    yield chunk
+                    continue
+                if entry.done:
+                    if entry.error is not None:
+                        raise entry.error
+                    return
+                await entry.wait()
+        finally:
+            if not entry.done and entry.task is not None:
+                # 请求方提前断开，不再需要剩余的预取输出
+                entry.task.cancel()
+            self._served_tokens += estimate_tokens("".join(entry.chunks[:index]))
+
+    async def _pump(
+        self, entry: _PrefetchEntry, source_factory: Callable[[], AsyncIterator[str]]
+    ):
+        """读取上游写入预取结果，超出总字节上限时淘汰最久未用的会话的预取"""
+        try:
+            async with aclosing(source_factory()) as source:
+                async for chunk in source:
+                    entry.chunks.append(chunk)
+                    size = len(chunk.encode("utf-8"))
+                    entry.size_bytes += size
+                    if self._owns(entry):
+                        self._total_bytes += size
+                        self._enforce_memory_cap(entry)
+                    entry.notify()
+        except asyncio.CancelledError:
+            entry.error = ValueError("预取已取消")
+        except Exception as e:
+            entry.error = e
+            self._failed += 1
+            if self._owns(entry):
+                self._discard(entry)
+        finally:
+            entry.done = True
+            entry.notify()
+
+    def _owns(self, entry: _PrefetchEntry) -> bool:
+        """预取结果是否仍在缓冲中（未被取走或淘汰）"""
+        return self._sessions.get(entry.session, {}).get(entry.key) is entry
+
+    def _enforce_memory_cap(self, current: _PrefetchEntry):
+        """按会话最近使用顺序淘汰预取，直到总字节数不超过上限"""
+        while self._total_bytes > self.max_bytes and self._sessions:
+            session, entries = next(iter(self._sessions.items()))
+            if not entries:
+                del self._sessions[session]
+                continue
+            _, oldest = next(iter(entries.items()))
+            self._discard(oldest)
+            self._evicted += 1
+            if oldest is current:
+                return
+
+    def _expire(self):
+        """丢弃已过期的预取"""
+        now = time.monotonic()
+        expired = [
+            entry
+            for entries in self._sessions.values()
+            for entry in entries.values()
+            if entry.expires_at <= now
+        ]
+        for entry in expired:
+            self._discard(entry)
+            self._expired += 1
+
+    def _discard(self, entry: _PrefetchEntry):
+        """丢弃未被使用的预取，取消其上游调用并计入浪费"""
+        self._remove(entry)
+        if not entry.done and entry.task is not None:
+            entry.task.cancel()
+        self._wasted_prompt_tokens += entry.prompt_tokens
+        self._wasted_completion_tokens += estimate_tokens("".join(entry.chunks))
+
+    def _remove(self, entry: _PrefetchEntry):
+        """从缓冲中移除预取结果"""
+        entries = self._sessions.get(entry.session)
+        if entries is None or entries.get(entry.key) is not entry:
+            return
+        del entries[entry.key]
+        self._total_bytes -= entry.size_bytes
+        if not entries:
+            del self._sessions[entry.session]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取预取统计"""
+        lookups = self._hits + self._misses
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl_seconds,
+            "sessions": len(self._sessions),
+            "entries": sum(len(entries) for entries in self._sessions.values()),
+            "bytes": self._total_bytes,
+            "max_bytes": self.max_bytes,
+            "prefetches_started": self._started,
+            "hits": self._hits,
+            "hits_in_flight": self._hits_in_flight,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            "used_ratio": round(self._hits / self._started, 4) if self._started else 0.0,
+            "expired": self._expired,
+            "evicted": self._evicted,
+            "failed": self._failed,
+            "served_completion_tokens": self._served_tokens,
+            "wasted_prompt_tokens": self._wasted_prompt_tokens,
+            "wasted_completion_tokens": self._wasted_completion_tokens,
+        }
+
+
+class BranchPrefetcher:
+    """交互块选项分支的预取登记与选项热度"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        top_k: int = 3,
+        token_budget: int = 4000,
+        max_blocks: int = 1024,
+    ):
+        self.enabled = enabled
+        self.top_k = max(1, top_k)
+        self.token_budget = token_budget
+        self.max_blocks = max(1, max_blocks)
+        # 交互块 -> 各选项被选择的次数
+        self._choices: "OrderedDict[str, Dict[str, int]]" = OrderedDict()
+        # (会话, 交互块) -> 选项 -> 分支预取的请求键
+        self._groups: "OrderedDict[Tuple[str, str], Dict[str, str]]" = OrderedDict()
+
+        self._groups_started = 0
+        self._branches_started = 0
+        self._branches_over_budget = 0
+        self._branches_no_slot = 0
+        self._promotions = 0
+        self._unmatched_choices = 0
+        self._branches_dropped = 0
+
+    @classmethod
+    def from_settings(cls) -> "BranchPrefetcher":
+        """根据全局配置创建分支预取登记"""
+        return cls(
+            enabled=settings.branch_prefetch_enabled,
+            top_k=settings.branch_prefetch_top_k,
+            token_budget=settings.branch_prefetch_token_budget,
+        )
+
+    def rank(self, block: str, values: List[str]) -> List[str]:
+        """按历史选择次数从高到低排列选项（次数相同保持原顺序），取前 top_k 个"""
+        counts = self._choices.get(block, {})
+        ranked = sorted(values, key=lambda value: -counts.get(value, 0))
+        return ranked[: self.top_k]
+
+    def record_choice(self, block: str, value: str):
+        """记录一次选项选择"""
+        counts = self._choices.get(block)
+        if counts is None:
+            counts = self._choices[block] = {}
+            if len(self._choices) > self.max_blocks:
+                self._choices.popitem(last=False)
+        else:
+            self._choices.move_to_end(block)
+        counts[value] = counts.get(value, 0) + 1
+
+    def register(
+        self,
+        session: str,
+        block: str,
+        branches: Dict[str, str],
+        over_budget: int,
+        no_slot: int = 0,
+    ):
+        """登记一次交互块渲染后发起的各分支预取"""
+        self._branches_over_budget += over_budget
+        self._branches_no_slot += no_slot
+        if not branches:
+            return
+        self._groups[(session, block)] = branches
+        self._groups.move_to_end((session, block))
+        if len(self._groups) > self.max_blocks:
+            self._groups.popitem(last=False)
+        self._groups_started += 1
+        self._branches_started += len(branches)
+
+    def promote(
+        self, session: str, block: str, value: Optional[str], buffer: PrefetchBuffer
+    ) -> bool:
+        """
+        用户的选择到达：保留对应分支，丢弃其余分支
+
+        Returns:
+            是否有与选择对应的分支
+        """
+        branches = self._groups.pop((session, block), None)
+        if branches is None:
+            return False
+        matched = value is not None and value in branches
+        if matched:
+            self._promotions += 1
+        else:
+            self._unmatched_choices += 1
+        for branch_value, key in branches.items():
+            if branch_value != value and buffer.drop(session, key):
+                self._branches_dropped += 1
+        return matched
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取分支预取统计"""
+        decided = self._promotions + self._unmatched_choices
+        return {
+            "enabled": self.enabled,
+            "top_k": self.top_k,
+            "token_budget": self.token_budget,
+            "interactions_prefetched": self._groups_started,
+            "branches_started": self._branches_started,
+            "branches_over_budget": self._branches_over_budget,
+            "branches_no_slot": self._branches_no_slot,
+            "promotions": self._promotions,
+            "unmatched_choices": self._unmatched_choices,
+            "promotion_rate": round(self._promotions / decided, 4) if decided else 0.0,
+            "branches_dropped": self._branches_dropped,
+        }
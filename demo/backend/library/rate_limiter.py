@@ -0,0 +1,296 @@
+"""
+LLM 上游限流感知的准入调度
+
+按模型维护请求数（RPM）与 token 数（TPM）两个令牌桶。限额来自配置，
+或由上游响应头 x-ratelimit-* 学习得到；收到 429 时按 Retry-After 暂停该模型。
+
+每次调用先预订令牌：桶内余量不足时按补充速率算出可以发出的时刻并等待，
+预订按到达顺序排队，请求被均匀地摊开而不是集中突发。预计等待超过上限时直接拒绝，
+调用结束后按实际用量修正 token 预订。
+"""
+
+import asyncio
+import re
+import threading
+import time
+from typing import Any, Dict, Mapping, Optional
+
+from backend.config.settings import settings
+from backend.utils.logger import logger
+
+# 上游重置时长格式，如 "1s"、"6m0s"、"20ms"、"1h2m3.5s"
+_DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+
+
+class RateLimitQueueTimeout(Exception):
+    """预计排队时间超过上限，调用未被放行"""
+
+
+def _parse_duration(value: Optional[str]) -> Optional[float]:
+    """解析上游返回的时长（秒）"""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = _DURATION_PATTERN.findall(value)
+    if not parts:
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def _parse_int(value: Optional[str]) -> Optional[int]:
+    """解析整数响应头"""
+    try:
+        return int(float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+class _TokenBucket:
+    """每分钟限额对应的令牌桶，余量可以为负（表示已被预订的未来额度）"""
+
+    def __init__(self, per_minute: int, burst_seconds: float):
+        self.level = 0.0
+        self.updated = time.monotonic()
+        self.configure(per_minute, burst_seconds)
+        self.level = self.capacity
+
+    def configure(self, per_minute: int, burst_seconds: float):
+        """更新限额"""
+        self.per_minute = per_minute
+        self.rate = per_minute / 60.0
+        # 桶容量只允许短时间的突发，更多的请求按速率均匀放行
+        self.capacity = max(1.0, self.rate * burst_seconds)
+        self.level = min(self.level, self.capacity)
+
+    def refill(self, now: float):
+        """按经过的时间补充令牌"""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_for(self, amount: float) -> float:
+        """预订 amount 个令牌需要等待的时长（秒）"""
+        return max(0.0, amount - self.level) / self.rate
+
+
+class _ModelLimits:
+    """单个模型的限流状态"""
+
+    def __init__(self):
+        self.requests: Optional[_TokenBucket] = None
+        self.tokens: Optional[_TokenBucket] = None
+        self.paused_until = 0.0
+        self.admitted = 0
+        self.delayed = 0
+        self.rejected = 0
+        self.rate_limited = 0
+        self.waiting = 0
+        self.max_waiting = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+
+
+class RateLimitScheduler:
+    """按模型的请求与 token 限额调度 LLM 调用"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        limits: Optional[Dict[str, Dict[str, int]]] = None,
+        max_wait_seconds: float = 10.0,
+        burst_seconds: float = 5.0,
+    ):
+        self.enabled = enabled
+        self.configured = limits or {}
+        self.max_wait_seconds = max_wait_seconds
+        self.burst_seconds = burst_seconds
+        self._models: Dict[str, _ModelLimits] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "RateLimitScheduler":
+        """根据全局配置创建调度器"""
+        return cls(
+            enabled=settings.llm_rate_limit_enabled,
+            limits=settings.llm_rate_limits,
+            max_wait_seconds=settings.llm_rate_limit_max_wait,
+            burst_seconds=settings.llm_rate_limit_burst_seconds,
+        )
+
+    def _limits(self, model: str) -> _ModelLimits:
+        """获取模型的限流状态，首次使用时按配置初始化（调用方持有锁）"""
+        state = self._models.get(model)
+        if state is None:
+            state = self._models[model] = _ModelLimits()
+            configured = self.configured.get(model, {})
+            if configured.get("rpm"):
+                state.requests = _TokenBucket(configured["rpm"], self.burst_seconds)
+            if configured.get("tpm"):
+                state.tokens = _TokenBucket(configured["tpm"], self.burst_seconds)
+        return state
+
+    def _reserve(self, model: str, tokens: int, max_wait: float) -> Optional[float]:
+        """
+        预订一次调用的额度
+
+        Returns:
+            需要等待的时长（秒）；超过 max_wait 时不预订并返回 None
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._limits(model)
+            wait = max(0.0, state.paused_until - now)
+            for bucket, amount in ((state.requests, 1), (state.tokens, tokens)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait_for(amount))
+            if wait > max_wait:
+                state.rejected += 1
+                return None
+            if state.requests is not None:
+                state.requests.level -= 1
+            if state.tokens is not None:
+                state.tokens.level -= tokens
+            state.admitted += 1
+            if wait > 0:
+                state.delayed += 1
+                state.wait_seconds += wait
+                state.max_wait_seconds = max(state.max_wait_seconds, wait)
+            return wait
+
+    def refund(self, model: str, tokens: int):
+        """退回未发出调用的预订"""
+        if not self.enabled:
+            return
+        with self._lock:
+            state = self._limits(model)
+            if state.requests is not None:
+                state.requests.level += 1
+            if state.tokens is not None:
+                state.tokens.level += tokens
+
+    async def acquire(self, model: str, tokens: int):
+        """
+        等待直到可以向该模型发起一次预计消耗 tokens 的调用
+
+        Raises:
+            RateLimitQueueTimeout: 预计等待超过配置的上限
+        """
+        if not self.enabled:
+            return
+        wait = self._reserve(model, tokens, self.max_wait_seconds)
+        if wait is None:
+            raise RateLimitQueueTimeout(
+                f"模型 {model} 已达到上游限额，预计排队超过 {self.max_wait_seconds}s"
+            )
+        if wait <= 0:
+            return
+
+        with self._lock:
+            state = self._limits(model)
+            state.waiting += 1
+            state.max_waiting = max(state.max_waiting, state.waiting)
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            # 调用方在排队期间取消，额度留给后续调用
+            self.refund(model, tokens)
+            raise
+        finally:
+            with self._lock:
+                self._limits(model).waiting -= 1
+
+    def try_acquire(self, model: str, tokens: int) -> bool:
+        """不等待地预订一次调用，额度不足时返回 False（用于对冲等可选请求）"""
+        if not self.enabled:
+            return True
+        return self._reserve(model, tokens, 0.0) is not None
+
+    def settle(self, model: str, reserved: int, actual: Optional[int]):
+        """按实际 token 用量修正预订"""
+        if not self.enabled or actual is None:
+            return
+        with self._lock:
+            state = self._limits(model)
+            if state.tokens is not None:
+                state.tokens.level += reserved - actual
+
+    def observe_headers(self, model: str, headers: Mapping[str, str]):
+        """
+        从上游响应头学习限额与剩余额度
+
+        读取 x-ratelimit-limit-{requests,tokens} 与 x-ratelimit-remaining-{requests,tokens}，
+        配置的限额更小时以配置为准；剩余额度低于本地估计时以上游为准。
+        """
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            state = self._limits(model)
+            for kind in ("requests", "tokens"):
+                limit = _parse_int(headers.get(f"x-ratelimit-limit-{kind}"))
+                remaining = _parse_int(headers.get(f"x-ratelimit-remaining-{kind}"))
+                if limit is None or limit <= 0:
+                    continue
+                configured = self.configured.get(model, {}).get(
+                    "rpm" if kind == "requests" else "tpm"
+                )
+                per_minute = min(limit, configured) if configured else limit
+                bucket = getattr(state, kind)
+                if bucket is None:
+                    bucket = _TokenBucket(per_minute, self.burst_seconds)
+                    setattr(state, kind, bucket)
+                elif bucket.per_minute != per_minute:
+                    bucket.configure(per_minute, self.burst_seconds)
+                bucket.refill(now)
+                if remaining is not None:
+                    bucket.level = min(bucket.level, float(remaining))
+
+    def on_rate_limited(self, model: str, headers: Mapping[str, str]):
+        """上游返回 429：按 Retry-After（或重置时长）暂停该模型的新调用"""
+        if not self.enabled:
+            return
+        self.observe_headers(model, headers)
+        pause = (
+            _parse_duration(headers.get("retry-after"))
+            or _parse_duration(headers.get("x-ratelimit-reset-requests"))
+            or _parse_duration(headers.get("x-ratelimit-reset-tokens"))
+            or 1.0
+        )
+        with self._lock:
+            state = self._limits(model)
+            state.rate_limited += 1
+            state.paused_until = max(state.paused_until, time.monotonic() + pause)
+        logger.warning(f"模型 {model} 触发上游限流，暂停 {pause:.1f}s")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取各模型的准入统计"""
+        now = time.monotonic()
+        with self._lock:
+            models = {}
+            for model, state in self._models.items():
+                models[model] = {
+                    "rpm": state.requests.per_minute if state.requests else None,
+                    "tpm": state.tokens.per_minute if state.tokens else None,
+                    "queue_depth": state.waiting,
+                    "max_queue_depth": state.max_waiting,
+                    "admitted": state.admitted,
+                    "delayed": state.delayed,
+                    "rejected": state.rejected,
+                    "rate_limited": state.rate_limited,
+                    "paused_ms": round(max(0.0, state.paused_until - now) * 1000, 1),
+                    "avg_wait_ms": (
+                        round(state.wait_seconds / state.delayed * 1000, 1)
+                        if state.delayed
+                        else 0.0
+                    ),
+                    "max_wait_ms": round(state.max_wait_seconds * 1000, 1),
+                }
+            return {
+                "enabled": self.enabled,
+                "max_wait_seconds": self.max_wait_seconds,
+                "models": models,
+            }
@@ -0,0 +1,174 @@
+"""
+LLM 响应缓存
+
+对确定性较高的非流式调用（低温度）按 (model, temperature, messages, tools) 的规范化哈希缓存结果，
+支持 TTL、LRU 淘汰、字节预算以及按模型和温度的启用规则。
+"""
+
+import copy
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+from backend.config.settings import settings
+
+# 缓存状态
+CACHE_HIT = "hit"
+CACHE_MISS = "miss"
+CACHE_BYPASS = "bypass"
+
+
+def make_cache_key(
+    model: Optional[str],
+    temperature: Optional[float],
+    messages: List[Dict[str, Any]],
+    tools: Optional[List[Dict[str, Any]]] = None,
+) -> str:
+    """计算请求的规范化哈希"""
+    canonical = json.dumps(
+        {
+            "model": model,
+            "temperature": temperature,
+            "messages": messages,
+            "tools": tools or None,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+@dataclass
+class _CacheEntry:
+    """缓存条目"""
+
+    value: Dict[str, Any]
+    size_bytes: int
+    expires_at: float
+
+
+class LLMResponseCache:
+    """LLM 非流式响应的 LRU 缓存"""
+
+    def __init__(
+        self,
+        enabled: bool = False,
+        ttl_seconds: float = 600,
+        max_entries: int = 1024,
+        max_bytes: int = 32 * 1024 * 1024,
+        max_temperature: float = 0.3,
+        models: Optional[List[str]] = None,
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_temperature = max_temperature
+        self.models = set(models or [])  # 为空表示所有模型
+        self._entries: "OrderedDict[str, _CacheEntry]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._bypasses = 0
+        self._evictions = 0
+        self._expirations = 0
+
+    @classmethod
+    def from_settings(cls) -> "LLMResponseCache":
+        """根据全局配置创建缓存"""
+        return cls(
+            enabled=settings.llm_response_cache_enabled,
+            ttl_seconds=settings.llm_response_cache_ttl,
+            max_entries=settings.llm_response_cache_max_entries,
+            max_bytes=settings.llm_response_cache_max_bytes,
+            max_temperature=settings.llm_response_cache_max_temperature,
+            models=settings.llm_response_cache_models,
+        )
+
+    def is_cacheable(self, model: Optional[str], temperature: Optional[float]) -> bool:
+        """判断该模型和温度下的调用是否允许缓存"""
+        if not self.enabled:
+            return False
+        if temperature is None or temperature > self.max_temperature:
+            return False
+        if self.models and model not in self.models:
+            return False
+        return True
+
+    def record_bypass(self):
+        """记录一次未走缓存的调用"""
+        with self._lock:
+            self._bypasses += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """查找缓存，返回结果副本，过期或不存在时返回 None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._misses += 1
+                return None
+            if entry.expires_at <= now:
+                del self._entries[key]
+                self._total_bytes -= entry.size_bytes
+                self._expirations += 1
+                self._misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self._hits += 1
+            value = entry.value
+        return copy.deepcopy(value)
+
+    def put(self, key: str, value: Dict[str, Any]):
+        """写入缓存并按 LRU 淘汰超出限制的条目"""
+        size_bytes = len(json.dumps(value, ensure_ascii=False).encode("utf-8"))
+        if size_bytes > self.max_bytes:
+            return
+
+        entry = _CacheEntry(
+            value=copy.deepcopy(value),
+            size_bytes=size_bytes,
+            expires_at=time.monotonic() + self.ttl_seconds,
+        )
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous.size_bytes
+            self._entries[key] = entry
+            self._total_bytes += size_bytes
+
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or self._total_bytes > self.max_bytes
+            ):
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= evicted.size_bytes
+                self._evictions += 1
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                "enabled": self.enabled,
+                "entries": len(self._entries),
+                "bytes": self._total_bytes,
+                "hits": self._hits,
+                "misses": self._misses,
+                "bypasses": self._bypasses,
+                "evictions": self._evictions,
+                "expirations": self._expirations,
+                "hit_rate": round(self._hits / lookups, 4) if lookups else 0.0,
+            }
@@ -0,0 +1,223 @@
+"""
+在途流式请求合并（single-flight）
+
+相同的在途请求共享一次上游 LLM 流式调用。调用产出的前 high_water 个增量保留为回放，
+晚加入的订阅者从头回放；产出超过高水位后回放随即释放，调用不再接受新订阅者。
+
+每个订阅者有自己的有界队列，未读增量达到高水位时背压上游：所有订阅者都读不动时
+上游读取挂起，等待其中一个腾出空间，并记录挂起时长；只有在其他订阅者仍能正常接收时，
+才让落后的订阅者脱离共享调用，避免一个慢客户端拖住其他客户端。
+每条流占用的内存只与高水位有关，与客户端读取速度无关。
+"""
+
+import asyncio
+import itertools
+import time
+from collections import deque
+from contextlib import aclosing
+from typing import Any, AsyncGenerator, AsyncIterator, Callable, Deque, Dict, List, Optional
+
+from .backpressure import BackpressureMeter
+
+# 加入他人发起的调用的订阅者结束时，以其收到的全部内容调用
+SharedCallback = Callable[[str], None]
+
+
+class _Subscriber:
+    """共享调用的一个订阅者"""
+
+    def __init__(self, replay: List[str], high_water: int):
+        self.pending: Deque[str] = deque(replay)
+        # 加入时回放的内容不计入上限
+        self.limit = len(replay) + high_water
+        self.dropped = False
+
+    @property
+    def full(self) -> bool:
+        """未读增量已达到上限"""
+        return len(self.pending) >= self.limit
+
+
+class _Flight:
+    """一次在途的上游流式调用"""
+
+    def __init__(self):
+        self.replay: Optional[List[str]] = []  # 已产出的增量，超过高水位后为 None
+        self.subscribers: Dict[int, _Subscriber] = {}
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+        self._changed = asyncio.Event()
+        self._space = asyncio.Event()
+        self._producer_waiting = False
+
+    @property
+    def joinable(self) -> bool:
+        """回放仍完整，新订阅者可以从头回放"""
+        return self.replay is not None and not self.done
+
+    def notify(self):
+        """唤醒所有等待新数据的订阅者"""
+        changed, self._changed = self._changed, asyncio.Event()
+        changed.set()
+
+    async def wait(self):
+        """等待下一次数据变化"""
+        await self._changed.wait()
+
+    def wake_producer(self):
+        """订阅者读取或离开后唤醒挂起的上游读取"""
+        if self._producer_waiting:
+            self._producer_waiting = False
+            self._space.set()
+
+    async def wait_for_space(self):
+        """等待订阅者读取"""
+        self._space.clear()
+        self._producer_waiting = True
+        await self._space.wait()
+
+    def detach_lagging(self) -> int:
+        """
+        其他订阅者仍有空间时，移除队列已满的订阅者
+
+        Returns:
+            移除的订阅者数；所有订阅者都已满时不移除，返回 0
+        """
+        lagging = [sid for sid, subscriber in self.subscribers.items() if subscriber.full]
+        if not lagging or len(lagging) == len(self.subscribers):
+            return 0
+        for subscriber_id in lagging:
+            self.subscribers.pop(subscriber_id).dropped = True
+        return len(lagging)
+
+    def publish(self, chunk: str, high_water: int):
+        """分发一个增量，调用方已确认每个订阅者都有空间"""
+        if self.replay is not None:
+            if len(self.replay) < high_water:
+                self.replay.append(chunk)
+            else:
+                self.replay = None
+        for subscriber in self.subscribers.values():
+            subscriber.pending.append(chunk)
+        self.notify()
+
+
+class SingleFlightStreams:
+    """按请求键合并相同的在途流式调用"""
+
+    def __init__(self, high_water: int = 64):
+        self.high_water = max(1, high_water)
+        self._flights: Dict[str, _Flight] = {}
+        self._subscriber_ids = itertools.count()
+        self._meter = BackpressureMeter(self.high_water)
+        self._flights_started = 0
+        self._subscribers_joined = 0
+        self._subscribers_dropped = 0
+        self._replay_overflows = 0
+        self._max_subscribers = 0
+
+    async def stream(
+        self,
+        key: str,
+        source_factory: Callable[[], AsyncIterator[str]],
+        on_shared: Optional[SharedCallback] = None,
+    ) -> AsyncGenerator[str, None]:
+        """
+        订阅 key 对应的流式调用，没有可加入的在途调用时通过 source_factory 发起
+
+        加入了在途调用时，结束（含失败和提前断开）后以收到的内容调用 on_shared，
+        供调用方记录共享的用量；发起方的用量由上游调用自行记录。
+
+        Yields:
+            str: 上游增量内容
+
+        Raises:
+            上游调用抛出的异常会原样传递给每个订阅者；
+            订阅者读取过慢、脱离共享调用时抛出 ValueError
+        """
+        flight = self._flights.get(key)
+        joined = flight is not None and flight.joinable
+        if not joined:
+            flight = _Flight()
+            self._flights[key] = flight
+            self._flights_started += 1
+            flight.task = asyncio.create_task(self._pump(key, flight, source_factory))
+        else:
+            self._subscribers_joined += 1
+
+        subscriber_id = next(self._subscriber_ids)
+        subscriber = _Subscriber(flight.replay, self.high_water)
+        flight.subscribers[subscriber_id] = subscriber
+        self._max_subscribers = max(self._max_subscribers, len(flight.subscribers))
+
+        received: List[str] = []
+        try:
+            while True:
+                if subscriber.pending:
+                    chunk = subscriber.pending.popleft()
+                    flight.wake_producer()
+                    received.append(chunk)
+                    yield chunk
+                    continue
+                if subscriber.dropped:
+                    raise ValueError("客户端读取过慢，已脱离共享的 LLM 流式调用")
+                if flight.done:
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+                await flight.wait()
+        finally:
+            flight.subscribers.pop(subscriber_id, None)
+            flight.wake_producer()
+            if not flight.subscribers and not flight.done and flight.task is not None:
+                # 所有订阅者都已离开，取消上游调用；先移出登记表，相同的新请求不会加入即将取消的调用
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+                flight.task.cancel()
+            if joined and on_shared is not None:
+                on_shared("".join(received))
+
+    async def _pump(
+        self,
+        key: str,
+        flight: _Flight,
+        source_factory: Callable[[], AsyncIterator[str]],
+    ):
+        """读取上游并分发给各订阅者的队列，所有订阅者都读不动时挂起"""
+        try:
+            async with aclosing(source_factory()) as source:
+                async for chunk in source:
+                    while True:
+                        self._subscribers_dropped += flight.detach_lagging()
+                        if not any(s.full for s in flight.subscribers.values()):
+                            break
+                        started = time.monotonic()
+                        await flight.wait_for_space()
+                        self._meter.record_wait(time.monotonic() - started)
+                    was_joinable = flight.replay is not None
+                    flight.publish(chunk, self.high_water)
+                    if was_joinable and flight.replay is None:
+                        self._replay_overflows += 1
+        except asyncio.CancelledError:
+            flight.error = ValueError("LLM 流式调用已取消")
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            flight.replay = None
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            flight.notify()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取合并与背压统计"""
+        return {
+            "in_flight": len(self._flights),
+            "flights_started": self._flights_started,
+            "subscribers_joined": self._subscribers_joined,
+            "max_subscribers": self._max_subscribers,
+            "subscribers_dropped": self._subscribers_dropped,
+            "replay_overflows": self._replay_overflows,
+            **self._meter.get_stats(),
+        }
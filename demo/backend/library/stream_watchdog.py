@@ -0,0 +1,180 @@
+"""
+流式输出停顿检测与续写
+
+上游在输出中途长时间没有新的数据块时判定为停顿：放弃当前请求，
+带上已输出的内容请求模型从中断处继续，并把续写拼接到同一条流中。
+续写开头与已输出内容重叠的部分会被去除，避免重复输出。
+"""
+
+import asyncio
+import threading
+from typing import Any, AsyncIterator, Dict, List
+
+from backend.config.settings import settings
+from backend.utils.tokens import estimate_tokens
+
+# 续写请求的提示
+_CONTINUE_PROMPT = (
+    "你上一条回复在中途被截断了。请从截断处直接继续输出剩余内容，"
+    "不要重复已经输出的文字，也不要添加任何说明。"
+)
+
+# 判定为重叠的最短长度（估算 token 数），避免把恰好相同的单个字或几个字母当作重复；
+# 按 token 计算使中文等每个字即一个 token 的文本与英文的判定尺度一致
+_MIN_SPLICE_OVERLAP_TOKENS = 2
+
+# 检查重叠时回看的已输出内容长度
+_SPLICE_WINDOW = 200
+
+
+class StreamStalledError(Exception):
+    """流式输出停顿且续写次数已用尽"""
+
+
+class ContinuationSplicer:
+    """
+    去除续写开头与已输出内容的重叠
+
+    续写开头先缓冲：仍可能是已输出内容的重复时继续等待，
+    能够判定后去掉重叠部分，之后的增量原样输出。
+    """
+
+    def __init__(self, emitted: str):
+        self._emitted = emitted
+        self._tail = emitted[-_SPLICE_WINDOW:]
+        self._buffer = ""
+        self._resolved = False
+        self.trimmed_chars = 0
+
+    def feed(self, delta: str) -> str:
+        """输入续写的增量，返回可以输出的文本"""
+        if self._resolved:
+            return delta
+        self._buffer += delta
+
+        # 模型从头重新输出：在越过已输出内容之前都丢弃
+        if self._emitted.startswith(self._buffer):
+            return ""
+        if self._buffer.startswith(self._emitted):
+            return self._resolve(len(self._emitted))
+
+        # 缓冲内容仍是已输出结尾的一部分，可能是重叠，继续等待
+        if self._buffer in self._tail:
+            return ""
+        return self._resolve(self._overlap())
+
+    def flush(self) -> str:
+        """续写结束时输出剩余缓冲"""
+        if self._resolved:
+            return ""
+        # 只有覆盖了全部已输出内容才能判定为从头重新输出；
+        # 更短的缓冲只是恰好与开头相同，按结尾重叠处理
+        if self._buffer.startswith(self._emitted):
+            return self._resolve(len(self._emitted))
+        return self._resolve(self._overlap())
+
+    def _overlap(self) -> int:
+        """已输出内容结尾与缓冲开头的最长重叠长度"""
+        longest = min(len(self._tail), len(self._buffer))
+        for length in range(longest, 0, -1):
+            candidate = self._buffer[:length]
+            if estimate_tokens(candidate) < _MIN_SPLICE_OVERLAP_TOKENS:
+                break
+            if self._tail.endswith(candidate):
+                return length
+        return 0
+
+    def _resolve(self, overlap: int) -> str:
+        """去掉重叠部分并结束缓冲"""
+        self._resolved = True
+        self.trimmed_chars = overlap
+        text, self._buffer = self._buffer[overlap:], ""
+        return text
+
+
+class StreamWatchdog:
+    """数据块间隔监控与停顿统计"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        stall_timeout: float = 15.0,
+        max_retries: int = 2,
+    ):
+        self.enabled = enabled
+        self.stall_timeout = stall_timeout
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._stalls = 0
+        self._recoveries = 0
+        self._failures = 0
+        self._recovery_seconds = 0.0
+        self._max_recovery_seconds = 0.0
+        self._trimmed_chars = 0
+
+    @classmethod
+    def from_settings(cls) -> "StreamWatchdog":
+        """根据全局配置创建监控"""
+        return cls(
+            enabled=settings.llm_stall_detection_enabled,
+            stall_timeout=settings.llm_stall_timeout,
+            max_retries=settings.llm_stall_max_retries,
+        )
+
+    async def next_chunk(self, iterator: AsyncIterator[Any]) -> Any:
+        """
+        读取下一个数据块，流结束时返回 None
+
+        Raises:
+            asyncio.TimeoutError: 超过停顿阈值仍未收到数据块
+        """
+        if not self.enabled:
+            return await anext(iterator, None)
+        async with asyncio.timeout(self.stall_timeout):
+            return await anext(iterator, None)
+
+    @staticmethod
+    def continuation_messages(
+        messages: List[Dict[str, Any]], emitted: str
+    ) -> List[Dict[str, Any]]:
+        """构造续写请求的消息列表"""
+        return messages + [
+            {"role": "assistant", "content": emitted},
+            {"role": "user", "content": _CONTINUE_PROMPT},
+        ]
+
+    def record_stall(self):
+        """记录一次停顿"""
+        with self._lock:
+            self._stalls += 1
+
+    def record_recovered(self, seconds: float, trimmed_chars: int):
+        """记录一次续写成功，seconds 为从判定停顿到续写输出首个文本的时长"""
+        with self._lock:
+            self._recoveries += 1
+            self._recovery_seconds += seconds
+            self._max_recovery_seconds = max(self._max_recovery_seconds, seconds)
+            self._trimmed_chars += trimmed_chars
+
+    def record_failed(self):
+        """记录一次续写失败（重试用尽或续写请求出错）"""
+        with self._lock:
+            self._failures += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取停顿统计"""
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "stall_timeout_seconds": self.stall_timeout,
+                "stalls": self._stalls,
+                "recoveries": self._recoveries,
+                "failures": self._failures,
+                "avg_recovery_ms": (
+                    round(self._recovery_seconds / self._recoveries * 1000, 1)
+                    if self._recoveries
+                    else 0.0
+                ),
+                "max_recovery_ms": round(self._max_recovery_seconds * 1000, 1),
+                "trimmed_overlap_chars": self._trimmed_chars,
+            }
@@ -0,0 +1,171 @@
+"""
+LLM token 用量统计
+
+每次 LLM 调用结束时记录一次用量（上游返回的 usage，缺失时按本地估算并标记），
+按模型、用户、会话、文档和文档块分别累计。每个维度的条目数有上限，
+超出时淘汰最久未更新的条目。
+
+合并的在途请求和预取回放只发起了一次上游调用，由发起方记录实际用量；
+其余订阅者收到的内容按本地估算另计为共享用量（shared_*），不计入 token 总数，
+各用户、会话仍能看到自己消耗的输出而上游用量不会重复累计。
+"""
+
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from backend.config.settings import settings
+
+DIMENSIONS = ("model", "user", "session", "document", "block")
+
+
+class _UsageTotals:
+    """一个统计对象的累计用量"""
+
+    __slots__ = (
+        "calls",
+        "stream_calls",
+        "estimated_calls",
+        "prompt_tokens",
+        "completion_tokens",
+        "shared_calls",
+        "shared_prompt_tokens",
+        "shared_completion_tokens",
+    )
+
+    def __init__(self):
+        self.calls = 0
+        self.stream_calls = 0
+        self.estimated_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.shared_calls = 0
+        self.shared_prompt_tokens = 0
+        self.shared_completion_tokens = 0
+
+    def add(self, prompt_tokens: int, completion_tokens: int, stream: bool, estimated: bool):
+        """累加一次调用"""
+        self.calls += 1
+        self.stream_calls += stream
+        self.estimated_calls += estimated
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+
+    def add_shared(self, prompt_tokens: int, completion_tokens: int):
+        """累加一次共享他人上游调用的用量"""
+        self.shared_calls += 1
+        self.shared_prompt_tokens += prompt_tokens
+        self.shared_completion_tokens += completion_tokens
+
+    def to_dict(self) -> Dict[str, int]:
+        """转换为字典"""
+        return {
+            "calls": self.calls,
+            "stream_calls": self.stream_calls,
+            "estimated_calls": self.estimated_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": self.prompt_tokens + self.completion_tokens,
+            "shared_calls": self.shared_calls,
+            "shared_prompt_tokens": self.shared_prompt_tokens,
+            "shared_completion_tokens": self.shared_completion_tokens,
+        }
+
+
+class UsageMeter:
+    """按多个维度累计 token 用量"""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max(1, max_keys)
+        self._totals = _UsageTotals()
+        self._dimensions: Dict[str, "OrderedDict[str, _UsageTotals]"] = {
+            dimension: OrderedDict() for dimension in DIMENSIONS
+        }
+        self._evictions = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_settings(cls) -> "UsageMeter":
+        """根据全局配置创建用量统计"""
+        return cls(max_keys=settings.usage_meter_max_keys)
+
+    def record(
+        self,
+        model: Optional[str],
+        prompt_tokens: int,
+        completion_tokens: int,
+        stream: bool,
+        estimated: bool,
+        user: Optional[str] = None,
+        session: Optional[str] = None,
+        document: Optional[str] = None,
+        block_index: Optional[int] = None,
+        shared: bool = False,
+    ):
+        """记录一次调用的用量，estimated 表示用量为本地估算，shared 表示共享他人的上游调用"""
+        keys = {
+            "model": model,
+            "user": user,
+            "session": session,
+            "document": document,
+            "block": (
+                f"{document}#{block_index}"
+                if document is not None and block_index is not None
+                else None
+            ),
+        }
+        with self._lock:
+            if shared:
+                self._totals.add_shared(prompt_tokens, completion_tokens)
+            else:
+                self._totals.add(prompt_tokens, completion_tokens, stream, estimated)
+            for dimension, key in keys.items():
+                if key is None:
+                    continue
+                entries = self._dimensions[dimension]
+                entry = entries.get(key)
+                if entry is None:
+                    entry = entries[key] = _UsageTotals()
+                    if len(entries) > self.max_keys:
+                        entries.popitem(last=False)
+                        self._evictions += 1
+                else:
+                    entries.move_to_end(key)
+                if shared:
+                    entry.add_shared(prompt_tokens, completion_tokens)
+                else:
+                    entry.add(prompt_tokens, completion_tokens, stream, estimated)
+
+    def query(
+        self, dimension: str, key: Optional[str] = None, limit: int = 20
+    ) -> List[Dict[str, Any]]:
+        """
+        查询某个维度的用量
+
+        Args:
+            dimension: model / user / session / document / block
+            key: 指定统计对象，为空时按总 token 数从高到低返回前 limit 个
+
+        Raises:
+            ValueError: 维度不存在
+        """
+        if dimension not in self._dimensions:
+            raise ValueError(f"不支持的统计维度: {dimension}，可选: {', '.join(DIMENSIONS)}")
+        with self._lock:
+            entries = self._dimensions[dimension]
+            if key is not None:
+                entry = entries.get(key)
+                return [{"key": key, **entry.to_dict()}] if entry is not None else []
+            items = [{"key": k, **v.to_dict()} for k, v in entries.items()]
+        items.sort(key=lambda item: item["total_tokens"], reverse=True)
+        return items[: max(0, limit)]
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取总用量与各模型用量"""
+        with self._lock:
+            return {
+                **self._totals.to_dict(),
+                "tracked_keys": {d: len(e) for d, e in self._dimensions.items()},
+                "evictions": self._evictions,
+                "models": {k: v.to_dict() for k, v in self._dimensions["model"].items()},
+            }
@@ -0,0 +1,280 @@
+"""
+自由文本交互输入的校验结论缓存
+
+同一交互块（如"你的公司名称"、"你的爱好"）收到的自由文本在不同学员之间高度重复，
+开启文本校验后每个回答都要一次 LLM 往返。这里按交互块缓存此前的校验结论：
+回答先归一化（全角半角、大小写、空白、标点），再用字符二元组相似度索引查找相近的回答，
+相似度达到阈值时直接复用结论。
+
+每个交互块的结论数有上限并按 LRU 淘汰；校验结论依赖的提示词、模型或输出语言变化时
+（指纹不同）立即清空该块的结论。块内容本身变化时对应不同的块标识，不会命中旧结论。
+已登记文档的 doc_id 是内容与提示词的哈希，修改后重新登记得到新的 doc_id 和指纹，
+因此不需要显式失效。
+"""
+
+import hashlib
+import threading
+import unicodedata
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, Generator, Iterable, Optional, Set
+
+from markdown_flow.llm import LLMResult
+
+from backend.config.settings import settings
+from backend.library.interaction_options import normalize_option_text
+
+
+def normalize_answer(text: str) -> str:
+    """归一化自由文本回答：在选项文本归一化的基础上把标点视为空白"""
+    text = unicodedata.normalize("NFKC", text)
+    text = "".join(
+        " " if unicodedata.category(char).startswith("P") else char for char in text
+    )
+    return normalize_option_text(text)
+
+
+def _bigrams(text: str) -> FrozenSet[str]:
+    """带首尾边界的字符二元组，单字回答也能得到两个二元组"""
+    padded = f"\x02{text}\x03"
+    return frozenset(padded[i : i + 2] for i in range(len(padded) - 1))
+
+
+def _fingerprint(parts: Iterable[Optional[str]]) -> str:
+    """校验结论依赖的参数指纹"""
+    digest = hashlib.sha256()
+    for part in parts:
+        encoded = ("\x00N" if part is None else f"\x00{len(part)}:{part}").encode("utf-8")
+        digest.update(encoded)
+    return digest.hexdigest()[:32]
+
+
+@dataclass(frozen=True)
+class ValidationKey:
+    """一次自由文本校验的缓存定位"""
+
+    block: str  # 交互块标识（变量替换后块内容的哈希）
+    fingerprint: str  # 提示词、模型、输出语言等的指纹
+    variable: str  # 目标变量
+    answer: str  # 原始回答（多个取值按 MarkdownFlow 的方式以逗号拼接）
+
+    @classmethod
+    def build(
+        cls,
+        block_content: str,
+        variable: str,
+        answer: str,
+        scope: Iterable[Optional[str]],
+    ) -> "ValidationKey":
+        """根据变量替换后的块内容、目标变量、回答和影响结论的参数构建"""
+        block = hashlib.sha256(block_content.encode("utf-8")).hexdigest()[:32]
+        return cls(block=block, fingerprint=_fingerprint(scope), variable=variable, answer=answer)
+
+
+@dataclass
+class _Verdict:
+    """一条校验结论"""
+
+    grams: FrozenSet[str]
+    content: str  # 校验失败时的提示，通过时为空
+    variables: Optional[Dict[str, Any]]  # 校验通过时提取的变量
+    passthrough: bool  # 提取的取值就是原始回答，近似命中时可以换成新回答
+    as_list: bool = False  # 取值是否为列表形式
+
+    @property
+    def valid(self) -> bool:
+        return not self.content
+
+
+@dataclass
+class _BlockVerdicts:
+    """单个交互块的结论及二元组倒排索引"""
+
+    fingerprint: str
+    entries: "OrderedDict[str, _Verdict]" = field(default_factory=OrderedDict)
+    index: Dict[str, Set[str]] = field(default_factory=dict)
+
+    def add(self, answer: str, verdict: _Verdict):
+        self.remove(answer)
+        self.entries[answer] = verdict
+        for gram in verdict.grams:
+            self.index.setdefault(gram, set()).add(answer)
+
+    def remove(self, answer: str):
+        verdict = self.entries.pop(answer, None)
+        if verdict is None:
+            return
+        for gram in verdict.grams:
+            answers = self.index.get(gram)
+            if answers is not None:
+                answers.discard(answer)
+                if not answers:
+                    del self.index[gram]
+
+    def nearest(self, grams: FrozenSet[str]):
+        """二元组 Dice 系数最高的已知回答，返回 (回答, 相似度)"""
+        shared: Dict[str, int] = {}
+        for gram in grams:
+            for answer in self.index.get(gram, ()):
+                shared[answer] = shared.get(answer, 0) + 1
+        best, best_score = None, 0.0
+        for answer, count in shared.items():
+            score = 2 * count / (len(grams) + len(self.entries[answer].grams))
+            if score > best_score:
+                best, best_score = answer, score
+        return best, best_score
+
+
+class ValidationCache:
+    """按交互块缓存自由文本的校验结论"""
+
+    def __init__(
+        self,
+        enabled: bool = True,
+        similarity_threshold: float = 0.85,
+        max_entries_per_block: int = 256,
+        max_blocks: int = 1024,
+    ):
+        self.enabled = enabled
+        self.similarity_threshold = similarity_threshold
+        self.max_entries_per_block = max(1, max_entries_per_block)
+        self.max_blocks = max(1, max_blocks)
+        self._blocks: "OrderedDict[str, _BlockVerdicts]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._lookups = 0
+        self._exact_hits = 0
+        self._approximate_hits = 0
+        self._stored = 0
+        self._evicted = 0
+        self._invalidations = 0
+
+    @classmethod
+    def from_settings(cls) -> "ValidationCache":
+        """根据全局配置创建缓存"""
+        return cls(
+            enabled=settings.validation_cache_enabled,
+            similarity_threshold=settings.validation_cache_similarity,
+            max_entries_per_block=settings.validation_cache_max_entries_per_block,
+            max_blocks=settings.validation_cache_max_blocks,
+        )
+
+    def _block(self, key: ValidationKey, create: bool) -> Optional[_BlockVerdicts]:
+        """取交互块的结论，指纹变化时清空（调用方持有锁）"""
+        block = self._blocks.get(key.block)
+        if block is not None and block.fingerprint != key.fingerprint:
+            del self._blocks[key.block]
+            self._invalidations += 1
+            block = None
+        if block is None:
+            if not create:
+                return None
+            block = _BlockVerdicts(fingerprint=key.fingerprint)
+            self._blocks[key.block] = block
+            while len(self._blocks) > self.max_blocks:
+                self._blocks.popitem(last=False)
+                self._evicted += 1
+        self._blocks.move_to_end(key.block)
+        return block
+
+    def lookup(self, key: ValidationKey) -> Optional[LLMResult]:
+        """
+        查找可复用的校验结论
+
+        Returns:
+            与 MarkdownFlow 校验结果格式相同的 LLMResult，没有足够相似的结论时为 None
+        """
+        if not self.enabled:
+            return None
+        answer = normalize_answer(key.answer)
+        if not answer:
+            return None
+        with self._lock:
+            self._lookups += 1
+            block = self._block(key, create=False)
+            if block is None:
+                return None
+            verdict = block.entries.get(answer)
+            if verdict is not None:
+                self._exact_hits += 1
+            else:
+                nearest, score = block.nearest(_bigrams(answer))
+                if nearest is None or score < self.similarity_threshold:
+                    return None
+                verdict = block.entries[nearest]
+                # LLM 从原回答中提取了取值时，提取结果不能套用到另一个回答上
+                if verdict.valid and not verdict.passthrough:
+                    return None
+                self._approximate_hits += 1
+                answer = nearest
+            block.entries.move_to_end(answer)
+
+        if not verdict.valid:
+            return LLMResult(content=verdict.content)
+        if verdict.passthrough:
+            # 与 MarkdownFlow 解析校验结果时一致，取值为去除首尾空白的原回答
+            value = key.answer.strip()
+            return LLMResult(
+                content="", variables={key.variable: [value] if verdict.as_list else value}
+            )
+        return LLMResult(content="", variables=dict(verdict.variables or {}))
+
+    def store(self, key: ValidationKey, result: LLMResult):
+        """记录 MarkdownFlow 返回的校验结论"""
+        if not self.enabled or not isinstance(result, LLMResult):
+            return
+        if not result.content and not result.variables:
+            return
+        answer = normalize_answer(key.answer)
+        if not answer:
+            return
+        variables = result.variables if not result.content else None
+        value = (variables or {}).get(key.variable)
+        as_list = isinstance(value, list)
+        verdict = _Verdict(
+            grams=_bigrams(answer),
+            content=result.content or "",
+            variables=dict(variables) if variables else None,
+            passthrough=(value == [key.answer.strip()] if as_list else value == key.answer.strip()),
+            as_list=as_list,
+        )
+        with self._lock:
+            block = self._block(key, create=True)
+            block.add(answer, verdict)
+            self._stored += 1
+            while len(block.entries) > self.max_entries_per_block:
+                oldest = next(iter(block.entries))
+                block.remove(oldest)
+                self._evicted += 1
+
+    def recording(self, key: ValidationKey, result):
+        """包装 MarkdownFlow 的校验结果，在结果产出时记录结论"""
+        if isinstance(result, LLMResult):
+            self.store(key, result)
+            return result
+
+        def record() -> Generator[LLMResult, None, None]:
+            for chunk in result:
+                self.store(key, chunk)
+                yield chunk
+
+        return record()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计"""
+        with self._lock:
+            hits = self._exact_hits + self._approximate_hits
+            return {
+                "enabled": self.enabled,
+                "similarity_threshold": self.similarity_threshold,
+                "max_entries_per_block": self.max_entries_per_block,
+                "blocks": len(self._blocks),
+                "entries": sum(len(block.entries) for block in self._blocks.values()),
+                "lookups": self._lookups,
+                "exact_hits": self._exact_hits,
+                "approximate_hits": self._approximate_hits,
+                "hit_rate": round(hits / self._lookups, 4) if self._lookups else 0.0,
+                "llm_calls_avoided": hits,
+                "stored": self._stored,
+                "evicted": self._evicted,
+                "invalidations": self._invalidations,
+            }
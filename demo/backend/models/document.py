@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel, Field
 
 class SaveDocumentRequest(BaseModel):
@@ -8,3 +10,15 @@ class SaveDocumentRequest(BaseModel):
 class SaveDocumentResponseData(BaseModel):
     """保存文档响应数据"""
     file_path: str = Field(..., description="保存的文件路径")
+
+class RegisterDocumentRequest(BaseModel):
+    """登记文档请求模型"""
+    content: str = Field(..., min_length=1, description="MarkdownFlow 内容")
+    document_prompt: Optional[str] = Field(None, description="文档级系统提示词")
+    interaction_prompt: Optional[str] = Field(None, description="交互块渲染提示词")
+    interaction_error_prompt: Optional[str] = Field(None, description="交互错误提示词")
+
+class RegisterDocumentResponseData(BaseModel):
+    """登记文档响应数据"""
+    doc_id: str = Field(..., description="文档ID（内容哈希）")
+    block_count: int = Field(..., description="文档块总数")
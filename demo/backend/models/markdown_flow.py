@@ -5,7 +5,7 @@ Markdown-Flow 相关的 Pydantic 模型
 from enum import Enum
 from typing import Dict, List, Literal, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 
 
 class InputType(str, Enum):
@@ -99,10 +99,23 @@ class VariableValidateResponse(BaseModel):
     required_variables: List[str]
 
 
-class PlaygroundRunRequest(BaseModel):
+class DocumentSourceMixin(BaseModel):
+    """文档来源：直接携带原文，或引用已登记的文档"""
+
+    content: Optional[str] = None  # markdownflow 原文，与 doc_id 二选一
+    doc_id: Optional[str] = None  # 已登记文档的ID，提供时使用登记的原文和提示词
+
+    @model_validator(mode="after")
+    def check_document_source(self):
+        """content 与 doc_id 至少提供一个"""
+        if self.content is None and not self.doc_id:
+            raise ValueError("content 和 doc_id 至少需要提供一个")
+        return self
+
+
+class PlaygroundRunRequest(DocumentSourceMixin):
     """Playground 统一预览请求模型"""
 
-    content: str  # markdownflow 原文
     block_index: int  # 现在要处理第几个块
     context: Optional[List[ChatMessage]] = None  # 上下文，要携带的上下文
     variables: Optional[Dict[str, str]] = None  # 变量映射，k-v结构用来替换变量
@@ -125,6 +138,27 @@ class PlaygroundRunRequest(BaseModel):
     )
 
 
+class PlaygroundDocumentRunRequest(DocumentSourceMixin):
+    """整篇文档并行运行请求模型"""
+
+    completed_blocks: Optional[List[int]] = None  # 客户端已展示过的块，不再重复生成或渲染
+    context: Optional[List[ChatMessage]] = None  # 上下文，所有块共用
+    variables: Optional[Dict[str, str]] = None  # 变量映射，k-v结构用来替换变量
+    user_input: Optional[Dict[str, List[str]]] = (
+        None  # 用户输入，交给产出对应变量的交互块校验
+    )
+    document_prompt: Optional[str] = None  # 设置 markdownflow 的文档系统提示词
+    interaction_prompt: Optional[str] = None  # 设置交互块渲染提示词
+    interaction_error_prompt: Optional[str] = None  # 设置交互错误提示词
+    model: Optional[str] = None  # LLM模型名称
+    temperature: Optional[float] = Field(
+        None,
+        ge=0.0,
+        le=2.0,
+        description="LLM温度参数，取值范围0.0-2.0，None表示使用系统默认值",
+    )
+
+
 class LLMGenerateRequest(BaseModel):
     """LLM 生成请求模型"""
 
@@ -144,6 +178,7 @@ class LLMGenerateResponse(BaseModel):
     model_used: str  # 实际使用的模型
     block_used: Block  # 使用的块内容
     variables_replaced: Dict[str, str]  # 替换的变量
+    cache_status: Optional[str] = None  # LLM 响应缓存状态：hit/miss/bypass，未调用 LLM 时为空
 
 
 class UserInput(BaseModel):
@@ -271,10 +306,9 @@ class SingleBlockRequest(BaseModel):
     index: int  # 区块索引
 
 
-class MarkdownFlowInfoRequest(BaseModel):
+class MarkdownFlowInfoRequest(DocumentSourceMixin):
     """Markdown-Flow 信息统计请求模型"""
 
-    content: str  # Markdown文档内容
     document_prompt: Optional[str] = None  # 文档系统提示词
     output_language: Optional[str] = Field(
         None,
@@ -1,11 +1,11 @@
 import json
 from typing import Any, Dict, List, Optional
 
-from backend.library.llmclient import LLMClient
+from backend.library.llmclient import get_shared_llm_client
 from backend.utils.logger import log
 
-# 创建全局 LLM 客户端实例
-_llm_client = LLMClient()
+# 使用进程内共享的 LLM 客户端，与 PlayGround 服务共用连接池
+_llm_client = get_shared_llm_client()
 
 
 async def cleanup_llm_client():
@@ -4,14 +4,60 @@
 简化为纯委托模式，所有复杂逻辑都由 MarkdownFlow 内部处理。
 """
 
-from typing import Dict, Generator, List, Optional
+import asyncio
+import time
+from contextlib import aclosing
+from typing import (
+    Any,
+    AsyncGenerator,
+    Callable,
+    Dict,
+    Generator,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+    Type,
+)
 
-from markdown_flow import MarkdownFlow, ProcessMode
+from markdown_flow import (
+    InteractionType,
+    MarkdownFlow,
+    ProcessMode,
+    extract_variables_from_text,
+    replace_variables_in_text,
+)
+from markdown_flow.enums import BlockType as MFBlockType
 from markdown_flow.llm import LLMResult
 
 from backend.config.settings import settings
-from backend.library.llm_provider import PlaygroundLLMProvider
-from backend.library.llmclient import LLMClient
+from backend.library.llm_provider import (
+    AsyncPlaygroundLLMProvider,
+    DeferredLLMCall,
+    PlaygroundLLMProvider,
+    get_llm_io_loop,
+    get_context_budget_stats,
+    get_stream_channel_stats,
+    shutdown_llm_io_loop,
+)
+from backend.library.document_cache import (
+    DocumentRegistry,
+    MarkdownFlowCache,
+    RegisteredDocument,
+    compute_document_hash,
+)
+from backend.library.delta_coalescer import DeltaCoalescer
+from backend.library.document_run import (
+    BlockDependencyGraph,
+    BlockNode,
+    DocumentRunStats,
+)
+from backend.library.llmclient import get_shared_llm_client
+from backend.library.interaction_fast_path import InteractionFastPath
+from backend.library.interaction_options import parse_interaction_options
+from backend.library.prefetch import BranchPrefetcher, PrefetchBuffer
+from backend.library.single_flight import SingleFlightStreams
+from backend.library.validation_cache import ValidationCache, ValidationKey
 from backend.models.markdown_flow import (
     Block,
     ChatMessage,
@@ -20,18 +66,123 @@ from backend.models.markdown_flow import (
     HistoryItem,
     HistoryResponse,
 )
-from backend.models.document import SaveDocumentResponseData
+from backend.models.document import (
+    RegisterDocumentResponseData,
+    SaveDocumentResponseData,
+)
+from backend.utils.logger import logger
+from backend.utils.sse import (
+    TEXT_END_FRAME,
+    encode_block_error_frame,
+    encode_content_frame,
+    encode_interaction_frame,
+    encode_run_end_frame,
+    tag_frame,
+)
+from backend.utils.tokens import estimate_message_tokens
 import os
 import re
 from datetime import datetime
 
-# 创建共享的 LLM 客户端实例，避免每次请求都创建新的客户端
-_shared_llm_client = LLMClient()
+# 使用进程内共享的 LLM 客户端，所有 LLM 调用共用连接池
+_shared_llm_client = get_shared_llm_client()
+
+# 解析后的 MarkdownFlow 文档缓存，同一文档的逐块请求无需重复解析
+_markdown_flow_cache = MarkdownFlowCache(
+    max_entries=settings.markdownflow_cache_max_entries,
+    max_bytes=settings.markdownflow_cache_max_bytes,
+)
+
+# 相同的在途流式生成请求共享一次上游调用
+_stream_flights = SingleFlightStreams(high_water=settings.llm_stream_high_water)
+
+# 合并细碎的流式增量，减少 SSE 帧数
+_delta_coalescer = DeltaCoalescer.from_settings()
+
+# 下一内容块的预测性预取，按会话暂存
+_prefetch_buffer = PrefetchBuffer.from_settings()
+_prefetch_tasks: set = set()
+
+# 交互块渲染后为热门选项预取的分支
+_branch_prefetcher = BranchPrefetcher.from_settings()
+
+# 交互块输入的本地快速校验
+_interaction_fast_path = InteractionFastPath.from_settings()
+
+# 自由文本交互输入的校验结论缓存
+_validation_cache = ValidationCache.from_settings()
+
+# 整篇文档并行运行统计
+_document_run_stats = DocumentRunStats.from_settings()
+
+# 服务端文档登记表，客户端登记后只需携带 doc_id
+_document_registry = DocumentRegistry(
+    max_documents=settings.document_registry_max_documents,
+    max_bytes=settings.document_registry_max_bytes,
+)
 
 
 async def cleanup_playground_llm_client():
     """清理 PlayGround 服务的共享 LLM 客户端"""
     await _shared_llm_client.aclose()
+    # 同步调用路径的客户端由 LLM I/O 循环驱动，需要在该循环上关闭
+    await asyncio.wrap_future(get_llm_io_loop().submit(_shared_llm_client.aclose()))
+    shutdown_llm_io_loop()
+
+
+async def _aiter_in_thread(iterator: Iterator) -> AsyncGenerator:
+    """在线程中逐个推进同步迭代器，避免阻塞事件循环"""
+    sentinel = object()
+    try:
+        while True:
+            item = await asyncio.to_thread(next, iterator, sentinel)
+            if item is sentinel:
+                break
+            yield item
+    finally:
+        # 提前退出时关闭同步生成器，释放其持有的上游流式调用
+        close = getattr(iterator, "close", None)
+        if close is not None:
+            try:
+                close()
+            except ValueError:
+                # 生成器仍在线程中执行，待其自行结束
+                pass
+
+
+async def _recording_shared(
+    chunks: AsyncGenerator[str, None], record: Callable[[str], None]
+) -> AsyncGenerator[str, None]:
+    """转发共享的流式输出，结束（含失败和提前断开）后以收到的内容调用 record"""
+    received: List[str] = []
+    try:
+        async with aclosing(chunks):
+            async for chunk in chunks:
+                received.append(chunk)
+                yield chunk
+    finally:
+        record("".join(received))
+
+
+def _usage_document_key(content: Optional[str], doc_id: Optional[str]) -> Optional[str]:
+    """token 用量统计中的文档标识：已登记文档用 doc_id，否则用内容哈希前缀"""
+    if doc_id:
+        return doc_id
+    if content:
+        return f"content:{compute_document_hash(content)[:16]}"
+    return None
+
+
+def _validation_scope(
+    doc_id: Optional[str],
+    document_prompt: Optional[str],
+    interaction_error_prompt: Optional[str],
+    model: Optional[str],
+    output_language: Optional[str],
+) -> Tuple[Optional[str], ...]:
+    """影响自由文本校验结论的参数；已登记文档的 doc_id 已包含其提示词"""
+    prompts = (doc_id,) if doc_id else (document_prompt, interaction_error_prompt)
+    return prompts + (model or settings.llm_model, output_language)
 
 
 class PlayGroundService:
@@ -73,9 +224,73 @@ class PlayGroundService:
             total=len(PlayGroundService._history_store)
         )
 
+    def _create_llm_provider(
+        self,
+        model: Optional[str] = None,
+        temperature: Optional[float] = None,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        trace_id: Optional[str] = None,
+        variables: Optional[Dict[str, str]] = None,
+        user_input: Optional[Dict[str, List[str]]] = None,
+        usage_document: Optional[str] = None,
+        block_index: Optional[int] = None,
+        provider_cls: Type[PlaygroundLLMProvider] = PlaygroundLLMProvider,
+    ) -> PlaygroundLLMProvider:
+        """创建绑定当前请求信息的 LLM 提供者"""
+        # 使用默认模型如果未指定
+        if model is None:
+            model = settings.llm_model
+
+        # 创建支持模型和温度参数的 LLM 提供者
+        effective_temperature = (
+            temperature if temperature is not None else settings.llm_temperature
+        )
+        llm_provider = provider_cls(
+            llm_client=self.llm_client, model=model, temperature=effective_temperature
+        )
+        llm_provider.set_session_id(session_id)
+        llm_provider.set_trace_id(trace_id)
+        llm_provider.set_user_id(user_id)
+        llm_provider.set_variables(variables)
+        llm_provider.set_user_input(user_input)
+        llm_provider.set_usage_scope(usage_document, block_index)
+        return llm_provider
+
+    def _create_markdown_flow(
+        self,
+        content: Optional[str],
+        llm_provider: PlaygroundLLMProvider,
+        document_prompt: Optional[str] = None,
+        interaction_prompt: Optional[str] = None,
+        interaction_error_prompt: Optional[str] = None,
+        output_language: Optional[str] = None,
+        doc_id: Optional[str] = None,
+    ) -> MarkdownFlow:
+        """创建 MarkdownFlow 实例，复用缓存的解析结果后挂载本次请求的 LLM 提供者"""
+        if doc_id:
+            # 已登记文档：直接使用常驻的解析结果和登记时的提示词
+            mf = self.get_document(doc_id).create_markdown_flow()
+        else:
+            mf = _markdown_flow_cache.get(
+                content,
+                document_prompt=document_prompt,
+                interaction_prompt=interaction_prompt,
+                interaction_error_prompt=interaction_error_prompt,
+            )
+        mf.set_llm_provider(llm_provider)
+        if settings.interaction_text_validation_enabled:
+            mf.set_text_validation_enabled(True)
+
+        # 设置输出语言（API层已固定为"Simplified Chinese"）
+        if output_language:
+            mf.set_output_language(output_language)
+
+        return mf
+
     def generate_with_llm(
         self,
-        content: str,
+        content: Optional[str],
         block_index: int,
         context: Optional[List[ChatMessage]] = None,
         variables: Optional[Dict[str, str]] = None,
@@ -89,6 +304,7 @@ class PlayGroundService:
         user_id: Optional[str] = None,
         trace_id: Optional[str] = None,
         output_language: Optional[str] = None,
+        doc_id: Optional[str] = None,
     ) -> Generator[Dict, None, None]:
         """
         使用 LLM 生成内容（流式）- 交给 MarkdownFlow
@@ -105,45 +321,54 @@ class PlayGroundService:
             model: 使用的模型名称
             temperature: 温度参数，如果未指定则使用配置默认值
             output_language: 输出语言 locale code（例如 'zh', 'en'）
+            doc_id: 已登记文档的ID，提供时忽略 content 和提示词参数
 
         Yields:
             Dict: 流式内容片段
         """
-        # 使用默认模型如果未指定
-        if model is None:
-            model = settings.llm_model
-
-        # 创建支持模型和温度参数的 LLM 提供者
-        effective_temperature = (
-            temperature if temperature is not None else settings.llm_temperature
-        )
-        llm_provider = PlaygroundLLMProvider(
-            llm_client=self.llm_client, model=model, temperature=effective_temperature
+        llm_provider = self._create_llm_provider(
+            model=model,
+            temperature=temperature,
+            session_id=session_id,
+            user_id=user_id,
+            trace_id=trace_id,
+            variables=variables,
+            user_input=user_input,
+            usage_document=_usage_document_key(content, doc_id),
+            block_index=block_index,
         )
-        llm_provider.set_session_id(session_id)
-        llm_provider.set_trace_id(trace_id)
-        llm_provider.set_user_id(user_id)
-        llm_provider.set_variables(variables)
-        llm_provider.set_user_input(user_input)
-
-        # 创建 MarkdownFlow 实例
-        mf = MarkdownFlow(
+        mf = self._create_markdown_flow(
             content,
-            llm_provider=llm_provider,
+            llm_provider,
             document_prompt=document_prompt,
             interaction_prompt=interaction_prompt,
             interaction_error_prompt=interaction_error_prompt,
+            output_language=output_language,
+            doc_id=doc_id,
         )
-        
+
         # 记录历史 (仅当不是单独处理某个块时记录，这里简单判断如果 block_index 为 0 则记录)
         # 或者更合理的逻辑是：每次有实质性内容生成时记录。
         # 这里简化处理：在开始处理时记录一次
         if block_index == 0:
-            self._add_history(content, mf.block_count)
+            self._add_history(mf.document, mf.block_count)
 
-        # 设置输出语言（API层已固定为"Simplified Chinese"）
-        if output_language:
-            mf.set_output_language(output_language)
+        # 获取当前块信息，用于确定 SSE 消息类型
+        current_block = mf.get_block(block_index)
+
+        # 点击按钮等无需 LLM 判断的输入和已有相似结论的自由文本在本地完成校验
+        local_result, validation_key = self._validate_input_locally(
+            mf,
+            current_block,
+            variables,
+            user_input,
+            _validation_scope(
+                doc_id, document_prompt, interaction_error_prompt, model, output_language
+            ),
+        )
+        if local_result is not None:
+            yield from self._iter_sse_results(iter([local_result]), current_block, user_input)
+            return
 
         # 转换上下文格式
         context_dict = self._convert_context_to_dict(context) if context else None
@@ -156,11 +381,59 @@ class PlayGroundService:
             variables=variables,
             user_input=user_input,
         )
+        if validation_key is not None:
+            result = _validation_cache.recording(validation_key, result)
 
-        generated_content = ""
+        yield from self._iter_sse_results(result, current_block, user_input)
 
-        # 获取当前块信息，用于确定 SSE 消息类型
-        current_block = mf.get_block(block_index)
+    def _validate_input_locally(
+        self,
+        mf: MarkdownFlow,
+        block,
+        variables: Optional[Dict[str, str]],
+        user_input: Optional[Dict[str, List[str]]],
+        scope: Tuple[Optional[str], ...] = (),
+    ) -> Tuple[Optional[LLMResult], Optional[ValidationKey]]:
+        """
+        交互块输入的本地校验
+
+        先做按钮的快速匹配，再为需要 LLM 校验的纯文本回答查找相似回答的校验结论。
+
+        Returns:
+            (本地校验结果, 校验结论缓存键)：本地结果为 None 时需要交给 MarkdownFlow 处理，
+            缓存键不为 None 时应记录 MarkdownFlow 返回的结论
+        """
+        if not user_input or block.block_type != MFBlockType.INTERACTION:
+            return None, None
+        text_validation = mf.is_text_validation_enabled()
+        result = _interaction_fast_path.validate(block, variables, user_input, text_validation)
+        if result is not None or not text_validation or not _validation_cache.enabled:
+            return result, None
+
+        options = parse_interaction_options(block.content, variables)
+        if options is None or options.interaction_type != InteractionType.TEXT_ONLY:
+            return None, None
+        # 与 MarkdownFlow 一致，目标变量取块变量列表的第一个，多个取值以逗号拼接后校验
+        target_variable = block.variables[0] if block.variables else "user_input"
+        values = user_input.get(target_variable) or []
+        if not values:
+            return None, None
+        key = ValidationKey.build(
+            replace_variables_in_text(block.content, dict(variables or {})),
+            target_variable,
+            ", ".join(values),
+            scope,
+        )
+        return _validation_cache.lookup(key), key
+
+    def _iter_sse_results(
+        self,
+        result,
+        current_block,
+        user_input: Optional[Dict[str, List[str]]] = None,
+    ) -> Generator[Dict, None, None]:
+        """将 MarkdownFlow 的处理结果转换为 SSE 消息序列"""
+        generated_content = ""
 
         # 处理结果
         if hasattr(result, "__iter__") and not isinstance(result, (str, bytes)):
@@ -178,8 +451,10 @@ class PlayGroundService:
                     current_block,
                     is_user_input_validation=is_user_input_validation,
                 )
-                # 只有当 sse_message 不为 None 时才发送
-                if sse_result.get("sse_message") is not None:
+                # 只有当 sse_frame 不为 None 时才发送；验证通过时虽不发送消息，仍需交出提取的变量
+                if sse_result.get("sse_frame") is not None or sse_result.get(
+                    "variables_extracted"
+                ):
                     yield sse_result
 
             # 发送完成标记，需要判断是否为用户输入验证阶段
@@ -197,8 +472,6 @@ class PlayGroundService:
                 generated_content = result.content
 
             # 检查是否是交互块（静态或动态转换的）
-            from markdown_flow.enums import BlockType as MFBlockType
-
             is_interaction_block = (
                 current_block
                 and hasattr(current_block, "block_type")
@@ -226,9 +499,9 @@ class PlayGroundService:
                             is_user_input_validation=True,
                         )
                     else:
-                        # 验证通过，直接发送结束标记
+                        # 验证通过，直接发送结束标记，并交出提取的变量
                         yield self._convert_to_sse_format(
-                            LLMResult(content=""),
+                            LLMResult(content="", variables=result.variables),
                             True,
                             current_block,
                             is_user_input_validation=True,
@@ -256,7 +529,7 @@ class PlayGroundService:
 
     def generate_with_llm_complete(
         self,
-        content: str,
+        content: Optional[str],
         block_index: int,
         context: Optional[List[ChatMessage]] = None,
         variables: Optional[Dict[str, str]] = None,
@@ -270,6 +543,7 @@ class PlayGroundService:
         user_id: Optional[str] = None,
         trace_id: Optional[str] = None,
         output_language: Optional[str] = None,
+        doc_id: Optional[str] = None,
     ) -> LLMGenerateResponse:
         """
         使用 LLM 生成内容 - 交给 MarkdownFlow
@@ -285,44 +559,577 @@ class PlayGroundService:
             interaction_error_prompt: 交互错误提示词
             model: 使用的模型名称
             output_language: 输出语言 locale code（例如 'zh', 'en'）
+            doc_id: 已登记文档的ID，提供时忽略 content 和提示词参数
 
         Returns:
             LLMGenerateResponse: 完整的生成结果
         """
-        # 使用默认模型如果未指定
-        if model is None:
-            model = settings.llm_model
+        llm_provider = self._create_llm_provider(
+            model=model,
+            temperature=temperature,
+            session_id=session_id,
+            user_id=user_id,
+            trace_id=trace_id,
+            variables=variables,
+            user_input=user_input,
+            usage_document=_usage_document_key(content, doc_id),
+            block_index=block_index,
+        )
+        mf = self._create_markdown_flow(
+            content,
+            llm_provider,
+            document_prompt=document_prompt,
+            interaction_prompt=interaction_prompt,
+            interaction_error_prompt=interaction_error_prompt,
+            output_language=output_language,
+            doc_id=doc_id,
+        )
 
-        # 创建支持模型和温度参数的 LLM 提供者
-        effective_temperature = (
-            temperature if temperature is not None else settings.llm_temperature
+        current_block = mf.get_block(block_index)
+        local_result, validation_key = self._validate_input_locally(
+            mf,
+            current_block,
+            variables,
+            user_input,
+            _validation_scope(
+                doc_id, document_prompt, interaction_error_prompt, model, output_language
+            ),
         )
-        llm_provider = PlaygroundLLMProvider(
-            llm_client=_shared_llm_client, model=model, temperature=effective_temperature
+        if local_result is not None:
+            return self._convert_to_generate_response(local_result, current_block)
+
+        # 转换上下文格式
+        context_dict = self._convert_context_to_dict(context) if context else None
+
+        # 调用统一处理方法
+        result = mf.process(
+            block_index=block_index,
+            mode=ProcessMode.COMPLETE,
+            context=context_dict,
+            variables=variables,
+            user_input=user_input,
         )
-        llm_provider.set_session_id(session_id)
-        llm_provider.set_trace_id(trace_id)
-        llm_provider.set_user_id(user_id)
-        llm_provider.set_variables(variables)
-        llm_provider.set_user_input(user_input)
+        if validation_key is not None:
+            result = _validation_cache.recording(validation_key, result)
 
-        # 创建 MarkdownFlow 实例
-        mf = MarkdownFlow(
+        # 转换为现有的响应格式
+        return self._convert_to_generate_response(
+            result, current_block, llm_provider.last_cache_status
+        )
+
+    async def agenerate_with_llm(
+        self,
+        content: Optional[str],
+        block_index: int,
+        context: Optional[List[ChatMessage]] = None,
+        variables: Optional[Dict[str, str]] = None,
+        user_input: Optional[Dict[str, List[str]]] = None,
+        document_prompt: Optional[str] = None,
+        interaction_prompt: Optional[str] = None,
+        interaction_error_prompt: Optional[str] = None,
+        model: str = None,
+        temperature: Optional[float] = None,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        trace_id: Optional[str] = None,
+        output_language: Optional[str] = None,
+        doc_id: Optional[str] = None,
+        prefetch_next: bool = False,
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        使用 LLM 生成内容（异步流式），参数与 generate_with_llm 相同
+
+        内容块直接在当前事件循环上 await LLMClient 的流式接口；
+        交互块的渲染和输入校验本身不是逐字输出，沿用同步流程并在线程中推进。
+        prefetch_next 为 True 且开启了预取时，内容块生成完毕后在后台预取后续内容块；
+        开启分支预取时，交互块渲染后为热门选项各预取一个分支，收到用户选择时保留对应分支。
+
+        Yields:
+            Dict: 流式内容片段
+        """
+        llm_provider = self._create_llm_provider(
+            model=model,
+            temperature=temperature,
+            session_id=session_id,
+            user_id=user_id,
+            trace_id=trace_id,
+            variables=variables,
+            user_input=user_input,
+            usage_document=_usage_document_key(content, doc_id),
+            block_index=block_index,
+            provider_cls=AsyncPlaygroundLLMProvider,
+        )
+        mf = self._create_markdown_flow(
             content,
-            llm_provider=llm_provider,
+            llm_provider,
             document_prompt=document_prompt,
             interaction_prompt=interaction_prompt,
             interaction_error_prompt=interaction_error_prompt,
+            output_language=output_language,
+            doc_id=doc_id,
         )
 
-        # 设置输出语言（API层已固定为"Simplified Chinese"）
-        if output_language:
-            mf.set_output_language(output_language)
+        # 记录历史，与 generate_with_llm 保持一致
+        if block_index == 0:
+            self._add_history(mf.document, mf.block_count)
 
         # 转换上下文格式
         context_dict = self._convert_context_to_dict(context) if context else None
 
-        # 调用统一处理方法
+        current_block = mf.get_block(block_index)
+
+        prefetch = prefetch_next and _prefetch_buffer.enabled and session_id is not None
+        # 预取使用与本次请求相同的文档、提示词、模型和用户信息
+        request_args = dict(
+            document_prompt=document_prompt,
+            interaction_prompt=interaction_prompt,
+            interaction_error_prompt=interaction_error_prompt,
+            model=model,
+            temperature=temperature,
+            session_id=session_id,
+            user_id=user_id,
+            trace_id=trace_id,
+            output_language=output_language,
+            doc_id=doc_id,
+        )
+
+        if current_block.block_type != MFBlockType.CONTENT:
+            is_interaction = current_block.block_type == MFBlockType.INTERACTION
+            branch_prefetch = prefetch and is_interaction and _branch_prefetcher.enabled
+            if branch_prefetch and user_input:
+                self._promote_branch(
+                    content, block_index, current_block, variables, user_input, session_id, doc_id
+                )
+
+            local_result, validation_key = self._validate_input_locally(
+                mf,
+                current_block,
+                variables,
+                user_input,
+                _validation_scope(
+                    doc_id, document_prompt, interaction_error_prompt, model, output_language
+                ),
+            )
+            if local_result is not None:
+                # 本地校验完成：无需切换到线程，直接交出结果
+                for sse_result in self._iter_sse_results(
+                    iter([local_result]), current_block, user_input
+                ):
+                    yield sse_result
+                return
+
+            def run_sync():
+                result = mf.process(
+                    block_index=block_index,
+                    mode=ProcessMode.STREAM,
+                    context=context_dict,
+                    variables=variables,
+                    user_input=user_input,
+                )
+                if validation_key is not None:
+                    result = _validation_cache.recording(validation_key, result)
+                yield from self._iter_sse_results(result, current_block, user_input)
+
+            async with aclosing(_aiter_in_thread(run_sync())) as sse_results:
+                async for sse_result in sse_results:
+                    yield sse_result
+
+            if branch_prefetch and not user_input:
+                self._spawn_prefetch(
+                    self._prefetch_branches(
+                        content, block_index, list(context_dict or []), variables, request_args
+                    )
+                )
+            return
+
+        # 内容块：MarkdownFlow 只构建消息，LLM 调用推迟到这里 await 执行
+        llm_provider.defer_calls = True
+        result = mf.process(
+            block_index=block_index,
+            mode=ProcessMode.STREAM,
+            context=context_dict,
+            variables=variables,
+            user_input=user_input,
+        )
+
+        is_user_input_validation = bool(user_input)
+        generated: List[str] = []
+        for chunk in result:
+            call = chunk.content
+            if isinstance(call, DeferredLLMCall):
+                async with aclosing(
+                    self._stream_deferred_call(llm_provider, call)
+                ) as deltas, aclosing(_delta_coalescer.coalesce(deltas)) as pieces:
+                    # 逐字输出的热路径：直接编码内容帧，不经过 LLMResult 和块类型判断
+                    async for piece in pieces:
+                        if prefetch:
+                            generated.append(piece)
+                        yield {
+                            "success": True,
+                            "sse_frame": encode_content_frame(piece),
+                            "variables_extracted": None,
+                        }
+            elif chunk.content:
+                yield self._convert_to_sse_format(
+                    chunk,
+                    False,
+                    current_block,
+                    is_user_input_validation=is_user_input_validation,
+                )
+
+        if prefetch:
+            # 客户端请求下一块时会把本块输出作为助手消息追加到上下文
+            predicted_context = list(context_dict or [])
+            output = "".join(generated)
+            if output.strip():
+                predicted_context.append({"role": "assistant", "content": output})
+            self._spawn_prefetch(
+                self._prefetch_following(
+                    content, block_index, predicted_context, variables, request_args
+                )
+            )
+
+        # 发送完成标记
+        yield self._convert_to_sse_format(
+            LLMResult(content=""),
+            True,
+            current_block,
+            is_user_input_validation=is_user_input_validation,
+        )
+
+    def _spawn_prefetch(self, coroutine):
+        """在后台运行预取，保留任务引用直到结束"""
+        task = asyncio.create_task(coroutine)
+        _prefetch_tasks.add(task)
+        task.add_done_callback(_prefetch_tasks.discard)
+
+    def _load_block_graph(
+        self, content: Optional[str], request_args: Dict
+    ) -> Tuple[List, BlockDependencyGraph]:
+        """解析文档的块列表与块依赖图"""
+        doc_id = request_args.get("doc_id")
+        # 已登记文档运行时使用登记时的提示词，忽略请求中的提示词
+        if doc_id:
+            document_prompt = self.get_document(doc_id).document_prompt
+        else:
+            document_prompt = request_args.get("document_prompt")
+        blocks = self._create_markdown_flow(
+            content,
+            self.llm_provider,
+            document_prompt=document_prompt,
+            interaction_prompt=request_args.get("interaction_prompt"),
+            interaction_error_prompt=request_args.get("interaction_error_prompt"),
+            doc_id=doc_id,
+        ).get_all_blocks()
+        graph = BlockDependencyGraph.from_blocks(
+            blocks,
+            extract_variables_from_text(document_prompt) if document_prompt else (),
+        )
+        return blocks, graph
+
+    def _start_block_prefetch(
+        self,
+        content: Optional[str],
+        block_index: int,
+        context: List[Dict[str, str]],
+        variables: Optional[Dict[str, str]],
+        request_args: Dict,
+        token_budget: Optional[int] = None,
+    ) -> Tuple[Optional[str], Optional[Any]]:
+        """
+        按预测的上下文和变量构建内容块的消息并发起预取，预取作为推测性调用按最低优先级调度
+
+        Args:
+            token_budget: 预估 token 数（输入 + 平均输出）上限，超出时不发起
+
+        Returns:
+            (请求键, 预取结果)，未发起时均为 None
+        """
+        llm_provider = self._create_llm_provider(
+            model=request_args.get("model"),
+            temperature=request_args.get("temperature"),
+            session_id=request_args.get("session_id"),
+            user_id=request_args.get("user_id"),
+            trace_id=request_args.get("trace_id"),
+            variables=variables,
+            usage_document=_usage_document_key(content, request_args.get("doc_id")),
+            block_index=block_index,
+            provider_cls=AsyncPlaygroundLLMProvider,
+        )
+        llm_provider.defer_calls = True
+        mf = self._create_markdown_flow(
+            content,
+            llm_provider,
+            document_prompt=request_args.get("document_prompt"),
+            interaction_prompt=request_args.get("interaction_prompt"),
+            interaction_error_prompt=request_args.get("interaction_error_prompt"),
+            output_language=request_args.get("output_language"),
+            doc_id=request_args.get("doc_id"),
+        )
+        result = mf.process(
+            block_index=block_index,
+            mode=ProcessMode.STREAM,
+            context=context or None,
+            variables=variables,
+        )
+        call = next(iter(result)).content
+        if not isinstance(call, DeferredLLMCall):
+            return None, None
+
+        prompt_tokens = estimate_message_tokens(call.messages)
+        if token_budget is not None and prompt_tokens + self._avg_completion_tokens() > token_budget:
+            return None, None
+        key = llm_provider.request_key(
+            call.messages, model=call.model, temperature=call.temperature
+        )
+        entry = _prefetch_buffer.prefetch(
+            request_args.get("session_id"),
+            key,
+            lambda: llm_provider.astream(
+                call.messages,
+                model=call.model,
+                temperature=call.temperature,
+                speculative=True,
+            ),
+            prompt_tokens=prompt_tokens,
+        )
+        return key, entry
+
+    def _avg_completion_tokens(self) -> int:
+        """近期调用的平均输出 token 数，用于估算预取成本"""
+        usage = self.llm_client.get_usage_stats()
+        return usage["completion_tokens"] // usage["calls"] if usage["calls"] else 0
+
+    async def _prefetch_following(
+        self,
+        content: Optional[str],
+        block_index: int,
+        context: List[Dict[str, str]],
+        variables: Optional[Dict[str, str]],
+        request_args: Dict,
+    ):
+        """
+        预取 block_index 之后的内容块
+
+        只预取紧接着的、变量已经齐备的内容块，遇到交互块或其他类型的块即停止；
+        预取多个块时，后一块的预测上下文包含前一块的预取输出。
+        """
+        try:
+            blocks, graph = self._load_block_graph(content, request_args)
+            known = set((variables or {}).keys())
+
+            next_index = block_index + 1
+            end = min(len(blocks), next_index + settings.prefetch_max_blocks)
+            for index in range(next_index, end):
+                node = graph.nodes[index]
+                if blocks[index].block_type != MFBlockType.CONTENT or graph.missing(node, known):
+                    return
+                _, entry = self._start_block_prefetch(
+                    content, index, context, variables, request_args
+                )
+                if entry is None or index + 1 >= end:
+                    return
+                output = await _prefetch_buffer.result(entry)
+                if output is None:
+                    return
+                if output.strip():
+                    context = context + [{"role": "assistant", "content": output}]
+        except Exception as e:
+            logger.warning(
+                f"预取后续内容块失败, session_id: {request_args.get('session_id')}, 错误: {e}"
+            )
+
+    async def _prefetch_branches(
+        self,
+        content: Optional[str],
+        block_index: int,
+        context: List[Dict[str, str]],
+        variables: Optional[Dict[str, str]],
+        request_args: Dict,
+    ):
+        """
+        交互块渲染后，为热门的按钮选项各预取一个分支
+
+        分支为假定用户选择该选项后的下一内容块：变量中加入该选项的取值，
+        上下文与渲染请求相同（选择通过校验后不产生输出）。
+        按历史选择次数取前 top_k 个选项，各分支预估 token 之和不超过预算；
+        分支作为推测性调用按最低优先级调度，分支数同时不超过调度器剩余的推测性槽位。
+        """
+        session_id = request_args.get("session_id")
+        try:
+            blocks, graph = self._load_block_graph(content, request_args)
+            next_index = block_index + 1
+            if next_index >= len(blocks) or blocks[next_index].block_type != MFBlockType.CONTENT:
+                return
+            options = parse_interaction_options(blocks[block_index].content, variables)
+            if options is None or not options.is_single_click:
+                return
+            known = set((variables or {}).keys()) | {options.variable}
+            if graph.missing(graph.nodes[next_index], known):
+                return
+
+            block_key = f"{_usage_document_key(content, request_args.get('doc_id'))}#{block_index}"
+            budget = _branch_prefetcher.token_budget
+            headroom = self.llm_client.scheduler.speculative_headroom()
+            branches: Dict[str, str] = {}
+            over_budget = 0
+            no_slot = 0
+            for value in _branch_prefetcher.rank(block_key, options.values):
+                if headroom is not None and len(branches) >= headroom:
+                    # 排不上槽位的分支只会在队列中等到超时
+                    no_slot += 1
+                    continue
+                branch_variables = {**(variables or {}), options.variable: value}
+                key, entry = self._start_block_prefetch(
+                    content,
+                    next_index,
+                    context,
+                    branch_variables,
+                    request_args,
+                    token_budget=budget,
+                )
+                if entry is None:
+                    over_budget += 1
+                    continue
+                branches[value] = key
+                budget -= entry.prompt_tokens + self._avg_completion_tokens()
+            _branch_prefetcher.register(session_id, block_key, branches, over_budget, no_slot)
+        except Exception as e:
+            logger.warning(f"预取交互块分支失败, session_id: {session_id}, 错误: {e}")
+
+    def _promote_branch(
+        self,
+        content: Optional[str],
+        block_index: int,
+        block,
+        variables: Optional[Dict[str, str]],
+        user_input: Dict[str, List[str]],
+        session_id: str,
+        doc_id: Optional[str],
+    ):
+        """交互块收到用户选择：记录选项热度，保留对应分支的预取并丢弃其余分支"""
+        options = parse_interaction_options(block.content, variables)
+        if options is None or not options.is_single_click:
+            return
+        values = user_input.get(options.variable) or []
+        value = values[0] if len(values) == 1 else None
+        block_key = f"{_usage_document_key(content, doc_id)}#{block_index}"
+        if value is not None:
+            _branch_prefetcher.record_choice(block_key, value)
+        _branch_prefetcher.promote(session_id, block_key, value, _prefetch_buffer)
+
+    def _stream_deferred_call(
+        self, llm_provider: AsyncPlaygroundLLMProvider, call: DeferredLLMCall
+    ) -> AsyncGenerator[str, None]:
+        """
+        执行被推迟的流式调用
+
+        同一会话中预取过完全相同的请求时直接回放预取结果；
+        相同文档、块、变量、上下文、模型和温度的请求会生成相同的消息，
+        这些在途请求合并为一次上游调用，再分发给各个订阅者。
+        回放预取结果和加入他人调用的请求以自己的用户、会话和文档块记录共享用量。
+        """
+
+        def source():
+            return llm_provider.astream(
+                call.messages, model=call.model, temperature=call.temperature
+            )
+
+        def record_shared(text: str):
+            llm_provider.record_shared_usage(call.messages, text, model=call.model)
+
+        if not settings.generate_coalescing_enabled and not _prefetch_buffer.enabled:
+            return source()
+
+        key = llm_provider.request_key(
+            call.messages, model=call.model, temperature=call.temperature
+        )
+        prefetched = _prefetch_buffer.take(llm_provider.session_id, key)
+        if prefetched is not None:
+            return _recording_shared(prefetched, record_shared)
+        if not settings.generate_coalescing_enabled:
+            return source()
+        return _stream_flights.stream(key, source, on_shared=record_shared)
+
+    async def agenerate_with_llm_complete(
+        self,
+        content: Optional[str],
+        block_index: int,
+        context: Optional[List[ChatMessage]] = None,
+        variables: Optional[Dict[str, str]] = None,
+        user_input: Optional[Dict[str, List[str]]] = None,
+        document_prompt: Optional[str] = None,
+        interaction_prompt: Optional[str] = None,
+        interaction_error_prompt: Optional[str] = None,
+        model: str = None,
+        temperature: Optional[float] = None,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        trace_id: Optional[str] = None,
+        output_language: Optional[str] = None,
+        doc_id: Optional[str] = None,
+    ) -> LLMGenerateResponse:
+        """
+        使用 LLM 生成内容（异步非流式），参数与 generate_with_llm_complete 相同
+
+        Returns:
+            LLMGenerateResponse: 完整的生成结果
+        """
+        llm_provider = self._create_llm_provider(
+            model=model,
+            temperature=temperature,
+            session_id=session_id,
+            user_id=user_id,
+            trace_id=trace_id,
+            variables=variables,
+            user_input=user_input,
+            usage_document=_usage_document_key(content, doc_id),
+            block_index=block_index,
+            provider_cls=AsyncPlaygroundLLMProvider,
+        )
+        mf = self._create_markdown_flow(
+            content,
+            llm_provider,
+            document_prompt=document_prompt,
+            interaction_prompt=interaction_prompt,
+            interaction_error_prompt=interaction_error_prompt,
+            output_language=output_language,
+            doc_id=doc_id,
+        )
+
+        # 转换上下文格式
+        context_dict = self._convert_context_to_dict(context) if context else None
+
+        current_block = mf.get_block(block_index)
+
+        if current_block.block_type != MFBlockType.CONTENT:
+            local_result, validation_key = self._validate_input_locally(
+                mf,
+                current_block,
+                variables,
+                user_input,
+                _validation_scope(
+                    doc_id, document_prompt, interaction_error_prompt, model, output_language
+                ),
+            )
+            if local_result is not None:
+                return self._convert_to_generate_response(local_result, current_block)
+            result = await asyncio.to_thread(
+                mf.process,
+                block_index=block_index,
+                mode=ProcessMode.COMPLETE,
+                context=context_dict,
+                variables=variables,
+                user_input=user_input,
+            )
+            if validation_key is not None:
+                result = _validation_cache.recording(validation_key, result)
+            return self._convert_to_generate_response(
+                result, current_block, llm_provider.last_cache_status
+            )
+
+        # 内容块：MarkdownFlow 只构建消息，LLM 调用推迟到这里 await 执行
+        llm_provider.defer_calls = True
         result = mf.process(
             block_index=block_index,
             mode=ProcessMode.COMPLETE,
@@ -330,15 +1137,280 @@ class PlayGroundService:
             variables=variables,
             user_input=user_input,
         )
+        call = result.content
+        if isinstance(call, DeferredLLMCall):
+            result.content = await llm_provider.acomplete(
+                call.messages, model=call.model, temperature=call.temperature
+            )
 
-        # 转换为现有的响应格式
-        return self._convert_to_generate_response(result, mf.get_block(block_index))
+        return self._convert_to_generate_response(
+            result, current_block, llm_provider.last_cache_status
+        )
 
-    def get_markdownflow_info(
+    async def arun_document(
+        self,
+        content: Optional[str],
+        completed_blocks: Optional[List[int]] = None,
+        context: Optional[List[ChatMessage]] = None,
+        variables: Optional[Dict[str, str]] = None,
+        user_input: Optional[Dict[str, List[str]]] = None,
+        document_prompt: Optional[str] = None,
+        interaction_prompt: Optional[str] = None,
+        interaction_error_prompt: Optional[str] = None,
+        model: str = None,
+        temperature: Optional[float] = None,
+        session_id: Optional[str] = None,
+        user_id: Optional[str] = None,
+        trace_id: Optional[str] = None,
+        output_language: Optional[str] = None,
+        doc_id: Optional[str] = None,
+    ) -> AsyncGenerator[Dict, None]:
+        """
+        整篇文档依赖感知并行运行（异步流式）
+
+        按各块引用的变量建立依赖图，输入已齐备的块以有限并发同时生成，
+        各块的 SSE 帧带上 block_index 交错输出。交互块渲染后等待用户回答，
+        依赖其变量的块留到下一次运行；user_input 交给产出对应变量的交互块校验，
+        校验通过后依赖这些变量的块在本次运行中接着生成。
+        同时生成的块看不到彼此的输出，共用请求携带的 context。
+
+        Args:
+            completed_blocks: 客户端已展示过的块，不再重复生成或渲染
+            其余参数与 agenerate_with_llm 相同
+
+        Yields:
+            Dict: 带块序号的 SSE 消息，最后一条为汇总本次运行的 run_end 消息
+        """
+        if doc_id:
+            # 已登记文档运行时使用登记时的提示词，依赖图也按它提取共享变量
+            document_prompt = self.get_document(doc_id).document_prompt
+        mf = self._create_markdown_flow(
+            content,
+            self.llm_provider,
+            document_prompt=document_prompt,
+            interaction_prompt=interaction_prompt,
+            interaction_error_prompt=interaction_error_prompt,
+            doc_id=doc_id,
+        )
+        graph = BlockDependencyGraph.from_blocks(
+            mf.get_all_blocks(),
+            extract_variables_from_text(document_prompt) if document_prompt else (),
+        )
+
+        completed = set(completed_blocks or [])
+        inputs = user_input or {}
+        available: Dict = dict(variables or {})
+        # 未展示过的块，以及收到了用户输入的交互块
+        waiting_nodes = [
+            node
+            for node in graph.nodes
+            if node.index not in completed
+            or (node.is_interaction and node.assigns in inputs)
+        ]
+
+        semaphore = asyncio.Semaphore(settings.document_run_max_concurrency)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=settings.llm_stream_queue_size)
+        tasks: Dict[int, asyncio.Task] = {}
+        running = 0
+
+        async def run_block(node: BlockNode, block_input: Optional[Dict[str, List[str]]]):
+            nonlocal running
+            async with semaphore:
+                running += 1
+                _document_run_stats.record_parallel(running)
+                started = time.monotonic()
+                extracted: Dict = {}
+                success = True
+                try:
+                    async with aclosing(
+                        self.agenerate_with_llm(
+                            content=content,
+                            block_index=node.index,
+                            context=context,
+                            variables=dict(available),
+                            user_input=block_input,
+                            document_prompt=document_prompt,
+                            interaction_prompt=interaction_prompt,
+                            interaction_error_prompt=interaction_error_prompt,
+                            model=model,
+                            temperature=temperature,
+                            session_id=session_id,
+                            user_id=user_id,
+                            trace_id=trace_id,
+                            output_language=output_language,
+                            doc_id=doc_id,
+                        )
+                    ) as results:
+                        async for result in results:
+                            if result.get("variables_extracted"):
+                                extracted.update(result["variables_extracted"])
+                            if result.get("sse_frame"):
+                                await queue.put(tag_frame(result["sse_frame"], node.index))
+                except Exception as e:
+                    success = False
+                    await queue.put(encode_block_error_frame(node.index, f"生成失败: {e}"))
+                finally:
+                    running -= 1
+                _document_run_stats.record_block(time.monotonic() - started, success)
+            await queue.put((node, success, extracted))
+
+        def schedule():
+            """启动输入已齐备的块"""
+            for node in list(waiting_nodes):
+                if graph.missing(node, available.keys()):
+                    continue
+                waiting_nodes.remove(node)
+                block_input = (
+                    {node.assigns: inputs[node.assigns]}
+                    if node.is_interaction and node.assigns in inputs
+                    else None
+                )
+                tasks[node.index] = asyncio.create_task(run_block(node, block_input))
+
+        started = time.monotonic()
+        generated, answered, awaiting_input, failed = [], [], [], []
+        accepted_variables: Dict = {}
+        schedule()
+        try:
+            while tasks:
+                item = await queue.get()
+                if isinstance(item, bytes):
+                    yield {"success": True, "sse_frame": item, "variables_extracted": None}
+                    continue
+
+                node, success, extracted = item
+                del tasks[node.index]
+                if not success:
+                    failed.append(node.index)
+                elif not node.is_interaction:
+                    generated.append(node.index)
+                elif node.assigns in inputs:
+                    accepted = bool(extracted.get(node.assigns))
+                    _document_run_stats.record_input(accepted)
+                    if accepted:
+                        # 回答被接受，解锁依赖该变量的块
+                        answered.append(node.index)
+                        available[node.assigns] = extracted[node.assigns]
+                        accepted_variables[node.assigns] = extracted[node.assigns]
+                        schedule()
+                    else:
+                        awaiting_input.append(node.index)
+                else:
+                    awaiting_input.append(node.index)
+        finally:
+            # 客户端断开或出错时取消仍在运行的块，释放上游调用
+            for task in tasks.values():
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks.values(), return_exceptions=True)
+
+        waiting = {
+            str(node.index): graph.missing(node, available.keys()) for node in waiting_nodes
+        }
+        _document_run_stats.record_run(time.monotonic() - started, len(waiting))
+        yield {
+            "success": True,
+            "sse_frame": encode_run_end_frame(
+                {
+                    "generated": sorted(generated),
+                    "answered": sorted(answered),
+                    "awaiting_input": sorted(awaiting_input),
+                    "waiting": waiting,
+                    "failed": sorted(failed),
+                    "variables": accepted_variables,
+                }
+            ),
+            "variables_extracted": accepted_variables or None,
+        }
+
+    def register_document(
         self,
         content: str,
         document_prompt: Optional[str] = None,
+        interaction_prompt: Optional[str] = None,
+        interaction_error_prompt: Optional[str] = None,
+    ) -> RegisterDocumentResponseData:
+        """
+        登记文档，解析结果常驻内存
+
+        Args:
+            content: Markdown 文档内容
+            document_prompt: 文档系统提示词
+            interaction_prompt: 交互提示词
+            interaction_error_prompt: 交互错误提示词
+
+        Returns:
+            RegisterDocumentResponseData: 文档ID（内容哈希）和块总数
+        """
+        document = _document_registry.register(
+            content,
+            document_prompt=document_prompt,
+            interaction_prompt=interaction_prompt,
+            interaction_error_prompt=interaction_error_prompt,
+        )
+        return RegisterDocumentResponseData(
+            doc_id=document.doc_id, block_count=document.block_count
+        )
+
+    def get_document(self, doc_id: str) -> RegisteredDocument:
+        """
+        获取已登记的文档
+
+        Raises:
+            ValueError: 文档不存在或已被淘汰
+        """
+        document = _document_registry.get(doc_id)
+        if document is None:
+            raise ValueError(f"文档不存在或已过期，请重新登记: {doc_id}")
+        return document
+
+    def query_token_usage(
+        self, dimension: str, key: Optional[str] = None, limit: int = 20
+    ) -> Dict:
+        """
+        按维度查询 token 用量
+
+        Raises:
+            ValueError: 维度不存在
+        """
+        return {
+            "dimension": dimension,
+            "items": self.llm_client.query_usage(dimension, key=key, limit=limit),
+        }
+
+    def get_runtime_stats(self) -> Dict:
+        """获取运行时统计信息"""
+        return {
+            "llm_streams": self.llm_client.get_stream_stats(),
+            "llm_connection_pool": self.llm_client.get_pool_stats(),
+            "llm_endpoints": self.llm_client.get_endpoint_stats(),
+            "llm_circuit_breakers": self.llm_client.get_circuit_stats(),
+            "llm_rate_limits": self.llm_client.get_rate_limit_stats(),
+            "llm_scheduler": self.llm_client.get_scheduler_stats(),
+            "llm_model_capabilities": self.llm_client.get_capability_stats(),
+            "llm_token_usage": self.llm_client.get_usage_stats(),
+            "llm_context_budget": get_context_budget_stats(),
+            "llm_hedging": self.llm_client.get_hedge_stats(),
+            "llm_stream_stalls": self.llm_client.get_stall_stats(),
+            "markdownflow_cache": _markdown_flow_cache.get_stats(),
+            "document_registry": _document_registry.get_stats(),
+            "llm_response_cache": self.llm_client.response_cache.get_stats(),
+            "stream_coalescing": _stream_flights.get_stats(),
+            "stream_channel_backpressure": get_stream_channel_stats(),
+            "sse_coalescing": _delta_coalescer.get_stats(),
+            "document_runs": _document_run_stats.get_stats(),
+            "prefetch": _prefetch_buffer.get_stats(),
+            "branch_prefetch": _branch_prefetcher.get_stats(),
+            "interaction_fast_path": _interaction_fast_path.get_stats(),
+            "validation_cache": _validation_cache.get_stats(),
+        }
+
+    def get_markdownflow_info(
+        self,
+        content: Optional[str],
+        document_prompt: Optional[str] = None,
         output_language: Optional[str] = None,
+        doc_id: Optional[str] = None,
     ) -> MarkdownFlowInfoResponse:
         """
         获取 Markdown-Flow 文档信息统计
@@ -347,17 +1419,18 @@ class PlayGroundService:
             content: Markdown 文档内容
             document_prompt: 文档系统提示词
             output_language: 输出语言 locale code（例如 'zh', 'en'）
+            doc_id: 已登记文档的ID，提供时忽略 content，未传 document_prompt 时使用登记的提示词
 
         Returns:
             MarkdownFlowInfoResponse: 文档统计信息
         """
+        if doc_id and document_prompt is None:
+            document_prompt = self.get_document(doc_id).document_prompt
 
         # 创建 MarkdownFlow 实例
-        mf = MarkdownFlow(content, llm_provider=self.llm_provider)
-
-        # 设置输出语言（API层已固定为"Simplified Chinese"）
-        if output_language:
-            mf.set_output_language(output_language)
+        mf = self._create_markdown_flow(
+            content, self.llm_provider, output_language=output_language, doc_id=doc_id
+        )
 
         # 获取所有块信息
         blocks = mf.get_all_blocks()
@@ -381,8 +1454,6 @@ class PlayGroundService:
 
         # 统计 document_prompt 变量
         if document_prompt:
-            from markdown_flow import extract_variables_from_text
-
             document_variables = extract_variables_from_text(document_prompt)
             all_variables.extend(document_variables)
 
@@ -483,34 +1554,21 @@ class PlayGroundService:
         current_block=None,
         is_user_input_validation: bool = False,
     ) -> Dict:
-        """转换为 SSE 格式"""
+        """
+        转换为 SSE 格式
+
+        sse_frame 为已编码好的 SSE 帧字节，路由层直接写出；为 None 时表示不发送消息。
+        """
         # 如果是结束标记，返回 text_end 类型
         if finished:
-            from backend.models.markdown_flow import (
-                SSEMessage,
-                SSEMessageType,
-                TextEndSSEData,
-            )
-
-            text_end_data = TextEndSSEData(mdflow="")
-            sse_message = SSEMessage(type=SSEMessageType.TEXT_END, data=text_end_data)
             return {
                 "success": True,
-                "sse_message": sse_message.model_dump(),
+                "sse_frame": TEXT_END_FRAME,
                 "variables_extracted": result.variables,
             }
 
         # 根据块类型确定消息类型
         if current_block and hasattr(current_block, "block_type"):
-            from markdown_flow.enums import BlockType as MFBlockType
-
-            from backend.models.markdown_flow import (
-                ContentSSEData,
-                InteractionSSEData,
-                SSEMessage,
-                SSEMessageType,
-            )
-
             # 检查是否是交互块（静态或动态转换的）
             is_interaction_block = (
                 current_block.block_type == MFBlockType.INTERACTION
@@ -526,15 +1584,12 @@ class PlayGroundService:
                     # 用户输入验证阶段：根据验证结果返回内容或空内容
                     if result.content and result.content.strip():
                         # 验证失败，返回错误消息
-                        content_data = ContentSSEData(mdflow=result.content)
-                        sse_message = SSEMessage(
-                            type=SSEMessageType.CONTENT, data=content_data
-                        )
+                        sse_frame = encode_content_frame(result.content)
                     else:
                         # 验证通过，不生成消息，让结束标记处理
                         return {
                             "success": True,
-                            "sse_message": None,  # 不生成消息
+                            "sse_frame": None,  # 不生成消息
                             "variables_extracted": result.variables,
                         }
                 else:
@@ -544,38 +1599,25 @@ class PlayGroundService:
                         if current_block.variables
                         else "user_input"
                     )
-                    interaction_data = InteractionSSEData(
-                        mdflow=(
-                            result.content if result.content else current_block.content
-                        ),
-                        variable=variable_name,
-                    )
-                    sse_message = SSEMessage(
-                        type=SSEMessageType.INTERACTION, data=interaction_data
+                    sse_frame = encode_interaction_frame(
+                        result.content if result.content else current_block.content,
+                        variable_name,
                     )
             else:
                 # 内容块：直接使用内容
-                content_data = ContentSSEData(mdflow=result.content)
-                sse_message = SSEMessage(type=SSEMessageType.CONTENT, data=content_data)
+                sse_frame = encode_content_frame(result.content)
         else:
             # 兜底：当无法确定块类型时，按内容处理
-            from backend.models.markdown_flow import (
-                ContentSSEData,
-                SSEMessage,
-                SSEMessageType,
-            )
-
-            content_data = ContentSSEData(mdflow=result.content)
-            sse_message = SSEMessage(type=SSEMessageType.CONTENT, data=content_data)
+            sse_frame = encode_content_frame(result.content)
 
         return {
             "success": True,
-            "sse_message": sse_message.model_dump(),
+            "sse_frame": sse_frame,
             "variables_extracted": result.variables,
         }
 
     def _convert_to_generate_response(
-        self, result, block: Block
+        self, result, block: Block, cache_status: Optional[str] = None
     ) -> LLMGenerateResponse:
         """转换为 LLMGenerateResponse 格式"""
         # 转换 Block 格式
@@ -590,7 +1632,8 @@ class PlayGroundService:
         return LLMGenerateResponse(
             content=result.content,
             prompt_used=result.prompt or block.content,
-            model_used=result.model or settings.llm_model,
+            model_used=getattr(result, "model", None) or settings.llm_model,
             block_used=api_block,
             variables_replaced=result.variables or {},
+            cache_status=cache_status,
         )
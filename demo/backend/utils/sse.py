@@ -0,0 +1,74 @@
+"""
+SSE 帧编码
+
+直接拼接预先编码好的帧前后缀生成字节，只对变化的文本做 JSON 转义，
+输出与 json.dumps(SSEMessage.model_dump(), ensure_ascii=False) 逐字节一致。
+"""
+
+import json
+from json.encoder import encode_basestring
+from typing import Any, Dict
+
+# 帧前后缀（与 json.dumps 默认分隔符一致）
+_CONTENT_PREFIX = b'data: {"type": "content", "data": {"mdflow": '
+_INTERACTION_PREFIX = b'data: {"type": "interaction", "data": {"mdflow": '
+_INTERACTION_VARIABLE = b', "variable": '
+_FRAME_SUFFIX = b"}}\n\n"
+_DATA_PREFIX = b"data: {"
+
+# 正常结束帧
+TEXT_END_FRAME = b'data: {"type": "text_end", "data": {"mdflow": ""}}\n\n'
+
+# 出错后的结束帧（紧凑格式，保持与既有错误输出一致）
+ERROR_TEXT_END_FRAME = b'data: {"type":"text_end","data":{"mdflow":""}}\n\n'
+
+
+def _encode_string(text: str) -> bytes:
+    """JSON 字符串转义（不转义非 ASCII 字符）"""
+    return encode_basestring(text).encode("utf-8")
+
+
+def encode_content_frame(mdflow: str) -> bytes:
+    """编码内容块消息"""
+    return _CONTENT_PREFIX + _encode_string(mdflow) + _FRAME_SUFFIX
+
+
+def encode_interaction_frame(mdflow: str, variable: str) -> bytes:
+    """编码交互块消息"""
+    return (
+        _INTERACTION_PREFIX
+        + _encode_string(mdflow)
+        + _INTERACTION_VARIABLE
+        + _encode_string(variable)
+        + _FRAME_SUFFIX
+    )
+
+
+def encode_error_frame(message: str) -> bytes:
+    """编码错误消息"""
+    return f"data: [ERROR] {message}\n\n".encode("utf-8")
+
+
+def tag_frame(frame: bytes, block_index: int) -> bytes:
+    """在已编码的消息帧中加入块序号，用于整篇文档运行时多路复用各块的输出"""
+    return (
+        _DATA_PREFIX
+        + f'"block_index": {block_index}, '.encode("ascii")
+        + frame[len(_DATA_PREFIX) :]
+    )
+
+
+def encode_block_error_frame(block_index: int, message: str) -> bytes:
+    """编码整篇文档运行中单个块的错误消息"""
+    return (
+        _DATA_PREFIX
+        + f'"block_index": {block_index}, "type": "error", "data": {{"mdflow": '.encode("ascii")
+        + _encode_string(message)
+        + _FRAME_SUFFIX
+    )
+
+
+def encode_run_end_frame(summary: Dict[str, Any]) -> bytes:
+    """编码整篇文档运行的结束消息"""
+    payload = json.dumps({"type": "run_end", "data": summary}, ensure_ascii=False)
+    return f"data: {payload}\n\n".encode("utf-8")
@@ -0,0 +1,34 @@
+"""
+本地 token 估算工具
+
+不依赖分词器，按字符类别粗略估算：中日韩字符约 1 token/字，其他字符约 4 字符/token。
+"""
+
+import re
+from typing import Dict, List
+
+# 中日韩字符（含全角标点），用正则统计比逐字符判断快数倍
+_CJK_PATTERN = re.compile(
+    "["
+    "\u3000-\u303f"  # CJK 标点
+    "\u3040-\u30ff"  # 日文假名
+    "\u3400-\u4dbf"  # CJK 扩展 A
+    "\u4e00-\u9fff"  # CJK 统一表意文字
+    "\uac00-\ud7af"  # 韩文音节
+    "\uff00-\uffef"  # 全角字符
+    "]"
+)
+
+
+def estimate_tokens(text: str) -> int:
+    """估算一段文本的 token 数"""
+    if not text:
+        return 0
+    cjk_count = len(_CJK_PATTERN.findall(text))
+    other_count = len(text) - cjk_count
+    return cjk_count + (other_count + 3) // 4
+
+
+def estimate_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """估算消息列表的 token 数，每条消息额外计入 4 个格式开销"""
+    return sum(estimate_tokens(msg.get("content") or "") + 4 for msg in messages)
@@ -0,0 +1,69 @@
+"""
+SSE 帧编码基准
+
+对比逐块构建 Pydantic 模型再 json.dumps 的旧写法与 backend.utils.sse 的直接编码，
+并随机校验两者输出逐字节一致。
+
+在 demo 目录下运行：python -m scripts.bench_sse
+"""
+
+import argparse
+import json
+import random
+import time
+
+from backend.models.markdown_flow import ContentSSEData, SSEMessage, SSEMessageType
+from backend.utils.sse import encode_content_frame
+
+# 计时用增量的取值：中英文混合文本
+_TEXT_ALPHABET = "abcdefgXYZ 0123456789，。学习变量函数的基础"
+
+# 校验用随机字符串的取值：另含引号、反斜杠、控制字符、U+2028 与 emoji
+_ALPHABET = "abcdefgXYZ 0123456789，。学习变量函数的基础\"\\\n\t\r\x00\x1f 😀/"
+
+
+def _pydantic_frame(delta: str) -> bytes:
+    """改动前的编码方式"""
+    message = SSEMessage(type=SSEMessageType.CONTENT, data=ContentSSEData(mdflow=delta))
+    return f"data: {json.dumps(message.model_dump(), ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def _deltas(count: int, rng: random.Random):
+    """模拟流式增量：长度 1-12 的中英文混合片段"""
+    return ["".join(rng.choices(_TEXT_ALPHABET, k=rng.randint(1, 12))) for _ in range(count)]
+
+
+def _per_frame_us(encode, deltas, rounds: int) -> float:
+    """多轮取最快一轮的单帧耗时（微秒）"""
+    best = float("inf")
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for delta in deltas:
+            encode(delta)
+        best = min(best, time.perf_counter() - start)
+    return best / len(deltas) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--deltas", type=int, default=12000, help="每轮编码的增量数")
+    parser.add_argument("--rounds", type=int, default=5, help="计时轮数")
+    parser.add_argument("--check", type=int, default=20000, help="逐字节校验的随机字符串数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    for _ in range(args.check):
+        text = "".join(rng.choices(_ALPHABET, k=rng.randint(0, 24)))
+        assert _pydantic_frame(text) == encode_content_frame(text), repr(text)
+    print(f"逐字节校验通过: {args.check} 个随机字符串")
+
+    deltas = _deltas(args.deltas, rng)
+    old = _per_frame_us(_pydantic_frame, deltas, args.rounds)
+    new = _per_frame_us(encode_content_frame, deltas, args.rounds)
+    print(f"Pydantic 模型 + json.dumps: {old:.2f} us/帧")
+    print(f"直接编码:                   {new:.2f} us/帧 ({old / new:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()